@@ -22,7 +22,9 @@ authorization URL otherwise.
 
 There are two basic use cases supported. The first is using Google OAuth as the
 primary form of authentication, which is the simpler approach recommended
-for applications without their own user system.
+for applications without their own user system. Users can then sign in to
+Django with their Google account through the authentication backend of
+:mod:`googleoauth2django.backends`.
 
 The second use case is adding Google OAuth credentials to an
 existing Django model containing a Django user field. Most of the
@@ -65,6 +67,10 @@ specify the path to the credentials file in JSON format
 
    GOOGLE_OAUTH2_CLIENT_SECRETS_JSON=/path/to/client-secret.json
 
+The file is read again when it is rewritten, so a rotated secret is picked
+up without a restart. Setting ``GOOGLE_OAUTH2_CLIENT_SECRETS_CACHE`` to the
+name of a cache in ``CACHES`` shares the parsed file between processes.
+
 Or, directly configure the client Id and client secret.
 
 
@@ -119,9 +125,7 @@ request.oauth
    @oauth_required
    def requires_default_scopes(request):
       email = request.oauth.credentials.id_token['email']
-      service = build(serviceName='calendar', version='v3',
-                    http=request.oauth.http,
-                   developerKey=API_KEY)
+      service = request.oauth.build_service('calendar', 'v3')
       events = service.events().list(calendarId='primary').execute()['items']
       return HttpResponse("email: {0} , calendar: {1}".format(
                            email,str(events)))
@@ -159,9 +163,7 @@ and specify additional scopes in the decorator arguments.
    @oauth_enabled(scopes=['https://www.googleapis.com/auth/drive'])
    def drive_required(request):
        if request.oauth.has_credentials():
-           service = build(serviceName='drive', version='v2',
-                http=request.oauth.http,
-                developerKey=API_KEY)
+           service = request.oauth.build_service('drive', 'v2')
            events = service.files().list().execute()['items']
            return HttpResponse(str(events))
        else:
@@ -203,7 +205,9 @@ To use, change ``settings.py``
    GOOGLE_OAUTH2_STORAGE_MODEL = {
        'model': 'path.to.model.MyModel',
        'user_property': 'user_id',
-       'credentials_property': 'credential'
+       'credentials_property': 'credential',
+       # Optional, see below.
+       'subject_property': 'google_sub',
     }
 
 Where ``path.to.model`` class is the fully qualified name of a
@@ -219,26 +223,46 @@ our model would look like
 
    from django.contrib.auth.models import User
    from googleoauth2django.models import CredentialsField
+   from googleoauth2django.models import GoogleSubjectField
 
    class MyModel(models.Model):
        #  ... other fields here ...
        user = models.OneToOneField(User)
        credential = CredentialsField()
+       google_sub = GoogleSubjectField()
+
+If ``subject_property`` names a
+:class:`googleoauth2django.models.GoogleSubjectField`, the callback stores the
+Google account id of the credentials in it, so that users can be looked up by
+Google account, for example by :mod:`googleoauth2django.bearer`.
+
+The verified email address and account id are available in views as
+``request.oauth.email`` and ``request.oauth.user_id``, without decoding the
+ID token on every request.
 """
 
 import importlib
+import time
+from urllib import parse
 
 import django.conf
 from django.core import exceptions
 from django.urls import reverse
-from requests_oauthlib import OAuth2Session
-from six.moves.urllib import parse
 
+from googleoauth2django import batch
+from googleoauth2django import discovery
+from googleoauth2django import metrics
+from googleoauth2django import scope_set
+from googleoauth2django import stats
 from googleoauth2django import storage
+from googleoauth2django import tenants
+from googleoauth2django import tokeninfo
 from googleoauth2django.helpers import clientsecrets
 from googleoauth2django.helpers import dictionary_storage
 
 
+default_app_config = 'googleoauth2django.apps.GoogleOAuth2HelperConfig'
+
 GOOGLE_OAUTH2_DEFAULT_SCOPES = ('email',)
 GOOGLE_OAUTH2_REQUEST_ATTRIBUTE = 'oauth'
 
@@ -249,11 +273,43 @@ GOOGLE_TOKEN_URI = 'https://oauth2.googleapis.com/token'
 GOOGLE_TOKEN_INFO_URI = 'https://oauth2.googleapis.com/tokeninfo'
 
 _CREDENTIALS_KEY = 'google_oauth2_credentials'
+_STORAGE_ATTRIBUTE = '_googleoauth2django_storage'
+_TENANT_ATTRIBUTE = '_googleoauth2django_tenant'
+_CLAIMS_KEY = 'google_oauth2_claims'
+# ID token claims kept in the session by store_identity.
+IDENTITY_CLAIMS = ('sub', 'email', 'hd')
+
+# Seconds between checks of the client secrets files for changes.
+SECRETS_CHECK_INTERVAL = 1
+
+_oauth2_settings = None
+_secrets_cache = None
+# Maps client secrets files to the time they were last checked.
+_secrets_checked_at = {}
+
+
+def _get_secrets_cache():
+    """Returns the process-wide cache of client secrets files.
+
+    The parsed files are shared with other processes through the Django
+    cache named by ``GOOGLE_OAUTH2_CLIENT_SECRETS_CACHE``, if it is set.
+    """
+    global _secrets_cache
+    cache = _secrets_cache
+    if cache is None:
+        alias = getattr(django.conf.settings,
+                        'GOOGLE_OAUTH2_CLIENT_SECRETS_CACHE', None)
+        shared = clientsecrets.DjangoCacheAdapter(alias) if alias else None
+        cache = _secrets_cache = clientsecrets.FileCache(shared)
+    return cache
 
 
 def _load_client_secrets(filename):
     """Loads client secrets from the given filename.
 
+    The file is read again only once it changes, see
+    :class:`googleoauth2django.helpers.clientsecrets.FileCache`.
+
     Args:
         filename: The name of the file containing the JSON secret key.
 
@@ -261,7 +317,8 @@ def _load_client_secrets(filename):
         A 2-tuple, the first item containing the client id, and the second
         item containing a client secret.
     """
-    client_type, client_info = clientsecrets.loadfile(filename)
+    client_type, client_info = clientsecrets.loadfile(
+        filename, cache=_get_secrets_cache())
 
     if client_type != clientsecrets.TYPE_WEB:
         raise ValueError(
@@ -291,6 +348,9 @@ def _get_oauth2_client_id_and_secret(settings_instance):
                                 "GOOGLE_OAUTH2_CLIENT_SECRET", None)
         if client_id is not None and client_secret is not None:
             return client_id, client_secret
+        elif getattr(settings_instance, 'GOOGLE_OAUTH2_TENANTS', None):
+            # Every host is served by a tenant's client.
+            return None, None
         else:
             raise exceptions.ImproperlyConfigured(
                 "Must specify either GOOGLE_OAUTH2_CLIENT_SECRETS_JSON, or "
@@ -335,70 +395,378 @@ class OAuth2Settings(object):
     Attributes:
       scopes: A list of OAuth2 scopes that the decorators and views will use
               as defaults.
+      scope_mask: The :mod:`googleoauth2django.scope_set` mask of
+                  ``scopes``.
       request_prefix: The name of the attribute that the decorators use to
                     attach the UserOAuth2 object to the Django request object.
       client_id: The OAuth2 Client ID.
       client_secret: The OAuth2 Client Secret.
+      client_config: The web client configuration used to build flows.
+      negative_cache: The ``GOOGLE_OAUTH2_NEGATIVE_CACHE`` configuration, see
+                      :mod:`googleoauth2django.storage`.
+      session_compress: Whether credentials stored in the session are
+                        compressed, set by ``GOOGLE_OAUTH2_SESSION_COMPRESS``.
+      discovery_cache_ttl: Seconds API discovery documents are cached for.
+      discovery_cache_dir: Directory API discovery documents are cached in,
+                           or None.
+      batch_max_size: The maximum number of calls sent in one batch request.
+      async_max_concurrency: The maximum number of concurrent requests of
+                             a user's ``UserOAuth2.async_http``, at most
+                             half the connection pool, or None for the
+                             default.
+      verify_scopes: Whether granted scopes are verified with Google, see
+                     :mod:`googleoauth2django.tokeninfo`.
+      bearer_audiences: The client IDs bearer tokens may have been issued
+                        to, see :mod:`googleoauth2django.bearer`. Defaults
+                        to the client IDs of the settings and of all the
+                        tenants.
+      storage_model_subject_property: The name of the storage model field
+                                      holding the Google account id, or None.
+      storage_model_tenant_property: The name of the storage model field
+                                     holding the ``storage_key`` of the
+                                     tenant of the credentials, or None, see
+                                     :mod:`googleoauth2django.tenants`.
+      storage_model_using: The database alias of the storage model, or None
+                           to use the database routers.
+      storage_model_read_your_writes: Seconds a user's credentials are read
+                                      from the primary database after they
+                                      are written, or None, see
+                                      :mod:`googleoauth2django.storage`.
+      login: Whether the callback logs users in with their Google account,
+             see :mod:`googleoauth2django.backends`.
+      shared_token_cache: The ``GOOGLE_OAUTH2_SHARED_TOKEN_CACHE``
+                          configuration, see
+                          :mod:`googleoauth2django.token_cache`.
+      broker: The ``GOOGLE_OAUTH2_BROKER`` configuration, see
+              :mod:`googleoauth2django.broker`.
+      default_tenant: The :class:`googleoauth2django.tenants.Tenant` of the
+                      client ID and secret, or None.
+      tenants: The :class:`googleoauth2django.tenants.TenantRegistry` of
+               ``GOOGLE_OAUTH2_TENANTS``, or None.
+      client_secrets_files: The client secrets file of the default client,
+                            if any, reloaded with the settings when it
+                            changes. The files of the tenants are checked
+                            by :func:`get_tenant`.
+
+    Settings are validated by the system checks in
+    :mod:`googleoauth2django.checks` when the project starts, rather than
+    every time this class is built.
     """
 
     def __init__(self, settings_instance):
         self.scopes = getattr(settings_instance, 'GOOGLE_OAUTH2_SCOPES',
                               GOOGLE_OAUTH2_DEFAULT_SCOPES)
+        self.scope_mask = scope_set.mask(self.scopes)
         self.request_prefix = getattr(settings_instance,
                                       'GOOGLE_OAUTH2_REQUEST_ATTRIBUTE',
                                       GOOGLE_OAUTH2_REQUEST_ATTRIBUTE)
         info = _get_oauth2_client_id_and_secret(settings_instance)
         self.client_id, self.client_secret = info
-
-        middleware_settings = getattr(
-            settings_instance, 'MIDDLEWARE', None)
-        if middleware_settings is None:
-            raise exceptions.ImproperlyConfigured(
-                'Django settings has neither MIDDLEWARE nor MIDDLEWARE_CLASSES'
-                'configured')
-
-        if ('django.contrib.sessions.middleware.SessionMiddleware' not in
-                middleware_settings):
-            raise exceptions.ImproperlyConfigured(
-                'The Google OAuth2 Helper requires session middleware to '
-                'be installed. Edit your MIDDLEWARE_CLASSES or MIDDLEWARE '
-                'setting to include \'django.contrib.sessions.middleware.'
-                'SessionMiddleware\'.')
+        self.client_config = {
+            'web': {
+                'client_id': self.client_id,
+                'client_secret': self.client_secret,
+                'auth_uri': GOOGLE_AUTH_URI,
+                'token_uri': GOOGLE_TOKEN_URI,
+            }
+        }
         (self.storage_model, self.storage_model_user_property,
          self.storage_model_credentials_property) = _get_storage_model()
+        storage_model_settings = getattr(
+            settings_instance, 'GOOGLE_OAUTH2_STORAGE_MODEL', None) or {}
+        self.storage_model_subject_property = storage_model_settings.get(
+            'subject_property')
+        self.storage_model_tenant_property = storage_model_settings.get(
+            'tenant_property')
+        self.storage_model_using = storage_model_settings.get('using')
+        self.storage_model_read_your_writes = storage_model_settings.get(
+            'read_your_writes')
+        self.negative_cache = getattr(settings_instance,
+                                      'GOOGLE_OAUTH2_NEGATIVE_CACHE', None)
+        self.session_compress = getattr(settings_instance,
+                                        'GOOGLE_OAUTH2_SESSION_COMPRESS',
+                                        False)
+        self.discovery_cache_ttl = getattr(
+            settings_instance, 'GOOGLE_OAUTH2_DISCOVERY_CACHE_TTL',
+            discovery.DEFAULT_TTL)
+        self.discovery_cache_dir = getattr(
+            settings_instance, 'GOOGLE_OAUTH2_DISCOVERY_CACHE_DIR', None)
+        self.batch_max_size = getattr(settings_instance,
+                                      'GOOGLE_OAUTH2_BATCH_MAX_SIZE',
+                                      batch.MAX_BATCH_SIZE)
+        self.async_max_concurrency = getattr(
+            settings_instance, 'GOOGLE_OAUTH2_ASYNC_MAX_CONCURRENCY', None)
+        self.verify_scopes = getattr(settings_instance,
+                                     'GOOGLE_OAUTH2_VERIFY_SCOPES', False)
+        self.login = getattr(settings_instance, 'GOOGLE_OAUTH2_LOGIN', False)
+        self.shared_token_cache = getattr(
+            settings_instance, 'GOOGLE_OAUTH2_SHARED_TOKEN_CACHE', None)
+        self.broker = getattr(settings_instance, 'GOOGLE_OAUTH2_BROKER', None)
+        self.default_tenant = None
+        if self.client_id is not None:
+            self.default_tenant = tenants.Tenant(
+                None, self.client_id, self.client_secret, self.scopes)
+        self.tenants = None
+        tenants_config = getattr(settings_instance, 'GOOGLE_OAUTH2_TENANTS',
+                                 None)
+        if tenants_config:
+            self.tenants = tenants.load(tenants_config, self.scopes,
+                                        self.default_tenant,
+                                        cache=_get_secrets_cache())
+        self.client_secrets_files = ()
+        secret_json = getattr(settings_instance,
+                              'GOOGLE_OAUTH2_CLIENT_SECRETS_JSON', None)
+        if secret_json is not None:
+            self.client_secrets_files += (secret_json,)
+        bearer_audiences = getattr(settings_instance,
+                                   'GOOGLE_OAUTH2_BEARER_AUDIENCES', None)
+        # Reloaded tenants add their client ID to the default audiences.
+        self._audiences_of_clients = bearer_audiences is None
+        if bearer_audiences is None:
+            bearer_audiences = [self.client_id] if self.client_id else []
+            for tenant in self.tenants or ():
+                if tenant.client_id not in bearer_audiences:
+                    bearer_audiences.append(tenant.client_id)
+        self.bearer_audiences = tuple(bearer_audiences)
+
+
+def _secrets_changed(filename):
+    """Returns True if a client secrets file changed since it was loaded,
+    checking it at most every ``SECRETS_CHECK_INTERVAL`` seconds."""
+    now = time.monotonic()
+    if now - _secrets_checked_at.get(filename, 0.0) < SECRETS_CHECK_INTERVAL:
+        return False
+    _secrets_checked_at[filename] = now
+    return _get_secrets_cache().changed(filename)
 
 
 def get_oauth2_settings():
-    return OAuth2Settings(django.conf.settings)
+    """Returns the process-wide :class:`OAuth2Settings`.
+
+    The settings, including any client secrets file, are loaded once per
+    process and reloaded when Django reports a changed setting, or when the
+    client secrets file of the default client is rewritten, for example when
+    the secret is rotated.
+    """
+    global _oauth2_settings
+    oauth2_settings = _oauth2_settings
+    if (oauth2_settings is not None and
+            any(_secrets_changed(filename)
+                for filename in oauth2_settings.client_secrets_files)):
+        oauth2_settings = None
+    if oauth2_settings is None:
+        with stats.phase(stats.PHASE_SETTINGS):
+            oauth2_settings = OAuth2Settings(django.conf.settings)
+        _oauth2_settings = oauth2_settings
+    return oauth2_settings
+
+
+def _reset_oauth2_settings(**kwargs):
+    """Drops the cached settings.
+
+    Connected to Django's ``setting_changed`` signal by the app config.
+    """
+    global _oauth2_settings, _secrets_cache
+    _oauth2_settings = None
+    _secrets_cache = None
+
+
+def get_tenant(request):
+    """Returns the tenant whose OAuth client serves ``request``, see
+    :mod:`googleoauth2django.tenants`.
+
+    Without ``GOOGLE_OAUTH2_TENANTS``, this is the client of the settings.
+    The tenant is looked up once per request, and loaded again when its
+    client secrets file was rewritten.
+
+    Raises:
+        googleoauth2django.tenants.UnknownTenant: No tenant serves the host
+                                                  of the request.
+    """
+    oauth2_settings = get_oauth2_settings()
+    if oauth2_settings.tenants is None:
+        return oauth2_settings.default_tenant
+    tenant = getattr(request, _TENANT_ATTRIBUTE, None)
+    if tenant is None:
+        tenant = oauth2_settings.tenants.for_host(request.get_host())
+        if (tenant.name is not None and
+                tenant.client_secrets_json is not None and
+                _secrets_changed(tenant.client_secrets_json)):
+            tenant = _reload_tenant(oauth2_settings, tenant)
+        setattr(request, _TENANT_ATTRIBUTE, tenant)
+    return tenant
+
+
+def _reload_tenant(oauth2_settings, tenant):
+    """Loads a tenant whose client secrets file changed again, in place of
+    the old one."""
+    reloaded = oauth2_settings.tenants.reload(tenant,
+                                              cache=_get_secrets_cache())
+    if (oauth2_settings._audiences_of_clients and
+            reloaded.client_id not in oauth2_settings.bearer_audiences):
+        oauth2_settings.bearer_audiences += (reloaded.client_id,)
+    return reloaded
 
 
 def get_storage(request):
     """ Gets a Credentials storage object provided by the Django OAuth2 Helper
     object.
 
+    The storage is reused for the rest of the request, so that it can tell
+    when credentials written back are unchanged from the ones it loaded. A
+    new storage is built if ``request.user`` has changed, for example after
+    a login.
+
     Args:
         request: Reference to the current request object.
 
     Returns:
        An :class:`oauth2.client.Storage` object.
     """
+    user = getattr(request, 'user', None)
+    cached = getattr(request, _STORAGE_ATTRIBUTE, None)
+    if cached is not None and cached[0] is user:
+        return cached[1]
+    django_storage = _make_storage(request)
+    setattr(request, _STORAGE_ATTRIBUTE, (user, django_storage))
+    return django_storage
+
+
+def get_storage_model_class():
+    """Returns the model class configured by ``GOOGLE_OAUTH2_STORAGE_MODEL``,
+    or None if credentials are stored in the session."""
+    storage_model = get_oauth2_settings().storage_model
+    if not storage_model:
+        return None
+    module_name, class_name = storage_model.rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def _tenant_storage_key(request):
+    """Returns the ``storage_key`` of the request's tenant, or None without
+    tenants or for the default client."""
+    if get_oauth2_settings().tenants is None:
+        return None
+    return get_tenant(request).storage_key
+
+
+def _session_key(request):
+    """Returns the session key of the credentials of the request's
+    tenant."""
+    storage_key = _tenant_storage_key(request)
+    if storage_key is None:
+        return _CREDENTIALS_KEY
+    return '{0}:{1}'.format(_CREDENTIALS_KEY, storage_key)
+
+
+def _storage_model_keys(request):
+    """Returns the fields identifying the storage model entity of the
+    request's tenant, besides its user."""
+    oauth2_settings = get_oauth2_settings()
+    if oauth2_settings.tenants is None:
+        return {}
+    tenant_property = oauth2_settings.storage_model_tenant_property
+    if tenant_property is None:
+        return {}
+    return {tenant_property: _tenant_storage_key(request)}
+
+
+def broker_key(user_pk, storage_key=None):
+    """Returns the key of a user's credentials for the token broker.
+
+    Args:
+        user_pk: The primary key of the user.
+        storage_key: The ``storage_key`` of the tenant, or None.
+
+    Returns:
+        The primary key as a string, prefixed by the storage key and a colon
+        when there are tenants.
+    """
+    if get_oauth2_settings().tenants is None:
+        return str(user_pk)
+    return '{0}:{1}'.format(storage_key or '', user_pk)
+
+
+def parse_broker_key(key):
+    """Returns the user primary key and the tenant ``storage_key``, or None,
+    of a key of :func:`broker_key`."""
+    if get_oauth2_settings().tenants is None:
+        return key, None
+    storage_key, _, user_pk = key.partition(':')
+    return user_pk, storage_key or None
+
+
+def _make_storage(request):
+    """Builds the storage configured in the settings for ``request``."""
     oauth2_settings = get_oauth2_settings()
     storage_model = oauth2_settings.storage_model
     user_property = oauth2_settings.storage_model_user_property
     credentials_property = oauth2_settings.storage_model_credentials_property
 
     if storage_model:
-        module_name, class_name = storage_model.rsplit('.', 1)
-        module = importlib.import_module(module_name)
-        storage_model_class = getattr(module, class_name)
-        return storage.DjangoORMStorage(storage_model_class,
-                                        user_property,
-                                        request.user,
-                                        credentials_property)
+        storage_model_class = get_storage_model_class()
+        extra_keys = _storage_model_keys(request)
+        negative_cache = storage.make_negative_cache(
+            oauth2_settings.negative_cache, request, storage_model_class,
+            user_property, request.user, extra_keys)
+        write_pin = None
+        read_your_writes = oauth2_settings.storage_model_read_your_writes
+        if read_your_writes:
+            write_pin = storage.SessionWritePin(request.session,
+                                                read_your_writes)
+        django_storage = storage.DjangoORMStorage(
+            storage_model_class, user_property, request.user,
+            credentials_property, negative_cache=negative_cache,
+            using=oauth2_settings.storage_model_using, write_pin=write_pin,
+            extra_keys=extra_keys)
+        if oauth2_settings.broker:
+            # Imported on first use, only the workers of a host with a
+            # broker need it.
+            from googleoauth2django import broker
+            client = broker.get_client(
+                oauth2_settings.broker['socket'],
+                oauth2_settings.broker.get('timeout',
+                                           broker.DEFAULT_TIMEOUT))
+            django_storage = broker.BrokerStorage(
+                django_storage, client,
+                broker_key(request.user.pk, _tenant_storage_key(request)),
+                get_tenant(request).client_id)
     else:
         # use session
-        return dictionary_storage.DictionaryStorage(
-            request.session, key=_CREDENTIALS_KEY)
+        django_storage = dictionary_storage.DictionaryStorage(
+            request.session, key=_session_key(request),
+            compress=oauth2_settings.session_compress)
+
+    if oauth2_settings.shared_token_cache:
+        return _make_shared_token_storage(request, django_storage)
+    return django_storage
+
+
+def _make_shared_token_storage(request, django_storage):
+    """Puts the shared token cache in front of ``django_storage``, see
+    :mod:`googleoauth2django.token_cache`."""
+    # Imported on first use, mmap and fcntl are only needed when the cache
+    # is configured.
+    from googleoauth2django import token_cache
+
+    oauth2_settings = get_oauth2_settings()
+    if oauth2_settings.storage_model:
+        key = '{0}:{1}={2}'.format(
+            oauth2_settings.storage_model.lower(),
+            oauth2_settings.storage_model_user_property, request.user.pk)
+    elif request.session.session_key is not None:
+        key = 'session:' + request.session.session_key
+    else:
+        # Sessions without a key are new, and have no credentials yet.
+        return django_storage
+    if oauth2_settings.tenants is not None:
+        key += ':' + _session_key(request)
+    config = oauth2_settings.shared_token_cache
+    cache = token_cache.get_cache(
+        config['path'], config.get('slots', token_cache.DEFAULT_SLOTS),
+        config.get('ttl', token_cache.DEFAULT_TTL))
+    return token_cache.SharedTokenStorage(django_storage, cache, key,
+                                          get_tenant(request).client_id)
 
 
 def _redirect_with_params(url_name, *args, **kwargs):
@@ -419,6 +787,22 @@ def _redirect_with_params(url_name, *args, **kwargs):
     return "{0}?{1}".format(url, params)
 
 
+def store_identity(request, claims):
+    """Keeps the identity claims of an ID token in the session.
+
+    Args:
+        request: The current request.
+        claims: The claims of the user's ID token.
+
+    Returns:
+        A dictionary of the claims in ``IDENTITY_CLAIMS`` that are present.
+    """
+    identity = {name: claims[name] for name in IDENTITY_CLAIMS
+                if name in claims}
+    request.session[_CLAIMS_KEY] = identity
+    return identity
+
+
 def _credentials_from_request(request):
     """Gets the authorized credentials for this flow, if they exist."""
     # ORM storage requires a logged in user
@@ -440,23 +824,36 @@ class UserOAuth2(object):
 
         Args:
             request: Django request object.
-            scopes: Scopes desired for this OAuth2 flow.
+            scopes: Scopes desired for this OAuth2 flow, or their
+                    :mod:`googleoauth2django.scope_set` set. They are not
+                    interned, so they may come from the request.
             return_url: The url to return to after the OAuth flow is complete,
                  defaults to the request's current URL path.
         """
         oauth2_settings = get_oauth2_settings()
         self.request = request
-        self.return_url = return_url or request.get_full_path()
-        if scopes:
-            self._scopes = set(oauth2_settings.scopes) | set(scopes)
+        self._return_url = return_url
+        self._async_http = None
+        self._claims = None
+        if oauth2_settings.tenants is not None:
+            default_mask = get_tenant(request).scope_mask
         else:
-            self._scopes = set(oauth2_settings.scopes)
+            default_mask = oauth2_settings.scope_mask
+        self._scope_mask = scope_set.union(default_mask,
+                                           scope_set.lookup(scopes))
+
+    @property
+    def return_url(self):
+        """The url to return to after the OAuth flow is complete."""
+        if not self._return_url:
+            self._return_url = self.request.get_full_path()
+        return self._return_url
 
     def get_authorize_redirect(self):
         """Creates a URl to start the OAuth2 authorization flow."""
         get_params = {
             'return_url': self.return_url,
-            'scopes': self._get_scopes()
+            'scopes': sorted(self._get_scopes())
         }
 
         return _redirect_with_params('google_oauth:authorize', **get_params)
@@ -465,17 +862,32 @@ class UserOAuth2(object):
         """Returns True if there are valid credentials for the current user
         and required scopes."""
         credentials = _credentials_from_request(self.request)
-        return (credentials is not None and credentials.valid is True and
-                credentials.has_scopes(self._get_scopes()))
+        if credentials is None:
+            result = 'missing'
+        elif credentials.valid is not True:
+            result = 'invalid'
+        else:
+            granted = scope_set.lookup(credentials.scopes)
+            if not scope_set.covers(granted, self._scope_mask):
+                result = 'insufficient_scopes'
+            elif (get_oauth2_settings().verify_scopes and
+                  not tokeninfo.has_scopes(
+                      credentials.token, scope_set.names(self._scope_mask))):
+                result = 'ungranted_scopes'
+            else:
+                result = 'valid'
+        metrics.inc('googleoauth2django_has_credentials_total', result=result)
+        return result == 'valid'
 
     def _get_scopes(self):
         """Returns the scopes associated with this object, kept up to
          date for incremental auth."""
-        if _credentials_from_request(self.request):
-            return (self._scopes |
-                    _credentials_from_request(self.request).scopes)
+        credentials = _credentials_from_request(self.request)
+        if credentials:
+            return scope_set.names(scope_set.union(
+                self._scope_mask, scope_set.lookup(credentials.scopes)))
         else:
-            return self._scopes
+            return scope_set.names(self._scope_mask)
 
     @property
     def scopes(self):
@@ -484,6 +896,47 @@ class UserOAuth2(object):
         # in future authorizations
         return self._get_scopes()
 
+    @property
+    def claims(self):
+        """The identity claims (``sub``, ``email`` and ``hd``) of the
+        authorized Google account, or an empty dictionary.
+
+        The claims are stored in the session by ``oauth2_callback``. Sessions
+        started before credentials were stored with the ORM storage read them
+        once from the stored ID token.
+        """
+        if self._claims is None:
+            claims = self.request.session.get(_CLAIMS_KEY)
+            if claims is None:
+                claims = self._claims_from_credentials()
+            self._claims = claims
+        return self._claims
+
+    def _claims_from_credentials(self):
+        """Reads the identity claims from the stored ID token."""
+        credentials = self.credentials
+        id_token = getattr(credentials, 'id_token', None)
+        if not isinstance(id_token, str):
+            return {}
+        from google.auth import jwt
+        try:
+            # The token was verified by oauth2_callback before being stored.
+            claims = jwt.decode(id_token, verify=False)
+        except ValueError:
+            return {}
+        return store_identity(self.request, claims)
+
+    @property
+    def email(self):
+        """The email address of the authorized Google account, or None."""
+        return self.claims.get('email')
+
+    @property
+    def user_id(self):
+        """The id of the authorized Google account (the ``sub`` claim), or
+        None."""
+        return self.claims.get('sub')
+
     @property
     def credentials(self):
         """Gets the authorized credentials for this flow, if they exist."""
@@ -493,7 +946,77 @@ class UserOAuth2(object):
     def http(self):
         """Helper: create HTTP client authorized with OAuth2 credentials."""
         if self.has_credentials():
-            # return self.credentials.authorize(transport.get_http_object())
+            # Imported on first use, requests and oauthlib are expensive to
+            # import and only needed by views that call Google APIs.
+            from requests_oauthlib import OAuth2Session
             return OAuth2Session(client_id=self.credentials._client_id,
                                  token=self.credentials.token)
         return None
+
+    @property
+    def async_http(self):
+        """Helper: create an asyncio client authorized with OAuth2
+        credentials, see :mod:`googleoauth2django.fanout`."""
+        if not self.has_credentials():
+            return None
+        if self._async_http is None:
+            # asyncio is expensive to import and only needed by views that
+            # fan out.
+            from googleoauth2django import fanout
+            max_concurrency = (get_oauth2_settings().async_max_concurrency or
+                               fanout.DEFAULT_MAX_CONCURRENCY)
+            # The limit is shared by all the requests of the user.
+            user = getattr(self.request, 'user', None)
+            session = getattr(self.request, 'session', None)
+            if user is not None and user.is_authenticated:
+                key = ('user', user.pk)
+            elif session is not None and session.session_key:
+                key = ('session', session.session_key)
+            else:
+                key = None
+            self._async_http = fanout.AsyncHttp(
+                self.credentials.token, max_concurrency=max_concurrency,
+                key=key)
+        return self._async_http
+
+    def build_service(self, name, version):
+        """Builds an authorized service object for a Google API.
+
+        The API discovery document is cached by
+        :mod:`googleoauth2django.discovery`, so only the lightweight service
+        object is built per request.
+
+        Args:
+            name: The name of the API, for example ``'calendar'``.
+            version: The version of the API, for example ``'v3'``.
+
+        Returns:
+            A ``googleapiclient.discovery.Resource``, or None if there are no
+            valid credentials.
+        """
+        if not self.has_credentials():
+            return None
+        oauth2_settings = get_oauth2_settings()
+        return discovery.build(name, version, self.credentials,
+                               ttl=oauth2_settings.discovery_cache_ttl,
+                               cache_dir=oauth2_settings.discovery_cache_dir)
+
+    def batch(self, batch_uri, max_size=None):
+        """Creates a batch of API calls authorized with the user's
+        credentials.
+
+        Args:
+            batch_uri: The batch endpoint of the API.
+            max_size: The maximum number of calls per batch request, defaults
+                      to ``GOOGLE_OAUTH2_BATCH_MAX_SIZE``.
+
+        Returns:
+            A :class:`googleoauth2django.batch.Batch`, or None if there are
+            no valid credentials.
+        """
+        if not self.has_credentials():
+            return None
+        if max_size is None:
+            max_size = get_oauth2_settings().batch_max_size
+        return batch.Batch(batch_uri, self.credentials.token,
+                           max_size=max_size)
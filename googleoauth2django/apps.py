@@ -30,3 +30,19 @@ if sys.hexversion >= 0x02070000:  # pragma: NO COVER
         """ App Config for Django Helper"""
         name = 'googleoauth2django'
         verbose_name = "Google OAuth2 Django Helper"
+
+        def ready(self):
+            import django.conf
+            from django.core.signals import setting_changed
+
+            import googleoauth2django
+            # Importing checks registers the settings system checks.
+            from googleoauth2django import checks  # noqa: F401
+            from googleoauth2django import metrics
+            from googleoauth2django import warmup
+
+            setting_changed.connect(googleoauth2django._reset_oauth2_settings,
+                                    weak=False,
+                                    dispatch_uid='googleoauth2django.settings')
+            metrics.configure(django.conf.settings)
+            warmup.configure(django.conf.settings)
@@ -0,0 +1,106 @@
+# Copyright 2016 Google Inc.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Signing in to Django with a Google account.
+
+When Google OAuth is the primary form of authentication, the
+:class:`GoogleOAuth2Backend` authentication backend logs users in from the
+verified ID token of the OAuth2 callback:
+
+.. code-block:: python
+   :caption: settings.py
+   :name: backend_settings
+
+   AUTHENTICATION_BACKENDS = [
+       'googleoauth2django.backends.GoogleOAuth2Backend',
+   ]
+
+   GOOGLE_OAUTH2_LOGIN = True
+   GOOGLE_OAUTH2_STORAGE_MODEL = {
+       'model': 'path.to.model.MyModel',
+       'user_property': 'user_id',
+       'credentials_property': 'credential',
+       'subject_property': 'google_sub',
+   }
+
+With ``GOOGLE_OAUTH2_LOGIN``, the authorize view no longer sends anonymous
+users to ``LOGIN_URL``. The callback looks up the user linked to the Google
+account through the indexed ``subject_property`` field of the storage model,
+creating a user on first sign-in, logs them in and stores their credentials,
+all in one transaction.
+
+Django loads the logged in user on every request with ``get_user``, which
+is ``ModelBackend``'s, so a user deactivated or changed by another process
+is seen on their next request.
+"""
+
+from django.contrib.auth import backends
+from django.contrib.auth import get_user_model
+
+from googleoauth2django import bearer
+
+BACKEND = 'googleoauth2django.backends.GoogleOAuth2Backend'
+
+
+class GoogleOAuth2Backend(backends.ModelBackend):
+    """Authenticates users from the claims of a verified Google ID token.
+
+    Permissions are checked like ``ModelBackend`` does.
+
+    Attributes:
+        create_unknown_user: Whether a user is created for Google accounts
+                             not yet linked to one, as Django's
+                             ``RemoteUserBackend`` does.
+    """
+
+    create_unknown_user = True
+
+    def authenticate(self, request, google_claims=None, **kwargs):
+        """Returns the user linked to the Google account of the claims.
+
+        Args:
+            request: The current request.
+            google_claims: The claims of a verified ID token.
+
+        Returns:
+            The user, or None if there is no active user for the account.
+        """
+        if not google_claims or 'sub' not in google_claims:
+            return None
+        user = bearer.get_user(google_claims['sub'], can_authenticate=False)
+        if user is None and self.create_unknown_user:
+            user = self.create_user(google_claims)
+        if user is None or not self.user_can_authenticate(user):
+            return None
+        return user
+
+    def create_user(self, claims):
+        """Creates a user on the first sign-in with a Google account.
+
+        The username is the Google account id, which unlike the email
+        address never changes. Override this method to fill in other fields.
+
+        Args:
+            claims: The claims of the verified ID token.
+
+        Returns:
+            The new user.
+        """
+        user_model = get_user_model()
+        user = user_model(**{user_model.USERNAME_FIELD: claims['sub']})
+        if 'email' in claims and hasattr(user, 'email'):
+            user.email = claims['email']
+        user.set_unusable_password()
+        user.save()
+        return user
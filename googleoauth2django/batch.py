@@ -0,0 +1,201 @@
+# Copyright 2016 Google Inc.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Batched Google API calls.
+
+Google APIs accept several calls in a single ``multipart/mixed`` request to
+the API's batch endpoint. :meth:`UserOAuth2.batch
+<googleoauth2django.UserOAuth2.batch>` collects calls and sends them that
+way, authorized with the user's credentials:
+
+.. code-block:: python
+   :caption: views.py
+   :name: batch
+
+   batch = request.oauth.batch(
+       'https://www.googleapis.com/batch/calendar/v3')
+   for event_id in event_ids:
+       batch.add('GET', 'https://www.googleapis.com/calendar/v3/calendars/'
+                        'primary/events/' + event_id)
+   events = [response.json() for response in batch.execute()]
+
+A batch holding more than ``GOOGLE_OAUTH2_BATCH_MAX_SIZE`` calls (100 by
+default) is sent as several batch requests.
+"""
+
+import email.parser
+import json
+from urllib import parse
+import uuid
+
+from googleoauth2django import metrics
+from googleoauth2django import stats
+from googleoauth2django import transport
+
+MAX_BATCH_SIZE = 100
+TIMEOUT = 30
+
+_BATCH_METRIC = 'googleoauth2django_batch_seconds'
+
+
+class BatchError(Exception):
+    """The batch response could not be matched to the batched calls."""
+
+
+class BatchResponse(object):
+    """The response to a single call of a batch.
+
+    Attributes:
+        status: The HTTP status code of the call.
+        headers: A dictionary of the response headers.
+        content: The response body as a string.
+    """
+
+    def __init__(self, status, headers, content):
+        self.status = status
+        self.headers = headers
+        self.content = content
+
+    @property
+    def ok(self):
+        """True if the call succeeded."""
+        return 200 <= self.status < 300
+
+    def json(self):
+        """Parses the response body as JSON."""
+        return json.loads(self.content)
+
+
+def _encode_call(method, url, body, headers):
+    """Serializes a call as the body of an ``application/http`` part."""
+    parts = parse.urlsplit(url)
+    path = parse.urlunsplit(('', '', parts.path, parts.query, ''))
+    lines = ['{0} {1} HTTP/1.1'.format(method, path)]
+    headers = dict(headers or {})
+    if body is not None and not isinstance(body, str):
+        body = json.dumps(body)
+        headers.setdefault('Content-Type', 'application/json')
+    lines.extend('{0}: {1}'.format(*header) for header in headers.items())
+    return '\r\n'.join(lines) + '\r\n\r\n' + (body or '')
+
+
+def _decode_call(payload):
+    """Parses the ``application/http`` part of a response."""
+    head, _, content = payload.partition('\r\n\r\n')
+    if not content and '\n\n' in head:
+        head, _, content = payload.partition('\n\n')
+    lines = head.splitlines()
+    status = int(lines[0].split(' ', 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        headers[name.strip()] = value.strip()
+    return BatchResponse(status, headers, content)
+
+
+class Batch(object):
+    """Collects API calls and sends them as batch requests.
+
+    Args:
+        batch_uri: The batch endpoint of the API, for example
+                   ``https://www.googleapis.com/batch/calendar/v3``.
+        token: The OAuth2 access token used to authorize the calls.
+        max_size: The maximum number of calls sent in one batch request.
+        session: Optional ``requests.Session``, defaults to the shared
+                 session of :mod:`googleoauth2django.transport`.
+    """
+
+    def __init__(self, batch_uri, token, max_size=MAX_BATCH_SIZE,
+                 session=None):
+        self.batch_uri = batch_uri
+        self.token = token
+        self.max_size = max_size
+        self._session = session
+        self._calls = []
+
+    def __len__(self):
+        return len(self._calls)
+
+    def add(self, method, url, body=None, headers=None):
+        """Adds a call to the batch.
+
+        Args:
+            method: The HTTP method of the call.
+            url: The URL of the call. Only its path and query are sent.
+            body: Optional body, a string or a JSON serializable object.
+            headers: Optional dictionary of headers of the call.
+
+        Returns:
+            The position of the call's response in :meth:`execute`'s result.
+        """
+        self._calls.append(_encode_call(method, url, body, headers))
+        return len(self._calls) - 1
+
+    def execute(self):
+        """Sends the collected calls and clears the batch.
+
+        Returns:
+            A list of :class:`BatchResponse`, in the order the calls were
+            added.
+
+        Raises:
+            requests.HTTPError: A batch request failed as a whole.
+            BatchError: A batch response is missing calls.
+        """
+        calls, self._calls = self._calls, []
+        responses = []
+        for start in range(0, len(calls), self.max_size):
+            responses.extend(self._send(calls[start:start + self.max_size]))
+        return responses
+
+    def _send(self, calls):
+        """Sends one batch request and returns its responses in order."""
+        boundary = 'batch_{0}'.format(uuid.uuid4().hex)
+        body = []
+        for index, call in enumerate(calls):
+            body.append(
+                '--{0}\r\nContent-Type: application/http\r\n'
+                'Content-ID: <{1}>\r\n\r\n{2}\r\n'.format(
+                    boundary, index, call))
+        body.append('--{0}--\r\n'.format(boundary))
+
+        session = self._session or transport.get_session()
+        with metrics.timer(_BATCH_METRIC), stats.phase(stats.PHASE_GOOGLE):
+            response = session.post(
+                self.batch_uri, data=''.join(body).encode('utf-8'),
+                headers={
+                    'Authorization': 'Bearer {0}'.format(self.token),
+                    'Content-Type':
+                        'multipart/mixed; boundary={0}'.format(boundary),
+                }, timeout=TIMEOUT)
+        response.raise_for_status()
+
+        message = email.parser.BytesParser().parsebytes(
+            b'Content-Type: ' + response.headers['Content-Type'].encode(
+                'ascii') + b'\r\n\r\n' + response.content)
+        if not message.is_multipart():
+            raise BatchError('Batch response is not multipart.')
+
+        by_id = {}
+        for part in message.get_payload():
+            content_id = part.get('Content-ID', '').strip('<>')
+            # Google answers with "response-" prepended to the Content-ID.
+            content_id = content_id.rsplit('-', 1)[-1]
+            by_id[content_id] = _decode_call(
+                part.get_payload(decode=True).decode('utf-8'))
+        try:
+            return [by_id[str(index)] for index in range(len(calls))]
+        except KeyError as missing:
+            raise BatchError(
+                'Batch response is missing call {0}.'.format(missing))
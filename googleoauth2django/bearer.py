@@ -0,0 +1,296 @@
+# Copyright 2016 Google Inc.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Authentication of API requests carrying Google tokens.
+
+Mobile and single page clients can call a Django API with a Google ID token
+or access token in an ``Authorization: Bearer`` header instead of a session.
+:class:`BearerAuthenticationMiddleware` verifies such tokens and sets
+``request.user``, and the :func:`googleoauth2django.decorators.bearer_required`
+decorator rejects requests without a valid token:
+
+.. code-block:: python
+   :caption: settings.py
+   :name: bearer_settings
+
+   MIDDLEWARE = [
+       # ...
+       'django.contrib.auth.middleware.AuthenticationMiddleware',
+       'googleoauth2django.bearer.BearerAuthenticationMiddleware',
+   ]
+
+   GOOGLE_OAUTH2_STORAGE_MODEL = {
+       'model': 'path.to.model.MyModel',
+       'user_property': 'user_id',
+       'credentials_property': 'credential',
+       'subject_property': 'google_sub',
+   }
+   # Client IDs of the apps allowed to call the API, defaults to
+   # GOOGLE_OAUTH2_CLIENT_ID.
+   GOOGLE_OAUTH2_BEARER_AUDIENCES = ('web-client-id', 'android-client-id')
+
+ID tokens are verified locally against Google's certificates, which are
+fetched once and cached for as long as Google allows, with the parsed
+verifiers of :mod:`googleoauth2django.crypt`. Access tokens are
+checked with the cached lookups of :mod:`googleoauth2django.tokeninfo`. In
+both cases the token must have been issued to one of the configured
+audiences. The token's Google account is mapped to a Django user through the
+``subject_property`` field of the storage model, which should be indexed.
+Users that may not log in, such as inactive ones, are not mapped.
+
+A token signed with a key that is not among the cached certificates makes
+the certificates be fetched again, since Google rotates its keys, but at
+most once every ``MIN_REFETCH_INTERVAL`` seconds, so tokens with made up key
+ids cannot make every request wait for Google.
+"""
+
+import re
+import threading
+import time
+
+import googleoauth2django
+from googleoauth2django import crypt
+from googleoauth2django import stats
+from googleoauth2django import tokeninfo
+from googleoauth2django import transport
+
+CERTS_URI = 'https://www.googleapis.com/oauth2/v1/certs'
+ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+DEFAULT_CERTS_TTL = 60 * 60
+MIN_REFETCH_INTERVAL = 60
+TIMEOUT = 10
+
+_BEARER_RE = re.compile(r'^Bearer\s+(\S+)$', re.IGNORECASE)
+_MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+_lock = threading.Lock()
+# A tuple of the expiry time, the fetch time and the certificates by key id.
+_certs = (0, 0, {})
+# Set while a thread fetches the certificates, to an event set when it is done.
+_fetching = None
+
+
+class InvalidToken(Exception):
+    """The bearer token is not a valid token for this application."""
+
+
+def _fetch_certs():
+    """Fetches Google's token signing certificates.
+
+    Returns:
+        A tuple of the certificates by key id and the number of seconds they
+        may be cached for.
+    """
+    with stats.phase(stats.PHASE_GOOGLE):
+        response = transport.get_session().get(CERTS_URI, timeout=TIMEOUT)
+    response.raise_for_status()
+    match = _MAX_AGE_RE.search(response.headers.get('Cache-Control', ''))
+    ttl = int(match.group(1)) if match else DEFAULT_CERTS_TTL
+    return response.json(), ttl
+
+
+def _usable(entry, key_id, now):
+    """Returns True if cached certificates can be used for a key id."""
+    expiry, fetched, certs = entry
+    return expiry > now and (key_id is None or key_id in certs or
+                             now - fetched < MIN_REFETCH_INTERVAL)
+
+
+def get_certs(key_id=None):
+    """Returns Google's token signing certificates.
+
+    A single thread fetches the certificates at a time, without holding the
+    lock. While it does, other threads keep using the certificates they
+    have, unless these have expired.
+
+    Args:
+        key_id: Optional key id that should be among the certificates. If it
+                is not, the certificates are fetched again, since Google
+                rotates its keys, unless they were fetched less than
+                ``MIN_REFETCH_INTERVAL`` seconds ago.
+
+    Returns:
+        A dictionary of PEM certificates by key id.
+    """
+    global _certs, _fetching
+    while True:
+        entry = _certs
+        if _usable(entry, key_id, time.time()):
+            return entry[2]
+        with _lock:
+            if _certs is not entry:
+                continue
+            fetching = _fetching
+            if fetching is None:
+                fetching = _fetching = threading.Event()
+                break
+        if entry[0] > time.time():
+            return entry[2]
+        fetching.wait(TIMEOUT)
+    try:
+        certs, ttl = _fetch_certs()
+        now = time.time()
+        _certs = (now + ttl, now, certs)
+        return certs
+    finally:
+        with _lock:
+            _fetching = None
+        fetching.set()
+
+
+def verify_id_token(token, audiences):
+    """Verifies a Google ID token locally.
+
+    Args:
+        token: string, the encoded ID token.
+        audiences: The client IDs the token may have been issued to.
+
+    Returns:
+        The claims of the token.
+
+    Raises:
+        InvalidToken: The token is not valid.
+    """
+    from google.auth import jwt
+
+    try:
+        header = jwt.decode_header(token)
+        claims = crypt.decode_jwt(token, get_certs(header.get('kid')),
+                                  audience=list(audiences))
+    except ValueError as error:
+        raise InvalidToken(str(error))
+    if claims.get('iss') not in ISSUERS:
+        raise InvalidToken('Wrong issuer {0!r}.'.format(claims.get('iss')))
+    return claims
+
+
+def verify_access_token(token, audiences):
+    """Verifies a Google access token with the tokeninfo endpoint.
+
+    Args:
+        token: string, the access token.
+        audiences: The client IDs the token may have been issued to.
+
+    Returns:
+        The tokeninfo response for the token.
+
+    Raises:
+        InvalidToken: The token is not valid.
+    """
+    info = tokeninfo.get_token_info(token)
+    if info is None:
+        raise InvalidToken('Token is not valid.')
+    if info.get('aud') not in audiences and info.get('azp') not in audiences:
+        raise InvalidToken('Token was issued to another client.')
+    if 'sub' not in info:
+        raise InvalidToken('Token has no openid scope.')
+    return info
+
+
+def verify(token, audiences):
+    """Verifies an ID token or access token.
+
+    Returns:
+        The claims of the ID token or the tokeninfo response of the access
+        token, both including the Google account id as ``sub``.
+
+    Raises:
+        InvalidToken: The token is not valid.
+    """
+    # ID tokens are JWTs, access tokens are opaque strings.
+    if token.count('.') == 2:
+        return verify_id_token(token, audiences)
+    return verify_access_token(token, audiences)
+
+
+def get_token(request):
+    """Returns the bearer token of a request, or None."""
+    match = _BEARER_RE.match(request.META.get('HTTP_AUTHORIZATION', ''))
+    return match.group(1) if match else None
+
+
+def get_user(subject, can_authenticate=True):
+    """Returns the Django user linked to a Google account.
+
+    Args:
+        subject: The Google account id, the ``sub`` claim of its tokens.
+        can_authenticate: If True, only a user that may log in, as checked
+                          by ``ModelBackend.user_can_authenticate``, is
+                          returned.
+
+    Returns:
+        The user, or None if no user is linked to the account, the user may
+        not log in while ``can_authenticate`` is set, or the storage model
+        has no ``subject_property``.
+    """
+    from django.contrib.auth import backends
+
+    oauth2_settings = googleoauth2django.get_oauth2_settings()
+    subject_property = oauth2_settings.storage_model_subject_property
+    if subject_property is None:
+        return None
+    model_class = googleoauth2django.get_storage_model_class()
+    user_property = oauth2_settings.storage_model_user_property
+    entity = (model_class.objects.select_related(user_property)
+              .filter(**{subject_property: subject}).first())
+    if entity is None:
+        return None
+    user = getattr(entity, user_property)
+    if (can_authenticate and
+            not backends.ModelBackend().user_can_authenticate(user)):
+        return None
+    return user
+
+
+def authenticate(request):
+    """Authenticates a request from its bearer token.
+
+    Sets ``request.oauth_claims`` to the verified claims, and
+    ``request.oauth_user`` to the linked user, or None. If there is a
+    linked user, ``request.user`` is set to it too.
+
+    Returns:
+        The claims, or None if the request has no bearer token.
+
+    Raises:
+        InvalidToken: The token is not valid.
+    """
+    token = get_token(request)
+    if token is None:
+        return None
+    claims = verify(token,
+                    googleoauth2django.get_oauth2_settings().bearer_audiences)
+    request.oauth_claims = claims
+    user = request.oauth_user = get_user(claims['sub'])
+    if user is not None:
+        request.user = user
+    return claims
+
+
+class BearerAuthenticationMiddleware(object):
+    """Authenticates requests with an ``Authorization: Bearer`` header.
+
+    Requests with an invalid token are left anonymous, with
+    ``request.oauth_claims`` and ``request.oauth_user`` set to None.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            request.oauth_claims = authenticate(request)
+        except InvalidToken:
+            request.oauth_claims = request.oauth_user = None
+        return self.get_response(request)
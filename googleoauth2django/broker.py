@@ -0,0 +1,586 @@
+# Copyright 2016 Google Inc.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A process refreshing the access tokens of all the workers of a host.
+
+Every web worker refreshing the credentials it loads means that when a token
+expires, each worker that needs it refreshes it and writes it back. The
+``oauth2_broker`` management command runs a broker that owns the refreshes
+of a host instead:
+
+.. code-block:: bash
+
+   python manage.py oauth2_broker
+
+.. code-block:: python
+   :caption: settings.py
+   :name: broker
+
+   GOOGLE_OAUTH2_BROKER = {
+       'socket': '/run/googleoauth2django/broker.sock',
+       'timeout': 10,  # optional, seconds to wait for the broker
+   }
+
+With ``GOOGLE_OAUTH2_BROKER`` set, :func:`googleoauth2django.get_storage`
+returns a :class:`BrokerStorage` in front of the ORM storage, which asks the
+broker for the access token of the user over the Unix socket. The broker
+answers from memory, and loads and refreshes the credentials through their
+token URI when needed, one refresh per token at a time. Only the broker
+writes refreshed credentials to the database; credentials stored by the
+``oauth2_callback`` view are still written by the workers, which tell the
+broker to forget the credentials it holds.
+
+Credentials are held for ``ENTRY_TTL`` seconds before being loaded again,
+and for at most ``MAX_ENTRIES`` keys, so changes made without telling the
+broker, for example by another host, are picked up. A refreshed token is
+only written over the credentials it was refreshed from: if they were
+deleted or replaced meanwhile, the stored ones win. A failed refresh, for
+example of a revoked refresh token, is remembered for ``FAILURE_TTL``
+seconds, during which the broker answers with the error instead of asking
+the token URI again.
+
+The workers keep a connection to the broker per thread. Requests and
+responses are framed with a small binary header, see :func:`send_request`
+and :func:`send_response`. If the broker cannot be reached, the workers log
+a warning and load the credentials from the storage themselves. When the
+broker failed to refresh the credentials, they do not: the user has no
+credentials until they authorize again or the failure is forgotten.
+
+The broker requires ``GOOGLE_OAUTH2_STORAGE_MODEL``; credentials stored in
+sessions are not shared between workers.
+"""
+
+import datetime
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+from google.auth import exceptions
+from google.oauth2 import credentials as oauth2_credentials
+
+from googleoauth2django import metrics
+from googleoauth2django import transport
+from googleoauth2django.helpers.dictionary_storage import Storage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 10
+# Tokens are refreshed when they expire within this many seconds.
+REFRESH_MARGIN = 300
+# Seconds the credentials of a key are held before being loaded again.
+ENTRY_TTL = 10 * 60
+# The number of keys whose credentials are held at most.
+MAX_ENTRIES = 10000
+# Seconds a failed refresh is remembered before the credentials are loaded
+# and refreshed again.
+FAILURE_TTL = 60
+
+OP_GET = 1
+OP_REFRESH = 2
+OP_FORGET = 3
+
+STATUS_OK = 0
+STATUS_NOT_FOUND = 1
+STATUS_ERROR = 2
+STATUS_REFRESH_FAILED = 3
+
+# The operation and the length of the payload.
+_REQUEST = struct.Struct('>BH')
+# The status, the expiry and the length of the payload.
+_RESPONSE = struct.Struct('>BdI')
+_CLIENT_METRIC = 'googleoauth2django_broker_total'
+_REFRESH_METRIC = 'googleoauth2django_broker_refresh_total'
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+class BrokerError(Exception):
+    """The broker could not be reached or failed to answer."""
+
+
+class BrokerRefreshError(exceptions.RefreshError):
+    """The broker failed to refresh the credentials."""
+
+
+def _recv_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError('Connection closed.')
+        data += chunk
+    return data
+
+
+def send_request(sock, op, key, stale_token=None):
+    """Sends a request to the broker.
+
+    A request is a byte with the operation and two bytes with the length of
+    the payload, followed by the payload: the storage key, and for
+    ``OP_REFRESH`` a newline and the expired token.
+    """
+    payload = key if stale_token is None else key + '\n' + stale_token
+    payload = payload.encode('utf-8')
+    sock.sendall(_REQUEST.pack(op, len(payload)) + payload)
+
+
+def recv_request(sock):
+    """Reads a request, see :func:`send_request`.
+
+    Returns:
+        A tuple of the operation, the key and the expired token or None.
+    """
+    op, length = _REQUEST.unpack(_recv_exactly(sock, _REQUEST.size))
+    key, _, stale_token = _recv_exactly(sock, length).decode(
+        'utf-8').partition('\n')
+    return op, key, stale_token or None
+
+
+def send_response(sock, status, expiry=0.0, payload=''):
+    """Sends a response to a request.
+
+    A response is a byte with the status, eight bytes with the expiry of the
+    token as a POSIX timestamp and four bytes with the length of the
+    payload, followed by the payload: the token, a newline and its scopes,
+    or an error message.
+    """
+    payload = payload.encode('utf-8')
+    sock.sendall(_RESPONSE.pack(status, expiry, len(payload)) + payload)
+
+
+def recv_response(sock):
+    """Reads a response, see :func:`send_response`.
+
+    Returns:
+        A tuple of the status, the expiry and the payload.
+    """
+    status, expiry, length = _RESPONSE.unpack(
+        _recv_exactly(sock, _RESPONSE.size))
+    return status, expiry, _recv_exactly(sock, length).decode('utf-8')
+
+
+def _timestamp(expiry):
+    return (expiry - _EPOCH).total_seconds()
+
+
+class Broker(object):
+    """Holds and refreshes credentials, the core of the broker process.
+
+    Args:
+        make_storage: A function returning the storage of the credentials
+                      of a key.
+        request: Optional ``google.auth.transport.Request`` used to refresh
+                 credentials, defaults to one using the pooled connections
+                 of :mod:`googleoauth2django.transport`.
+    """
+
+    def __init__(self, make_storage, request=None):
+        self.make_storage = make_storage
+        if request is None:
+            from google.auth.transport import requests as google_requests
+            request = google_requests.Request(transport.get_session())
+        self.request = request
+        self._lock = threading.Lock()
+        # Maps keys to their storage, credentials, the time the credentials
+        # must be loaded again, oldest first, and the message of their
+        # failed refresh or None.
+        self._entries = {}
+        # Keys being loaded or refreshed, and the locks their other
+        # requests wait on.
+        self._key_locks = {}
+
+    def _key_lock(self, key):
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def _hold(self, key, storage, credentials, error=None):
+        """Holds the credentials of a key, dropping expired entries and the
+        oldest ones beyond ``MAX_ENTRIES``.
+
+        Args:
+            error: The message of a failed refresh of the credentials,
+                   which is then held for ``FAILURE_TTL`` seconds only.
+
+        Returns:
+            The new entry.
+        """
+        ttl = ENTRY_TTL if error is None else FAILURE_TTL
+        entry = (storage, credentials, time.time() + ttl, error)
+        with self._lock:
+            # Moved to the end, so entries stay ordered by expiry.
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            now = time.time()
+            for oldest in list(self._entries):
+                if (len(self._entries) <= MAX_ENTRIES and
+                        self._entries[oldest][2] > now):
+                    break
+                del self._entries[oldest]
+                lock = self._key_locks.get(oldest)
+                if lock is not None and not lock.locked():
+                    del self._key_locks[oldest]
+        return entry
+
+    def _fresh(self, credentials, stale_token):
+        return (credentials.token is not None and
+                credentials.token != stale_token and
+                (credentials.expiry is None or
+                 _timestamp(credentials.expiry) - REFRESH_MARGIN >
+                 time.time()))
+
+    def token(self, key, stale_token=None):
+        """Returns the current credentials of a key, refreshed if needed.
+
+        Args:
+            key: string, the storage key.
+            stale_token: Optional token the caller found expired, refreshed
+                         even if it has not expired yet.
+
+        Returns:
+            Credentials, or None if the key has no credentials.
+
+        Raises:
+            google.auth.exceptions.RefreshError: The credentials could not
+                                                 be refreshed, now or less
+                                                 than ``FAILURE_TTL``
+                                                 seconds ago.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry[2] > time.time():
+            if entry[3] is not None:
+                metrics.inc(_REFRESH_METRIC, result='failed_before')
+                raise exceptions.RefreshError(entry[3])
+            if self._fresh(entry[1], stale_token):
+                return entry[1]
+
+        with self._key_lock(key):
+            entry = self._entries.get(key)
+            if entry is None or entry[2] <= time.time():
+                storage = (self.make_storage(key) if entry is None
+                           else entry[0])
+                entry = self._load(key, storage)
+                if entry is None:
+                    return None
+            storage, credentials, _, error = entry
+            if error is not None:
+                metrics.inc(_REFRESH_METRIC, result='failed_before')
+                raise exceptions.RefreshError(error)
+            if self._fresh(credentials, stale_token):
+                return credentials
+            token = credentials.token
+            try:
+                credentials.refresh(self.request)
+            except exceptions.RefreshError as refresh_error:
+                metrics.inc(_REFRESH_METRIC, result='error')
+                self._hold(key, storage, credentials, str(refresh_error))
+                raise
+            if storage.update(credentials, token):
+                metrics.inc(_REFRESH_METRIC, result='refreshed')
+                return credentials
+            # Deleted or replaced since they were loaded.
+            metrics.inc(_REFRESH_METRIC, result='discarded')
+            entry = self._load(key, storage)
+            return None if entry is None else entry[1]
+
+    def _load(self, key, storage):
+        """Loads and holds the credentials of a key.
+
+        Returns:
+            The entry, or None if the key has no credentials.
+        """
+        credentials = storage.get()
+        if credentials is None:
+            with self._lock:
+                self._entries.pop(key, None)
+            return None
+        return self._hold(key, storage, credentials)
+
+    def forget(self, key):
+        """Drops the credentials held for a key, for example after they
+        were stored by a worker."""
+        with self._key_lock(key):
+            self._entries.pop(key, None)
+
+    def handle(self, op, key, stale_token=None):
+        """Answers a request.
+
+        Returns:
+            A tuple of the status, the expiry and the payload of the
+            response.
+        """
+        if op == OP_FORGET:
+            self.forget(key)
+            return STATUS_OK, 0.0, ''
+        if op not in (OP_GET, OP_REFRESH):
+            return STATUS_ERROR, 0.0, 'Unknown operation {0}.'.format(op)
+        try:
+            credentials = self.token(
+                key, stale_token if op == OP_REFRESH else None)
+        except exceptions.RefreshError as error:
+            return STATUS_REFRESH_FAILED, 0.0, str(error)
+        if credentials is None:
+            return STATUS_NOT_FOUND, 0.0, ''
+        expiry = (_timestamp(credentials.expiry)
+                  if credentials.expiry is not None else 0.0)
+        return STATUS_OK, expiry, '{0}\n{1}'.format(
+            credentials.token, ' '.join(credentials.scopes or ()))
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """Answers the requests of a worker connection until it is closed."""
+
+    def handle(self):
+        from django import db
+
+        while True:
+            try:
+                op, key, stale_token = recv_request(self.request)
+            except (EOFError, OSError):
+                return
+            try:
+                response = self.server.broker.handle(op, key, stale_token)
+            except Exception as error:
+                logger.exception('Failed to answer for %s', key)
+                response = STATUS_ERROR, 0.0, str(error)
+            finally:
+                db.close_old_connections()
+            send_response(self.request, *response)
+
+
+class BrokerServer(socketserver.ThreadingMixIn,
+                   socketserver.UnixStreamServer):
+    """Serves a :class:`Broker` on a Unix socket, a thread per
+    connection.
+
+    Args:
+        path: The path of the socket. A stale socket file is replaced.
+        broker: The :class:`Broker`.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, broker):
+        self.broker = broker
+        if os.path.exists(path):
+            os.unlink(path)
+        socketserver.UnixStreamServer.__init__(self, path, _Handler)
+        # Access tokens are only for the user running the workers.
+        os.chmod(path, 0o600)
+
+
+class BrokerClient(object):
+    """Asks the broker for tokens, over a connection per thread.
+
+    Args:
+        path: The path of the broker's socket.
+        timeout: Seconds to wait for an answer.
+    """
+
+    def __init__(self, path, timeout=DEFAULT_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            self._local.sock = sock
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def request(self, op, key, stale_token=None):
+        """Sends a request and returns the response, see
+        :func:`recv_response`.
+
+        A broken connection, for example after the broker restarted, is
+        opened again once.
+
+        Raises:
+            BrokerError: The broker could not be reached.
+        """
+        for attempt in range(2):
+            try:
+                sock = self._connection()
+                send_request(sock, op, key, stale_token)
+                return recv_response(sock)
+            except (EOFError, OSError) as error:
+                self._close()
+                if attempt:
+                    raise BrokerError(str(error))
+
+    def token(self, key, stale_token=None):
+        """Returns the access token, expiry and scopes of a key, or None.
+
+        Raises:
+            BrokerError: The broker could not be reached or failed to
+                         answer.
+            BrokerRefreshError: The broker failed to refresh the token.
+        """
+        op = OP_GET if stale_token is None else OP_REFRESH
+        status, expiry, payload = self.request(op, key, stale_token)
+        if status == STATUS_NOT_FOUND:
+            return None
+        if status == STATUS_REFRESH_FAILED:
+            raise BrokerRefreshError(payload)
+        if status != STATUS_OK:
+            raise BrokerError(payload)
+        token, _, scopes = payload.partition('\n')
+        return token, expiry, scopes.split()
+
+    def forget(self, key):
+        """Tells the broker to drop the credentials it holds for a key."""
+        self.request(OP_FORGET, key)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(path, timeout=DEFAULT_TIMEOUT):
+    """Returns the process-wide :class:`BrokerClient` of a socket."""
+    client = _clients.get(path)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(path)
+            if client is None:
+                client = _clients[path] = BrokerClient(path, timeout)
+    return client
+
+
+class BrokerCredentials(oauth2_credentials.Credentials):
+    """Credentials holding a token handed out by the broker.
+
+    They hold no refresh token; :meth:`refresh` asks the broker.
+    """
+
+    def __init__(self, storage, token, expiry, scopes, client_id=None):
+        super(BrokerCredentials, self).__init__(
+            token, expiry=(_EPOCH + datetime.timedelta(seconds=expiry)
+                           if expiry else None),
+            scopes=scopes, client_id=client_id)
+        self._storage = storage
+
+    def refresh(self, request):
+        self.token, self.expiry = self._storage.refresh(request, self.token)
+
+
+class BrokerStorage(Storage):
+    """Gets access tokens from the broker in front of the ORM storage.
+
+    Args:
+        backend: The :class:`googleoauth2django.storage.DjangoORMStorage` of
+                 the credentials.
+        client: A :class:`BrokerClient`.
+        key: string, the key of the credentials for the broker.
+        client_id: Optional client ID of the credentials from the broker.
+    """
+
+    def __init__(self, backend, client, key, client_id=None):
+        super(BrokerStorage, self).__init__()
+        self.backend = backend
+        self.client = client
+        self.key = key
+        self.client_id = client_id
+
+    @property
+    def extra_fields(self):
+        """The ``extra_fields`` of the backend storage."""
+        return self.backend.extra_fields
+
+    def locked_get(self):
+        """Returns the token of the broker as :class:`BrokerCredentials`,
+        None if the broker failed to refresh it, or the credentials of the
+        backend storage if the broker is down."""
+        try:
+            entry = self.client.token(self.key)
+        except BrokerRefreshError as error:
+            metrics.inc(_CLIENT_METRIC, result='refresh_failed')
+            logger.info('The broker failed to refresh credentials: %s',
+                        error)
+            return None
+        except BrokerError as error:
+            metrics.inc(_CLIENT_METRIC, result='unavailable')
+            logger.warning('Loading credentials without the broker: %s',
+                           error)
+            return self.backend.get()
+        if entry is None:
+            metrics.inc(_CLIENT_METRIC, result='not_found')
+            return None
+        metrics.inc(_CLIENT_METRIC, result='ok')
+        token, expiry, scopes = entry
+        return BrokerCredentials(self, token, expiry, scopes, self.client_id)
+
+    def _forget(self):
+        try:
+            self.client.forget(self.key)
+        except BrokerError as error:
+            logger.warning('Failed to tell the broker about new '
+                           'credentials: %s', error)
+
+    def locked_put(self, credentials):
+        """Writes the credentials to the backend storage, and tells the
+        broker to load them again.
+
+        :class:`BrokerCredentials` only hold an access token, they are not
+        written.
+        """
+        if isinstance(credentials, BrokerCredentials):
+            return
+        self.backend.put(credentials)
+        self._forget()
+
+    def locked_delete(self):
+        """Deletes the credentials from the backend storage and the
+        broker."""
+        result = self.backend.delete()
+        self._forget()
+        return result
+
+    def refresh(self, request, stale_token=None):
+        """Asks the broker to refresh an access token.
+
+        Args:
+            request: Unused, the broker makes the request.
+            stale_token: The expired token.
+
+        Returns:
+            A tuple of the new access token and its expiry.
+
+        Raises:
+            google.auth.exceptions.RefreshError: The broker failed to
+                                                 refresh the token, or
+                                                 could not be reached.
+        """
+        try:
+            entry = self.client.token(self.key, stale_token or '')
+        except BrokerError as error:
+            raise exceptions.RefreshError(str(error))
+        if entry is None:
+            raise exceptions.RefreshError('The credentials were deleted.')
+        return entry[0], (_EPOCH + datetime.timedelta(seconds=entry[1])
+                          if entry[1] else None)
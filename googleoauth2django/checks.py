@@ -0,0 +1,177 @@
+# Copyright 2016 Google Inc.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""System checks for the Django OAuth2 Helper settings.
+
+The checks run once when the project starts (and with ``manage.py check``),
+so configuration errors are reported at deploy time instead of on the first
+request. They can be run on their own with
+``manage.py check --tag googleoauth2django``.
+"""
+
+import importlib
+import os
+
+import django.conf
+from django.core import checks
+from django.core import exceptions
+
+import googleoauth2django
+from googleoauth2django import tenants
+from googleoauth2django.helpers import clientsecrets
+
+TAG = 'googleoauth2django'
+
+_SESSION_MIDDLEWARE = 'django.contrib.sessions.middleware.SessionMiddleware'
+_STORAGE_MODEL_KEYS = ('model', 'user_property', 'credentials_property')
+_NEGATIVE_CACHE_BACKENDS = ('cache', 'session')
+
+
+@checks.register(TAG)
+def check_client_secrets(app_configs, **kwargs):
+    """Checks that an OAuth2 client id and secret are configured."""
+    try:
+        googleoauth2django._get_oauth2_client_id_and_secret(
+            django.conf.settings)
+    except exceptions.ImproperlyConfigured as error:
+        return [checks.Error(str(error), id='googleoauth2django.E001')]
+    except (clientsecrets.Error, ValueError) as error:
+        return [checks.Error(
+            'GOOGLE_OAUTH2_CLIENT_SECRETS_JSON could not be loaded: '
+            '{0}'.format(error), id='googleoauth2django.E002')]
+    return []
+
+
+@checks.register(TAG)
+def check_session_middleware(app_configs, **kwargs):
+    """Checks that the session middleware is installed."""
+    middleware_settings = getattr(django.conf.settings, 'MIDDLEWARE', None)
+    if middleware_settings is None:
+        return [checks.Error(
+            'Django settings has no MIDDLEWARE configured.',
+            id='googleoauth2django.E003')]
+    if _SESSION_MIDDLEWARE not in middleware_settings:
+        return [checks.Error(
+            'The Google OAuth2 Helper requires session middleware to be '
+            'installed.',
+            hint='Add {0!r} to MIDDLEWARE.'.format(_SESSION_MIDDLEWARE),
+            id='googleoauth2django.E004')]
+    return []
+
+
+@checks.register(TAG)
+def check_storage_model(app_configs, **kwargs):
+    """Checks that ``GOOGLE_OAUTH2_STORAGE_MODEL`` names an existing model."""
+    storage_model_settings = getattr(django.conf.settings,
+                                     'GOOGLE_OAUTH2_STORAGE_MODEL', None)
+    if storage_model_settings is None:
+        return []
+
+    missing = [key for key in _STORAGE_MODEL_KEYS
+               if key not in storage_model_settings]
+    if missing:
+        return [checks.Error(
+            'GOOGLE_OAUTH2_STORAGE_MODEL is missing {0}.'.format(
+                ', '.join(missing)),
+            id='googleoauth2django.E005')]
+
+    try:
+        module_name, class_name = storage_model_settings['model'].rsplit(
+            '.', 1)
+        getattr(importlib.import_module(module_name), class_name)
+    except (ImportError, AttributeError, ValueError):
+        return [checks.Error(
+            'GOOGLE_OAUTH2_STORAGE_MODEL model {0!r} could not be '
+            'imported.'.format(storage_model_settings['model']),
+            id='googleoauth2django.E006')]
+    return []
+
+
+@checks.register(TAG)
+def check_negative_cache(app_configs, **kwargs):
+    """Checks that ``GOOGLE_OAUTH2_NEGATIVE_CACHE`` names a known backend."""
+    config = getattr(django.conf.settings, 'GOOGLE_OAUTH2_NEGATIVE_CACHE',
+                     None)
+    backend = (config or {}).get('backend', 'cache')
+    if backend not in _NEGATIVE_CACHE_BACKENDS:
+        return [checks.Error(
+            'GOOGLE_OAUTH2_NEGATIVE_CACHE backend must be one of {0}.'.format(
+                ', '.join(_NEGATIVE_CACHE_BACKENDS)),
+            id='googleoauth2django.E007')]
+    return []
+
+
+@checks.register(TAG)
+def check_login(app_configs, **kwargs):
+    """Checks that ``GOOGLE_OAUTH2_LOGIN`` can link users to Google
+    accounts."""
+    if not getattr(django.conf.settings, 'GOOGLE_OAUTH2_LOGIN', False):
+        return []
+    storage_model_settings = getattr(django.conf.settings,
+                                     'GOOGLE_OAUTH2_STORAGE_MODEL', None)
+    if not (storage_model_settings or {}).get('subject_property'):
+        return [checks.Error(
+            'GOOGLE_OAUTH2_LOGIN requires a GOOGLE_OAUTH2_STORAGE_MODEL with '
+            'a subject_property.', id='googleoauth2django.E008')]
+    return []
+
+
+@checks.register(TAG)
+def check_shared_token_cache(app_configs, **kwargs):
+    """Checks that ``GOOGLE_OAUTH2_SHARED_TOKEN_CACHE`` names a file in an
+    existing directory."""
+    config = getattr(django.conf.settings,
+                     'GOOGLE_OAUTH2_SHARED_TOKEN_CACHE', None)
+    if not config:
+        return []
+    path = config.get('path')
+    if not path or not os.path.isdir(os.path.dirname(path) or '.'):
+        return [checks.Error(
+            'GOOGLE_OAUTH2_SHARED_TOKEN_CACHE requires a path in an existing '
+            'directory.', id='googleoauth2django.E009')]
+    return []
+
+
+@checks.register(TAG)
+def check_broker(app_configs, **kwargs):
+    """Checks that ``GOOGLE_OAUTH2_BROKER`` names a socket and that
+    credentials are stored with the ORM."""
+    config = getattr(django.conf.settings, 'GOOGLE_OAUTH2_BROKER', None)
+    if not config:
+        return []
+    if not config.get('socket') or not getattr(
+            django.conf.settings, 'GOOGLE_OAUTH2_STORAGE_MODEL', None):
+        return [checks.Error(
+            'GOOGLE_OAUTH2_BROKER requires a socket and a '
+            'GOOGLE_OAUTH2_STORAGE_MODEL.', id='googleoauth2django.E010')]
+    return []
+
+
+@checks.register(TAG)
+def check_tenants(app_configs, **kwargs):
+    """Checks that the tenants of ``GOOGLE_OAUTH2_TENANTS`` can be
+    loaded."""
+    config = getattr(django.conf.settings, 'GOOGLE_OAUTH2_TENANTS', None)
+    if not config:
+        return []
+    scopes = getattr(django.conf.settings, 'GOOGLE_OAUTH2_SCOPES',
+                     googleoauth2django.GOOGLE_OAUTH2_DEFAULT_SCOPES)
+    try:
+        tenants.load(config, scopes)
+    except (ImportError, AttributeError, ValueError, TypeError,
+            clientsecrets.Error) as error:
+        return [checks.Error(
+            'GOOGLE_OAUTH2_TENANTS could not be loaded: {0}'.format(error),
+            id='googleoauth2django.E011')]
+    return []
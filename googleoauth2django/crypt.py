@@ -0,0 +1,208 @@
+# Copyright 2016 Google Inc.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cached RSA signers and verifiers.
+
+``google.auth`` parses the PEM key or certificate every time a JWT is signed
+or verified. This module keeps the parsed signers and verifiers, keyed by
+the SHA-256 fingerprint of the PEM data. It is used for the ID tokens
+verified by :mod:`googleoauth2django.bearer` and the tokens signed by
+:mod:`googleoauth2django.service_account`.
+
+The RSA implementation is the fastest available of ``BACKENDS``: the
+``cryptography`` package (OpenSSL), then the pure Python ``rsa`` package.
+``scripts/bench_crypt.py`` measures the cost of each installed backend at a
+given volume of tokens. With ``cryptography``, parsing a private key takes
+tens of milliseconds, a hundred times the cost of signing, and parsing a
+certificate adds about half to the cost of a verification.
+"""
+
+import base64
+import hashlib
+import importlib
+import json
+import threading
+import time
+
+# Backend names and the google.auth modules implementing them, fastest
+# first.
+BACKENDS = (
+    ('cryptography', 'google.auth.crypt._cryptography_rsa'),
+    ('python-rsa', 'google.auth.crypt._python_rsa'),
+)
+# Parsed keys kept per backend and kind before the cache is emptied.
+MAX_CACHED_KEYS = 64
+
+_lock = threading.Lock()
+_modules = {}
+# Maps (backend, kind, fingerprint, key id) to a signer or verifier.
+_keys = {}
+
+
+def available_backends():
+    """Returns the names of the installed backends, fastest first."""
+    names = []
+    for name, module_name in BACKENDS:
+        try:
+            _modules[name] = importlib.import_module(module_name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def _backend_module(backend):
+    if backend is None:
+        if not _modules:
+            available_backends()
+        for name, _ in BACKENDS:
+            if name in _modules:
+                return _modules[name]
+        raise ImportError('Install cryptography or rsa to sign and verify '
+                          'tokens.')
+    if backend not in _modules and backend not in available_backends():
+        raise ImportError('Crypt backend {0!r} is not installed.'.format(
+            backend))
+    return _modules[backend]
+
+
+def fingerprint(pem):
+    """Returns the SHA-256 fingerprint of PEM data as a hex string."""
+    if isinstance(pem, str):
+        pem = pem.encode('utf-8')
+    return hashlib.sha256(pem).hexdigest()
+
+
+def clear():
+    """Drops the parsed keys."""
+    with _lock:
+        _keys.clear()
+
+
+def _cached(kind, pem, key_id, backend, load):
+    key = (backend, kind, fingerprint(pem), key_id)
+    loaded = _keys.get(key)
+    if loaded is None:
+        loaded = load()
+        with _lock:
+            if len(_keys) >= MAX_CACHED_KEYS:
+                _keys.clear()
+            _keys[key] = loaded
+    return loaded
+
+
+def signer(private_key, key_id=None, backend=None):
+    """Returns a signer for a PEM private key, parsed once per key.
+
+    Args:
+        private_key: The PEM private key.
+        key_id: Optional key id put in the headers of signed JWTs.
+        backend: Optional name from ``BACKENDS``, defaults to the fastest
+                 installed.
+
+    Returns:
+        A ``google.auth.crypt.Signer``.
+    """
+    module = _backend_module(backend)
+    return _cached('signer', private_key, key_id, module.__name__,
+                   lambda: module.RSASigner.from_string(private_key, key_id))
+
+
+def verifier(certificate, backend=None):
+    """Returns a verifier for a PEM certificate or public key, parsed once
+    per certificate.
+
+    Args:
+        certificate: The PEM certificate or public key.
+        backend: Optional name from ``BACKENDS``, defaults to the fastest
+                 installed.
+
+    Returns:
+        A ``google.auth.crypt.Verifier``.
+    """
+    module = _backend_module(backend)
+    return _cached('verifier', certificate, None, module.__name__,
+                   lambda: module.RSAVerifier.from_string(certificate))
+
+
+def _b64decode(value):
+    return base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+
+
+def decode_jwt(token, certs, audience=None, backend=None,
+               clock_skew_in_seconds=0):
+    """Verifies an RS256 JWT with cached verifiers and returns its claims.
+
+    Performs the checks of ``google.auth.jwt.decode``: the signature, the
+    ``iat`` and ``exp`` claims, and optionally the audience.
+
+    Args:
+        token: string, the encoded JWT.
+        certs: A dictionary of PEM certificates by key id.
+        audience: Optional audience, or list of audiences, the token must
+                  have been issued to.
+        backend: Optional name from ``BACKENDS``.
+        clock_skew_in_seconds: The number of seconds the clocks of the
+                               issuer and of this server may differ by, when
+                               checking ``iat`` and ``exp``.
+
+    Returns:
+        The claims of the token.
+
+    Raises:
+        ValueError: The token is malformed or not valid.
+    """
+    try:
+        header_part, payload_part, signature_part = token.split('.')
+        header = json.loads(_b64decode(header_part))
+        claims = json.loads(_b64decode(payload_part))
+        signature = _b64decode(signature_part)
+    except (ValueError, TypeError):
+        raise ValueError('Malformed token.')
+    if not isinstance(header, dict) or not isinstance(claims, dict):
+        raise ValueError('Malformed token.')
+    if header.get('alg') != 'RS256':
+        raise ValueError('Unsupported algorithm {0!r}.'.format(
+            header.get('alg')))
+
+    key_id = header.get('kid')
+    if key_id is not None:
+        if key_id not in certs:
+            raise ValueError('Certificate for key id {0} not found.'.format(
+                key_id))
+        candidates = [certs[key_id]]
+    else:
+        candidates = list(certs.values())
+    message = '{0}.{1}'.format(header_part, payload_part).encode('ascii')
+    if not any(verifier(cert, backend).verify(message, signature)
+               for cert in candidates):
+        raise ValueError('Could not verify token signature.')
+
+    now = time.time()
+    if 'iat' not in claims or 'exp' not in claims:
+        raise ValueError('Token does not contain iat and exp claims.')
+    if not all(isinstance(claims[name], (int, float)) and
+               not isinstance(claims[name], bool) for name in ('iat', 'exp')):
+        raise ValueError('Token has malformed iat or exp claims.')
+    if now + clock_skew_in_seconds < claims['iat']:
+        raise ValueError('Token used too early.')
+    if claims['exp'] < now - clock_skew_in_seconds:
+        raise ValueError('Token expired.')
+    if audience is not None:
+        if isinstance(audience, str):
+            audience = [audience]
+        if claims.get('aud') not in audience:
+            raise ValueError('Token has wrong audience {0!r}.'.format(
+                claims.get('aud')))
+    return claims
@@ -14,7 +14,8 @@
 
 """Decorators for Django OAuth2 Flow.
 
-Contains two decorators, ``oauth_required`` and ``oauth_enabled``.
+Contains three decorators, ``oauth_required``, ``oauth_enabled`` and
+``bearer_required``.
 
 ``oauth_required`` will ensure that a user has an oauth object containing
 credentials associated with the request, and if not, redirect to the
@@ -23,15 +24,83 @@ authorization flow.
 ``oauth_enabled`` will attach the oauth2 object containing credentials if it
 exists. If it doesn't, the view will still render, but helper methods will be
 attached to start the oauth2 flow.
+
+``bearer_required`` will ensure that an API request carries a valid Google
+token in its ``Authorization`` header, see :mod:`googleoauth2django.bearer`.
+
+``oauth_required`` and ``oauth_enabled`` compile what they need to know about
+a view, its merged scopes, the request attribute and the login redirect, into
+an immutable plan the first time the view is called, and again only when the
+settings change. A request then costs a credentials lookup and a
+``setattr``.
 """
 
+import collections
+from functools import wraps
+from urllib import parse
+
+from django import http
 from django import shortcuts
 import django.conf
-from six import wraps
-from six.moves.urllib import parse
 
 import googleoauth2django
+from googleoauth2django import bearer
 from googleoauth2django import get_oauth2_settings
+from googleoauth2django import metrics
+from googleoauth2django import scope_set
+
+_DECORATOR_METRIC = 'googleoauth2django_decorator_total'
+
+_ViewPlan = collections.namedtuple('_ViewPlan', [
+    # The OAuth2Settings the plan was compiled for.
+    'settings',
+    # The mask of the scopes of the view merged with the default scopes.
+    'scope_mask',
+    # The URL to return to after authorization, or None for the URL of the
+    # request.
+    'return_url',
+    # The name of the request attribute of the UserOAuth2 object.
+    'request_attribute',
+    # The prefix of the login redirect of anonymous users, or None if the
+    # credentials are kept in the session.
+    'login_prefix',
+])
+
+
+class _ViewPlanner(object):
+    """Compiles the plan of the views of a decorator.
+
+    Args:
+        scopes: The scopes of the decorator.
+        return_url: The ``return_url`` of the decorator, or None.
+    """
+
+    __slots__ = ('_scope_mask', '_return_url', '_plan')
+
+    def __init__(self, scopes, return_url):
+        # Interned once, plans only combine masks.
+        self._scope_mask = scope_set.mask(scopes)
+        self._return_url = return_url
+        self._plan = None
+
+    def plan(self):
+        """Returns the plan for the current settings."""
+        oauth2_settings = get_oauth2_settings()
+        plan = self._plan
+        if plan is None or plan.settings is not oauth2_settings:
+            plan = self._plan = self._compile(oauth2_settings)
+        return plan
+
+    def _compile(self, oauth2_settings):
+        scope_mask = self._scope_mask
+        if oauth2_settings.tenants is None:
+            # The default scopes of tenants depend on the request.
+            scope_mask |= oauth2_settings.scope_mask
+        login_prefix = None
+        if oauth2_settings.storage_model is not None:
+            login_prefix = '{0}?next='.format(django.conf.settings.LOGIN_URL)
+        return _ViewPlan(oauth2_settings, scope_mask, self._return_url,
+                         oauth2_settings.request_prefix, login_prefix)
 
 
 def oauth_required(decorated_function=None, scopes=None, **decorator_kwargs):
@@ -68,25 +137,28 @@ def oauth_required(decorated_function=None, scopes=None, **decorator_kwargs):
         credentials are missing the required scopes. Otherwise,
         the decorated view.
     """
+    planner = _ViewPlanner(scopes, decorator_kwargs.get('return_url'))
+
     def curry_wrapper(wrapped_function):
         @wraps(wrapped_function)
         def required_wrapper(request, *args, **kwargs):
-            oauth2_settings = get_oauth2_settings()
-            if not (oauth2_settings.storage_model is None or
-                    request.user.is_authenticated):
-                redirect_str = '{0}?next={1}'.format(
-                    django.conf.settings.LOGIN_URL,
-                    parse.quote(request.path))
-                return shortcuts.redirect(redirect_str)
-
-            return_url = decorator_kwargs.pop('return_url',
-                                              request.get_full_path())
-            user_oauth = googleoauth2django.UserOAuth2(request, scopes,
-                                                       return_url)
+            plan = planner.plan()
+            if (plan.login_prefix is not None and
+                    not request.user.is_authenticated):
+                metrics.inc(_DECORATOR_METRIC, decorator='oauth_required',
+                            outcome='login_redirect')
+                return shortcuts.redirect(
+                    plan.login_prefix + parse.quote(request.path))
+
+            user_oauth = googleoauth2django.UserOAuth2(
+                request, plan.scope_mask, plan.return_url)
             if not user_oauth.has_credentials():
+                metrics.inc(_DECORATOR_METRIC, decorator='oauth_required',
+                            outcome='authorize_redirect')
                 return shortcuts.redirect(user_oauth.get_authorize_redirect())
-            setattr(request, oauth2_settings.request_prefix,
-                    user_oauth)
+            metrics.inc(_DECORATOR_METRIC, decorator='oauth_required',
+                        outcome='authorized')
+            setattr(request, plan.request_attribute, user_oauth)
             return wrapped_function(request, *args, **kwargs)
 
         return required_wrapper
@@ -130,15 +202,17 @@ def oauth_enabled(decorated_function=None, scopes=None, **decorator_kwargs):
     Returns:
          The decorated view function.
     """
+    planner = _ViewPlanner(scopes, decorator_kwargs.get('return_url'))
+
     def curry_wrapper(wrapped_function):
         @wraps(wrapped_function)
         def enabled_wrapper(request, *args, **kwargs):
-            return_url = decorator_kwargs.pop('return_url',
-                                              request.get_full_path())
-            user_oauth = googleoauth2django.UserOAuth2(request, scopes,
-                                                       return_url)
-            setattr(request, get_oauth2_settings().request_prefix,
-                    user_oauth)
+            plan = planner.plan()
+            user_oauth = googleoauth2django.UserOAuth2(
+                request, plan.scope_mask, plan.return_url)
+            metrics.inc(_DECORATOR_METRIC, decorator='oauth_enabled',
+                        outcome='attached')
+            setattr(request, plan.request_attribute, user_oauth)
             return wrapped_function(request, *args, **kwargs)
 
         return enabled_wrapper
@@ -147,3 +221,62 @@ def oauth_enabled(decorated_function=None, scopes=None, **decorator_kwargs):
         return curry_wrapper(decorated_function)
     else:
         return curry_wrapper
+
+
+def bearer_required(decorated_function=None, require_user=False):
+    """ Decorator to require a valid Google bearer token for a view.
+
+    .. code-block:: python
+       :caption: views.py
+       :name: views_bearer
+
+       from googleoauth2django.decorators import bearer_required
+
+       @bearer_required(require_user=True)
+       def api_profile(request):
+           return JsonResponse({'username': request.user.username,
+                                'google_id': request.oauth_claims['sub']})
+
+    The verified claims of the token are available as
+    ``request.oauth_claims``, and the user linked to the token as
+    ``request.oauth_user``. If :class:`googleoauth2django.bearer.
+    BearerAuthenticationMiddleware` is installed, the token it verified is
+    reused.
+
+    Args:
+        decorated_function: View function to decorate.
+        require_user: If True, the token's Google account must also be linked
+           to a Django user that may log in. A user authenticated otherwise,
+           such as by a session, does not count.
+
+    Returns:
+        A 401 response if the token is missing or invalid, or not linked to
+        a user when ``require_user`` is set. Otherwise, the decorated view.
+    """
+    def curry_wrapper(wrapped_function):
+        @wraps(wrapped_function)
+        def bearer_wrapper(request, *args, **kwargs):
+            claims = getattr(request, 'oauth_claims', None)
+            if claims is None:
+                try:
+                    claims = bearer.authenticate(request)
+                except bearer.InvalidToken:
+                    claims = None
+            if claims is None or (
+                    require_user and
+                    getattr(request, 'oauth_user', None) is None):
+                metrics.inc(_DECORATOR_METRIC, decorator='bearer_required',
+                            outcome='unauthorized')
+                response = http.HttpResponse(status=401)
+                response['WWW-Authenticate'] = 'Bearer error="invalid_token"'
+                return response
+            metrics.inc(_DECORATOR_METRIC, decorator='bearer_required',
+                        outcome='authorized')
+            return wrapped_function(request, *args, **kwargs)
+
+        return bearer_wrapper
+
+    if decorated_function:
+        return curry_wrapper(decorated_function)
+    else:
+        return curry_wrapper
@@ -0,0 +1,191 @@
+# Copyright 2016 Google Inc.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cached API discovery documents and service objects.
+
+``googleapiclient.discovery.build`` fetches and parses the discovery document
+of an API every time it is called. :meth:`UserOAuth2.build_service
+<googleoauth2django.UserOAuth2.build_service>` instead keeps the parsed
+documents in a process-wide cache and builds each user's service object from
+it, so views only pay for the fetch and parse once per process:
+
+.. code-block:: python
+   :caption: views.py
+   :name: build_service
+
+   @oauth_required(scopes=['https://www.googleapis.com/auth/calendar'])
+   def calendar(request):
+       service = request.oauth.build_service('calendar', 'v3')
+       events = service.events().list(calendarId='primary').execute()
+
+Documents are kept for ``GOOGLE_OAUTH2_DISCOVERY_CACHE_TTL`` seconds (one day
+by default). If ``GOOGLE_OAUTH2_DISCOVERY_CACHE_DIR`` is set, they are also
+written to that directory, so new processes can skip the fetch as well.
+
+Building services requires the ``google-api-python-client`` package, which is
+imported on first use.
+"""
+
+import json
+import os
+import threading
+import time
+
+from googleoauth2django import metrics
+from googleoauth2django import stats
+from googleoauth2django import transport
+
+DISCOVERY_URI = ('https://www.googleapis.com/discovery/v1/apis/'
+                 '{api}/{apiVersion}/rest')
+V2_DISCOVERY_URI = ('https://{api}.googleapis.com/$discovery/rest?'
+                    'version={apiVersion}')
+DEFAULT_TTL = 24 * 60 * 60
+FETCH_TIMEOUT = 10
+
+_DISCOVERY_METRIC = 'googleoauth2django_discovery_total'
+
+_lock = threading.Lock()
+# Maps (name, version) to a tuple of the expiry time, the parsed document and
+# the document as a string.
+_documents = {}
+# Maps (name, version) to the lock held while the document is loaded, so a
+# slow fetch only delays the requests for the same API.
+_loading = {}
+
+
+def clear():
+    """Drops the parsed documents cached in this process."""
+    with _lock:
+        _documents.clear()
+
+
+def _cache_path(cache_dir, name, version):
+    return os.path.join(cache_dir, '{0}.{1}.json'.format(name, version))
+
+
+def _read_disk(cache_dir, name, version, ttl):
+    """Returns the document cached on disk as a tuple of the parsed document
+    and the string, or None if missing or stale."""
+    path = _cache_path(cache_dir, name, version)
+    try:
+        if os.path.getmtime(path) + ttl < time.time():
+            return None
+        with open(path) as cache_file:
+            content = cache_file.read()
+        return json.loads(content), content
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _write_disk(cache_dir, name, version, content):
+    """Atomically writes a fetched document to the disk cache."""
+    path = _cache_path(cache_dir, name, version)
+    tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    try:
+        with open(tmp_path, 'w') as cache_file:
+            cache_file.write(content)
+        os.replace(tmp_path, path)
+    except (IOError, OSError):
+        pass
+
+
+def _fetch(name, version):
+    """Fetches a discovery document from Google.
+
+    Returns:
+        The document as a string.
+    """
+    session = transport.get_session()
+    with stats.phase(stats.PHASE_GOOGLE):
+        for uri in (DISCOVERY_URI, V2_DISCOVERY_URI):
+            response = session.get(uri.format(api=name, apiVersion=version),
+                                   timeout=FETCH_TIMEOUT)
+            if response.status_code != 404:
+                break
+    response.raise_for_status()
+    return response.text
+
+
+def _get_entry(name, version, ttl, cache_dir):
+    """Returns the cache entry of a document, loading it if needed."""
+    key = (name, version)
+    now = time.time()
+    entry = _documents.get(key)
+    if entry is not None and entry[0] > now:
+        metrics.inc(_DISCOVERY_METRIC, result='memory')
+        return entry
+
+    with _lock:
+        loading = _loading.get(key)
+        if loading is None:
+            loading = _loading[key] = threading.Lock()
+
+    with loading:
+        entry = _documents.get(key)
+        if entry is not None and entry[0] > now:
+            return entry
+
+        loaded = None
+        if cache_dir is not None:
+            loaded = _read_disk(cache_dir, name, version, ttl)
+        if loaded is not None:
+            metrics.inc(_DISCOVERY_METRIC, result='disk')
+            document, content = loaded
+        else:
+            metrics.inc(_DISCOVERY_METRIC, result='fetched')
+            content = _fetch(name, version)
+            document = json.loads(content)
+            if cache_dir is not None:
+                _write_disk(cache_dir, name, version, content)
+
+        entry = _documents[key] = (now + ttl, document, content)
+        return entry
+
+
+def get_document(name, version, ttl=DEFAULT_TTL, cache_dir=None):
+    """Returns the parsed discovery document of an API.
+
+    Args:
+        name: The name of the API, for example ``'calendar'``.
+        version: The version of the API, for example ``'v3'``.
+        ttl: Seconds a document is reused before being fetched again.
+        cache_dir: Optional directory used as a second level cache.
+
+    Returns:
+        The discovery document as a dictionary. The dictionary is shared, so
+        it must not be modified.
+    """
+    return _get_entry(name, version, ttl, cache_dir)[1]
+
+
+def build(name, version, credentials, ttl=DEFAULT_TTL, cache_dir=None):
+    """Builds a service object for an API from the cached document.
+
+    Args:
+        name: The name of the API.
+        version: The version of the API.
+        credentials: The credentials used to authorize requests.
+        ttl: Seconds a document is reused before being fetched again.
+        cache_dir: Optional directory used as a second level cache.
+
+    Returns:
+        A ``googleapiclient.discovery.Resource``.
+    """
+    from googleapiclient import discovery
+
+    # The client modifies the document it is given, so it gets its own copy,
+    # parsed from the cached string.
+    return discovery.build_from_document(
+        _get_entry(name, version, ttl, cache_dir)[2],
+        credentials=credentials)
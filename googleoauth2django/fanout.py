@@ -0,0 +1,296 @@
+# Copyright 2016 Google Inc.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Concurrent Google API calls.
+
+:attr:`UserOAuth2.async_http <googleoauth2django.UserOAuth2.async_http>` is
+an asyncio counterpart to ``UserOAuth2.http``. Its requests carry the user's
+access token and run concurrently, so a page that aggregates several APIs
+waits for the slowest call instead of the sum of all of them:
+
+.. code-block:: python
+   :caption: views.py
+   :name: fanout
+
+   from googleoauth2django import fanout
+
+   @oauth_required
+   def dashboard(request):
+       http = request.oauth.async_http
+       calendar, drive = fanout.run(http.gather(
+           http.get(CALENDAR_EVENTS_URL),
+           http.get(DRIVE_FILES_URL),
+           deadline=2.0))
+
+The supported Django versions have no async views, so :func:`run` drives
+the event loop from a regular view. The requests themselves are sent from a
+process-wide thread pool over the shared connection pool of
+:mod:`googleoauth2django.transport`, so view authors do not manage threads.
+At most ``GOOGLE_OAUTH2_ASYNC_MAX_CONCURRENCY`` requests of a user are in
+flight at once, across all the requests and threads of the process, and
+never more than half of the pool, so a page fanning out widely leaves
+threads for the calls of other users.
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import contextvars
+import functools
+import threading
+
+from googleoauth2django import metrics
+from googleoauth2django import stats
+from googleoauth2django import transport
+
+# Half of the pool, see max_share().
+DEFAULT_MAX_CONCURRENCY = transport.POOL_MAXSIZE // 2
+TIMEOUT = 30
+
+_FANOUT_METRIC = 'googleoauth2django_fanout_seconds'
+
+_lock = threading.Lock()
+_executor = None
+# The loop time by which the requests of the current gather() must finish.
+_deadline = contextvars.ContextVar(
+    'googleoauth2django_fanout_deadline', default=None)
+
+
+def _get_executor():
+    """Returns the thread pool the requests are sent from."""
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=transport.POOL_MAXSIZE,
+                    thread_name_prefix='googleoauth2django-fanout')
+    return _executor
+
+
+def max_share():
+    """Returns the number of threads of the pool one user may use."""
+    return max(1, transport.POOL_MAXSIZE // 2)
+
+
+class _Limiter(object):
+    """Limits the requests in flight per key, across threads and their
+    event loops.
+
+    Waiters are woken in order, on their own loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Maps keys to the number of their requests in flight.
+        self._in_flight = {}
+        # Maps keys to a deque of the (loop, future) of their waiters.
+        self._waiters = {}
+
+    async def acquire(self, key, limit):
+        """Waits until a request of ``key`` may be sent."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            in_flight = self._in_flight.get(key, 0)
+            if in_flight < limit:
+                self._in_flight[key] = in_flight + 1
+                return
+            future = loop.create_future()
+            self._waiters.setdefault(key, collections.deque()).append(
+                (loop, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just before the cancellation.
+                self.release(key)
+            else:
+                with self._lock:
+                    waiters = self._waiters.get(key)
+                    if waiters is not None and (loop, future) in waiters:
+                        waiters.remove((loop, future))
+                        if not waiters:
+                            del self._waiters[key]
+            raise
+
+    def release(self, key):
+        """Hands the slot of a finished request to the next waiter."""
+        with self._lock:
+            waiters = self._waiters.get(key)
+            if waiters:
+                loop, future = waiters.popleft()
+                if not waiters:
+                    del self._waiters[key]
+                # The slot stays taken, by the waiter.
+                loop.call_soon_threadsafe(self._grant, key, future)
+                return
+            in_flight = self._in_flight[key] - 1
+            if in_flight:
+                self._in_flight[key] = in_flight
+            else:
+                del self._in_flight[key]
+
+    def _grant(self, key, future):
+        if future.cancelled():
+            self.release(key)
+        else:
+            future.set_result(None)
+
+    def in_flight(self, key):
+        """Returns the number of requests of ``key`` in flight."""
+        return self._in_flight.get(key, 0)
+
+
+_limiter = _Limiter()
+
+
+class DeadlineExceeded(Exception):
+    """Some requests did not finish before the deadline."""
+
+
+class AsyncHttp(object):
+    """Sends authorized requests concurrently.
+
+    Args:
+        token: The OAuth2 access token added to every request.
+        max_concurrency: The maximum number of requests of ``key`` in
+                         flight at once, at most :func:`max_share`.
+        session: Optional ``requests.Session``, defaults to the shared
+                 session of :mod:`googleoauth2django.transport`.
+        key: Optional hashable identifying the user, whose requests from
+             every ``AsyncHttp`` share the limit. Defaults to this client.
+    """
+
+    def __init__(self, token, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 session=None, key=None):
+        self.token = token
+        self.max_concurrency = min(max_concurrency, max_share())
+        self._session = session
+        self.key = key if key is not None else self
+
+    async def request(self, method, url, headers=None, timeout=TIMEOUT,
+                      **kwargs):
+        """Sends a request.
+
+        Inside :meth:`gather` with a deadline, the timeout is shortened to
+        the time left, so a thread of the pool is not kept waiting for a
+        server after the deadline passed.
+
+        Args:
+            method: The HTTP method.
+            url: The URL to request.
+            headers: Optional dictionary of extra headers.
+            timeout: Seconds to wait for the server.
+            kwargs: Passed on to ``requests.Session.request``.
+
+        Returns:
+            A ``requests.Response``.
+
+        Raises:
+            DeadlineExceeded: The deadline passed before the request was
+                              sent.
+        """
+        loop = asyncio.get_running_loop()
+        headers = dict(headers or {})
+        headers['Authorization'] = 'Bearer {0}'.format(self.token)
+        session = self._session or transport.get_session()
+        send = functools.partial(session.request, method, url,
+                                 headers=headers, **kwargs)
+        await _limiter.acquire(self.key, self.max_concurrency)
+        future = None
+        try:
+            deadline = _deadline.get()
+            if deadline is not None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise DeadlineExceeded(
+                        'Deadline passed before the request was sent.')
+                timeout = min(timeout, remaining)
+            send = functools.partial(send, timeout=timeout)
+            future = _get_executor().submit(send)
+            return await asyncio.wrap_future(future)
+        finally:
+            if future is None or future.done() or future.cancel():
+                _limiter.release(self.key)
+            else:
+                # Cancelled while a thread sends it: the slot is held until
+                # the thread is done, so a user cannot take more of the pool.
+                future.add_done_callback(
+                    lambda _: _limiter.release(self.key))
+
+    async def get(self, url, **kwargs):
+        """Sends a GET request, see :meth:`request`."""
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        """Sends a POST request, see :meth:`request`."""
+        return await self.request('POST', url, **kwargs)
+
+    async def gather(self, *requests, deadline=None,
+                     return_exceptions=False):
+        """Waits for requests sent concurrently.
+
+        Args:
+            requests: Coroutines returned by :meth:`request`.
+            deadline: Optional seconds to wait for all requests. Requests
+                      still pending then are cancelled.
+            return_exceptions: If True, failed and cancelled requests are
+                               returned as exceptions in the results instead
+                               of being raised.
+
+        Returns:
+            A list of the results, in the order of ``requests``.
+
+        Raises:
+            DeadlineExceeded: The deadline passed and ``return_exceptions``
+                              is False.
+        """
+        if not requests:
+            return []
+        if deadline is not None:
+            # Tasks copy the context they are created in.
+            token = _deadline.set(asyncio.get_running_loop().time() +
+                                  deadline)
+        try:
+            tasks = [asyncio.ensure_future(request) for request in requests]
+        finally:
+            if deadline is not None:
+                _deadline.reset(token)
+        with metrics.timer(_FANOUT_METRIC), stats.phase(stats.PHASE_GOOGLE):
+            _, pending = await asyncio.wait(tasks, timeout=deadline)
+        if pending:
+            for task in pending:
+                task.cancel()
+            await asyncio.wait(pending)
+
+        results = []
+        for task in tasks:
+            if not task.cancelled():
+                results.append(task.exception() or task.result())
+            elif task in pending:
+                results.append(DeadlineExceeded(
+                    'Request did not finish within {0}s.'.format(deadline)))
+            else:
+                results.append(asyncio.CancelledError())
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+        return results
+
+
+def run(coroutine):
+    """Runs ``coroutine`` to completion from synchronous code, such as a
+    view, and returns its result."""
+    return asyncio.run(coroutine)
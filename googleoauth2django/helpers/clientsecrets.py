@@ -16,9 +16,17 @@
 
 A client_secrets.json file contains all the information needed to interact with
 an OAuth 2.0 protected service.
+
+:class:`FileCache` keeps parsed files in process memory and reads a file
+again when it is replaced or rewritten, for example by a secret manager
+rotating the secret. :class:`DjangoCacheAdapter` lets a Django cache share
+the parsed files between the processes of a host.
 """
 
+import hashlib
 import json
+import os
+import threading
 
 import six
 
@@ -126,6 +134,107 @@ def _loadfile(filename):
     return _validate_clientsecrets(obj)
 
 
+class DjangoCacheAdapter(object):
+    """Gives a Django cache the interface of the caches of :func:`loadfile`.
+
+    Args:
+        alias: The name of the cache in ``CACHES``.
+        timeout: Seconds entries are kept for, or None for the default
+                 timeout of the cache.
+    """
+
+    def __init__(self, alias='default', timeout=None):
+        self.alias = alias
+        self.timeout = timeout
+
+    def _cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def get(self, key, namespace=''):
+        return self._cache().get('{0}:{1}'.format(namespace, key))
+
+    def set(self, key, value, namespace=''):
+        cache = self._cache()
+        timeout = self.timeout
+        if timeout is None:
+            timeout = cache.default_timeout
+        cache.set('{0}:{1}'.format(namespace, key), value, timeout)
+
+
+def _file_signature(filename):
+    """Returns a value that changes when a file is replaced or rewritten, or
+    None if the file cannot be found."""
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class FileCache(object):
+    """Caches parsed client secrets files in process memory until they
+    change.
+
+    A cached file is read again when its inode, modification time or size
+    changed, so a file rewritten or replaced by another one is picked up
+    without a restart. Looking a file up costs an ``os.stat`` call, never a
+    read.
+
+    Args:
+        shared: Optional cache with the interface of the caches of
+                :func:`loadfile`, such as a :class:`DjangoCacheAdapter`,
+                shared by processes. Its entries are keyed by the file name
+                and signature, so they never outlive the file.
+    """
+
+    def __init__(self, shared=None):
+        self.shared = shared
+        self._lock = threading.Lock()
+        # Maps file names to their signature and parsed contents.
+        self._entries = {}
+        # The signatures of files being read, taken before the read so that
+        # a file changed meanwhile is read again.
+        self._pending = {}
+
+    def changed(self, filename):
+        """Returns True if a file changed since it was cached, or was never
+        cached."""
+        entry = self._entries.get(filename)
+        return entry is None or entry[0] != _file_signature(filename)
+
+    def get(self, filename, namespace=''):
+        signature = _file_signature(filename)
+        entry = self._entries.get(filename)
+        if (entry is not None and signature is not None and
+                entry[0] == signature):
+            return entry[1]
+        with self._lock:
+            self._pending[filename] = signature
+        if self.shared is None or signature is None:
+            return None
+        value = self.shared.get(self._shared_key(filename, signature),
+                                namespace=namespace)
+        if value is not None:
+            self._entries[filename] = (signature, value)
+        return value
+
+    def set(self, filename, value, namespace=''):
+        with self._lock:
+            signature = self._pending.pop(filename, None)
+        if signature is None:
+            signature = _file_signature(filename)
+        self._entries[filename] = (signature, value)
+        if self.shared is not None and signature is not None:
+            self.shared.set(self._shared_key(filename, signature), value,
+                            namespace=namespace)
+
+    def _shared_key(self, filename, signature):
+        # File names can hold characters that are not valid in cache keys.
+        return hashlib.sha256(repr((filename, signature)).encode(
+            'utf-8')).hexdigest()
+
+
 def loadfile(filename, cache=None):
     """Loading of client_secrets JSON file, optionally backed by a cache.
 
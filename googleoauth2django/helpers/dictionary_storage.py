@@ -14,7 +14,15 @@
 
 """Dictionary storage for OAuth2 Credentials."""
 
-import jsonpickle
+import json
+
+from googleoauth2django import metrics
+from googleoauth2django import stats
+from googleoauth2django.helpers import session_codec
+
+_STORAGE_METRIC = 'googleoauth2django_storage_seconds'
+_CODEC_METRIC = 'googleoauth2django_codec_seconds'
+_SKIPPED_WRITES_METRIC = 'googleoauth2django_storage_writes_skipped_total'
 
 
 class Storage(object):
@@ -23,6 +31,10 @@ class Storage(object):
     Store and retrieve a single credential. This class supports locking
     such that multiple processes and threads can operate on a single
     store.
+
+    The storage remembers a fingerprint of the last credentials it loaded or
+    stored, and :meth:`put` skips the write when the credentials have not
+    changed since.
     """
     def __init__(self, lock=None):
         """Create a Storage instance.
@@ -33,6 +45,26 @@ class Storage(object):
                   re-entrant.
         """
         self._lock = lock
+        self._fingerprint = None
+
+    def fingerprint(self, credentials):
+        """Returns a value that changes whenever ``credentials`` change.
+
+        Args:
+            credentials: Credentials, the credentials to fingerprint.
+
+        Returns:
+            A string, or None if the credentials cannot be fingerprinted, in
+            which case they are always written.
+        """
+        if getattr(credentials, 'to_json', None) is None:
+            return None
+        # The fields the codec stores, ``to_json`` leaves out the ID token.
+        try:
+            data = session_codec.to_dict(credentials)
+        except (AttributeError, TypeError):
+            return None
+        return json.dumps(data, sort_keys=True, default=str)
 
     def acquire_lock(self):
         """Acquires any lock necessary to access this Storage.
@@ -88,7 +120,12 @@ class Storage(object):
         """
         self.acquire_lock()
         try:
-            return self.locked_get()
+            with metrics.timer(_STORAGE_METRIC, operation='get',
+                               backend=type(self).__name__), \
+                    stats.phase(stats.PHASE_STORAGE):
+                credentials = self.locked_get()
+            self._fingerprint = self.fingerprint(credentials)
+            return credentials
         finally:
             self.release_lock()
 
@@ -102,7 +139,16 @@ class Storage(object):
         """
         self.acquire_lock()
         try:
-            self.locked_put(credentials)
+            fingerprint = self.fingerprint(credentials)
+            if fingerprint is not None and fingerprint == self._fingerprint:
+                metrics.inc(_SKIPPED_WRITES_METRIC,
+                            backend=type(self).__name__)
+                return
+            with metrics.timer(_STORAGE_METRIC, operation='put',
+                               backend=type(self).__name__), \
+                    stats.phase(stats.PHASE_STORAGE):
+                self.locked_put(credentials)
+            self._fingerprint = fingerprint
         finally:
             self.release_lock()
 
@@ -117,7 +163,11 @@ class Storage(object):
         """
         self.acquire_lock()
         try:
-            return self.locked_delete()
+            self._fingerprint = None
+            with metrics.timer(_STORAGE_METRIC, operation='delete',
+                               backend=type(self).__name__), \
+                    stats.phase(stats.PHASE_STORAGE):
+                return self.locked_delete()
         finally:
             self.release_lock()
 
@@ -132,13 +182,17 @@ class DictionaryStorage(Storage):
         lock: An optional threading.Lock-like object. The lock will be
               acquired before anything is written or read from the
               dictionary.
+        compress: If True, the credentials are stored as a compressed
+                  string rather than a dictionary. See
+                  :mod:`googleoauth2django.helpers.session_codec`.
     """
 
-    def __init__(self, dictionary, key, lock=None):
+    def __init__(self, dictionary, key, lock=None, compress=False):
         """Construct a DictionaryStorage instance."""
         super(DictionaryStorage, self).__init__(lock=lock)
         self._dictionary = dictionary
         self._key = key
+        self._compress = compress
 
     def locked_get(self):
         """Retrieve the credentials from the dictionary, if they exist.
@@ -150,7 +204,10 @@ class DictionaryStorage(Storage):
         if serialized is None:
             return None
 
-        credentials = jsonpickle.decode(serialized)
+        with metrics.timer(_CODEC_METRIC, codec='session',
+                           operation='decode'), \
+                stats.phase(stats.PHASE_DECODE):
+            credentials = session_codec.decode(serialized)
 
         return credentials
 
@@ -161,7 +218,11 @@ class DictionaryStorage(Storage):
             credentials: A :class:`google.oauth2.credentials.Credentials`
                          instance.
         """
-        serialized = jsonpickle.encode(credentials)
+        with metrics.timer(_CODEC_METRIC, codec='session',
+                           operation='encode'), \
+                stats.phase(stats.PHASE_ENCODE):
+            serialized = session_codec.encode(credentials,
+                                              compress=self._compress)
         self._dictionary[self._key] = serialized
 
     def locked_delete(self):
@@ -0,0 +1,138 @@
+# Copyright 2016 Google Inc.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compact session representation of credentials.
+
+Credentials are stored in the session as a plain dictionary holding only the
+fields needed to rebuild them, so Django's session serializer encodes them
+once instead of wrapping an already encoded jsonpickle string.
+
+The dictionary can also be stored as a compressed string, which is worth it
+for session backends that store the session uncompressed, such as the
+database, cache and file backends. The signed cookie backend already
+compresses the whole session, so compressing the credentials again makes the
+cookie larger. ``scripts/bench_session_format.py`` compares the formats.
+
+:func:`decode` reads all three forms, including the jsonpickle strings
+written by earlier versions.
+"""
+
+import base64
+import datetime
+import json
+import zlib
+
+FORMAT_VERSION = 1
+COMPRESSED_PREFIX = 'z1:'
+
+# The public attributes of the credentials stored under their own name.
+_FIELDS = ('token', 'refresh_token', 'id_token', 'token_uri', 'client_id',
+           'client_secret', 'scopes', 'default_scopes', 'granted_scopes',
+           'quota_project_id', 'rapt_token', 'account')
+_LIST_FIELDS = frozenset(['scopes', 'default_scopes', 'granted_scopes'])
+# Constructor arguments without a public attribute, stored when they differ
+# from their default.
+_PRIVATE_FIELDS = (('enable_reauth_refresh', '_enable_reauth_refresh', False),
+                   ('trust_boundary', '_trust_boundary', None),
+                   ('universe_domain', '_universe_domain', 'googleapis.com'))
+_EXPIRY_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def to_dict(credentials):
+    """Converts credentials to their compact dictionary form.
+
+    Args:
+        credentials: A :class:`google.oauth2.credentials.Credentials`
+                     instance.
+
+    Returns:
+        A JSON serializable dictionary. Fields that are not set are left out.
+    """
+    data = {'v': FORMAT_VERSION}
+    for field in _FIELDS:
+        value = getattr(credentials, field, None)
+        if value is not None:
+            data[field] = list(value) if field in _LIST_FIELDS else value
+    for field, attribute, default in _PRIVATE_FIELDS:
+        value = getattr(credentials, attribute, default)
+        if value != default:
+            data[field] = value
+    if credentials.expiry is not None:
+        data['expiry'] = credentials.expiry.strftime(_EXPIRY_FORMAT)
+    return data
+
+
+def from_dict(data):
+    """Rebuilds credentials from their compact dictionary form.
+
+    Args:
+        data: A dictionary returned by :func:`to_dict`.
+
+    Returns:
+        A :class:`google.oauth2.credentials.Credentials` instance.
+    """
+    from google.oauth2 import credentials
+
+    expiry = data.get('expiry')
+    if expiry is not None:
+        expiry = datetime.datetime.strptime(expiry, _EXPIRY_FORMAT)
+    # Only the fields that are set are passed, so that dictionaries written
+    # without the newer fields load with older versions of google-auth.
+    kwargs = {field: data[field] for field in _FIELDS if field in data}
+    kwargs.update((field, data[field]) for field, _, _ in _PRIVATE_FIELDS
+                  if field in data)
+    kwargs.pop('token', None)
+    return credentials.Credentials(data.get('token'), expiry=expiry, **kwargs)
+
+
+def encode(credentials, compress=False):
+    """Encodes credentials for storage in a session.
+
+    Args:
+        credentials: A :class:`google.oauth2.credentials.Credentials`
+                     instance.
+        compress: If True, returns a compressed string instead of a
+                  dictionary.
+
+    Returns:
+        A dictionary, or a string starting with ``COMPRESSED_PREFIX``.
+    """
+    data = to_dict(credentials)
+    if not compress:
+        return data
+    payload = zlib.compress(
+        json.dumps(data, separators=(',', ':')).encode('utf-8'), 9)
+    return COMPRESSED_PREFIX + base64.urlsafe_b64encode(payload).decode(
+        'ascii')
+
+
+def decode(value):
+    """Decodes credentials stored by :func:`encode` or by jsonpickle.
+
+    Args:
+        value: The value read from the session.
+
+    Returns:
+        A :class:`google.oauth2.credentials.Credentials` instance.
+    """
+    if isinstance(value, dict):
+        return from_dict(value)
+    if value.startswith(COMPRESSED_PREFIX):
+        payload = base64.urlsafe_b64decode(value[len(COMPRESSED_PREFIX):])
+        return from_dict(json.loads(zlib.decompress(payload).decode('utf-8')))
+
+    # Written by an earlier version of the helper. jsonpickle is expensive
+    # to import, so it is only loaded for these.
+    import jsonpickle
+    return jsonpickle.decode(value)
@@ -0,0 +1,81 @@
+# Copyright 2016 Google Inc.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Runs the token broker of the host, see :mod:`googleoauth2django.broker`.
+
+.. code-block:: bash
+
+   python manage.py oauth2_broker [--socket PATH]
+
+The broker listens on the socket of ``GOOGLE_OAUTH2_BROKER`` until it is
+interrupted, and should be run by the same user as the web workers, by the
+process manager that runs them.
+"""
+
+from django.core.management import base
+
+import googleoauth2django
+from googleoauth2django import broker
+from googleoauth2django import storage
+
+
+def make_storage_factory():
+    """Returns a function building the ORM storage of a broker key, see
+    :func:`googleoauth2django.broker_key`."""
+    oauth2_settings = googleoauth2django.get_oauth2_settings()
+    model_class = googleoauth2django.get_storage_model_class()
+    tenant_property = oauth2_settings.storage_model_tenant_property
+
+    def make_storage(key):
+        user_pk, storage_key = googleoauth2django.parse_broker_key(key)
+        extra_keys = {}
+        if oauth2_settings.tenants is not None and tenant_property:
+            extra_keys[tenant_property] = storage_key
+        return storage.DjangoORMStorage(
+            model_class, oauth2_settings.storage_model_user_property,
+            user_pk, oauth2_settings.storage_model_credentials_property,
+            using=oauth2_settings.storage_model_using,
+            extra_keys=extra_keys)
+    return make_storage
+
+
+class Command(base.BaseCommand):
+    help = 'Refreshes the access tokens of the web workers of this host.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--socket',
+            help='Path of the Unix socket, defaults to the socket of '
+                 'GOOGLE_OAUTH2_BROKER.')
+
+    def handle(self, *args, **options):
+        oauth2_settings = googleoauth2django.get_oauth2_settings()
+        path = options['socket'] or (oauth2_settings.broker or {}).get(
+            'socket')
+        if not path:
+            raise base.CommandError(
+                'Pass --socket, or set GOOGLE_OAUTH2_BROKER.')
+        if not oauth2_settings.storage_model:
+            raise base.CommandError(
+                'The broker requires GOOGLE_OAUTH2_STORAGE_MODEL.')
+
+        server = broker.BrokerServer(
+            path, broker.Broker(make_storage_factory()))
+        self.stdout.write('Listening on {0}.'.format(path))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
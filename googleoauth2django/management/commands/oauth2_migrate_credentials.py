@@ -0,0 +1,334 @@
+# Copyright 2016 Google Inc.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Rewrites stored credentials in the format of their ``CredentialsField``.
+
+After changing the ``codec`` of a
+:class:`googleoauth2django.models.CredentialsField`, rows written in the old
+format stay readable but keep their old encoding until the credentials are
+next stored. This command rewrites them all, including pickle values written
+by the oldest versions:
+
+.. code-block:: bash
+
+   python manage.py oauth2_migrate_credentials --chunk-size 1000 \\
+       --workers 4 --checkpoint /tmp/credentials.checkpoint
+
+Primary keys are streamed from a server-side cursor, and each chunk of rows
+is read, re-encoded and written with ``bulk_update`` in its own short
+transaction with the rows locked, so the table can be migrated while the
+site is running and is never loaded into memory. Rows already in the target
+format are not written.
+
+With ``--checkpoint``, the primary key ranges and the last key migrated in
+each of them are recorded after every chunk, and a command run again with the
+same checkpoint resumes those ranges where it stopped. ``--workers``
+migrates that many primary key ranges in parallel, on databases that allow
+concurrent writers; separate processes can also be given ranges with
+``--start-pk`` and ``--end-pk``.
+Rows are read and written on the ``using`` database of
+``GOOGLE_OAUTH2_STORAGE_MODEL``, or the one given with ``--database``, and
+otherwise on the database the routers pick for writes to the model.
+Progress and throughput are reported after every chunk.
+
+Ranges and checkpoints are computed on the primary key, which must therefore
+be an integer, such as the default ``AutoField``; the command refuses other
+models. The keys need not be contiguous. Rows inserted behind a checkpoint
+while the command runs are not visited, but they are written in the field's
+current format anyway.
+"""
+
+import concurrent.futures
+import importlib
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.core import exceptions
+from django.core.management import base
+from django.db import connections
+from django.db import models
+from django.db import router
+from django.db import transaction
+
+import googleoauth2django
+from googleoauth2django import models as oauth2_models
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+class Checkpoint(object):
+    """The last primary key migrated in each range, kept in a JSON file.
+
+    Args:
+        path: The path of the checkpoint file, or None to keep the progress
+              in memory only.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._progress = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as checkpoint_file:
+                self._progress = json.load(checkpoint_file)
+
+    @staticmethod
+    def _key(start, end):
+        return '{0}:{1}'.format(start, end)
+
+    def ranges(self):
+        """Returns the ranges recorded in the checkpoint, sorted."""
+        return sorted(tuple(int(pk) for pk in key.split(':'))
+                      for key in self._progress)
+
+    def get(self, start, end):
+        """Returns the last primary key migrated in a range, or None."""
+        return self._progress.get(self._key(start, end))
+
+    def set(self, start, end, pk):
+        """Records that a range was migrated up to ``pk``."""
+        with self._lock:
+            self._progress[self._key(start, end)] = pk
+            if self.path is None:
+                return
+            # Written atomically so an interrupted command leaves a valid
+            # checkpoint behind.
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, temp_path = tempfile.mkstemp(dir=directory)
+            with os.fdopen(fd, 'w') as temp_file:
+                json.dump(self._progress, temp_file)
+            os.replace(temp_path, self.path)
+
+
+def _is_integer_pk(model_class):
+    """Returns True if the primary key of a model is an integer."""
+    field = model_class._meta.pk
+    # A primary key may be a one-to-one link to another model's key.
+    while field.is_relation:
+        field = field.target_field
+    return isinstance(field, (models.AutoField, models.IntegerField))
+
+
+def split_range(start, end, parts):
+    """Splits the primary keys from ``start`` to ``end`` into ranges.
+
+    Args:
+        start: The first primary key.
+        end: The last primary key.
+        parts: The number of ranges.
+
+    Returns:
+        A list of at most ``parts`` ``(start, end)`` tuples covering the keys,
+        both ends included.
+    """
+    size = max(1, -(-(end - start + 1) // parts))
+    return [(low, min(low + size - 1, end))
+            for low in range(start, end + 1, size)]
+
+
+def migrate_chunk(model_class, field, pks, dry_run=False, using=None):
+    """Rewrites the rows of a chunk that are not in the field's format.
+
+    Args:
+        model_class: The model storing the credentials.
+        field: The :class:`~googleoauth2django.models.CredentialsField`.
+        pks: The primary keys of the chunk.
+        dry_run: If True, the rows are not written.
+        using: Optional database alias, defaults to the database of writes
+               to the model.
+
+    Returns:
+        The number of rows that were, or would have been, rewritten.
+    """
+    using = using or router.db_for_write(model_class)
+    objects = model_class.objects.using(using)
+    with transaction.atomic(using=using):
+        # The raw column values, so rows are only decoded when needed.
+        rows = (objects.select_for_update()
+                .filter(pk__in=pks)
+                .annotate(raw_credentials=models.ExpressionWrapper(
+                    models.F(field.attname),
+                    output_field=models.BinaryField()))
+                .values_list('pk', 'raw_credentials'))
+        stale = [
+            model_class(pk=pk, **{field.attname: field.to_python(raw)})
+            for pk, raw in rows
+            if raw is not None and
+            oauth2_models.stored_codec(raw) != field.codec]
+        if stale and not dry_run:
+            objects.bulk_update(stale, [field.name])
+    return len(stale)
+
+
+class Command(base.BaseCommand):
+    help = ('Rewrites stored credentials in the format of their '
+            'CredentialsField.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model',
+            help='Dotted path of the model, defaults to the model of '
+                 'GOOGLE_OAUTH2_STORAGE_MODEL.')
+        parser.add_argument(
+            '--field',
+            help='Name of the CredentialsField, defaults to the '
+                 'credentials_property of GOOGLE_OAUTH2_STORAGE_MODEL.')
+        parser.add_argument(
+            '--database',
+            help='Database alias, defaults to the using alias of '
+                 'GOOGLE_OAUTH2_STORAGE_MODEL, or to the database routers.')
+        parser.add_argument('--chunk-size', type=int,
+                            default=DEFAULT_CHUNK_SIZE,
+                            help='Rows read and written at once.')
+        parser.add_argument('--start-pk', type=int,
+                            help='First primary key to migrate.')
+        parser.add_argument('--end-pk', type=int,
+                            help='Last primary key to migrate.')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Primary key ranges migrated in parallel.')
+        parser.add_argument('--checkpoint',
+                            help='File recording progress, to resume from.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Count the rows to rewrite without '
+                                 'writing them.')
+
+    def handle(self, *args, **options):
+        model_class, field = self._get_field(options['model'],
+                                             options['field'])
+        oauth2_settings = googleoauth2django.get_oauth2_settings()
+        using = options['database']
+        if using is None and options['model'] in (
+                None, oauth2_settings.storage_model):
+            using = oauth2_settings.storage_model_using
+        using = using or router.db_for_write(model_class)
+        if not _is_integer_pk(model_class):
+            raise base.CommandError(
+                '{0} has a {1} primary key, only models with an integer '
+                'primary key can be migrated.'.format(
+                    model_class.__name__,
+                    model_class._meta.pk.get_internal_type()))
+        if options['workers'] > 1 and connections[using].vendor == 'sqlite':
+            raise base.CommandError(
+                'SQLite allows a single writer, --workers must be 1.')
+        self.model_class = model_class
+        self.field = field
+        self.using = using
+        self.chunk_size = options['chunk_size']
+        self.dry_run = options['dry_run']
+        # A dry run neither writes nor resumes a checkpoint.
+        self.checkpoint = Checkpoint(
+            None if self.dry_run else options['checkpoint'])
+        self._output_lock = threading.Lock()
+
+        bounds = model_class.objects.using(using).aggregate(
+            start=models.Min('pk'), end=models.Max('pk'))
+        start = options['start_pk']
+        end = options['end_pk']
+        start = bounds['start'] if start is None else start
+        end = bounds['end'] if end is None else end
+        if start is None or end is None or start > end:
+            self.stdout.write('No credentials to migrate.')
+            return
+
+        began = time.perf_counter()
+        # Resuming keeps the ranges of the first run, even if rows were added
+        # since.
+        ranges = self.checkpoint.ranges()
+        if not ranges:
+            ranges = split_range(start, end, max(1, options['workers']))
+            for range_start, range_end in ranges:
+                self.checkpoint.set(range_start, range_end, None)
+        if len(ranges) == 1:
+            totals = [self._migrate_range(*ranges[0])]
+        else:
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=len(ranges)) as executor:
+                totals = list(executor.map(
+                    lambda bounds: self._migrate_range(*bounds), ranges))
+
+        scanned = sum(total[0] for total in totals)
+        rewritten = sum(total[1] for total in totals)
+        elapsed = time.perf_counter() - began
+        self.stdout.write(self.style.SUCCESS(
+            '{0} {1} of {2} rows to {3} in {4:.1f}s ({5:.0f} rows/s).'.format(
+                'Would rewrite' if self.dry_run else 'Rewrote', rewritten,
+                scanned, field.codec, elapsed,
+                scanned / elapsed if elapsed else 0)))
+
+    def _get_field(self, model_path, field_name):
+        """Returns the model and its CredentialsField to migrate."""
+        oauth2_settings = googleoauth2django.get_oauth2_settings()
+        model_path = model_path or oauth2_settings.storage_model
+        field_name = (field_name or
+                      oauth2_settings.storage_model_credentials_property)
+        if not model_path or not field_name:
+            raise base.CommandError(
+                'Pass --model and --field, or set '
+                'GOOGLE_OAUTH2_STORAGE_MODEL.')
+        try:
+            module_name, class_name = model_path.rsplit('.', 1)
+            model_class = getattr(importlib.import_module(module_name),
+                                  class_name)
+            field = model_class._meta.get_field(field_name)
+        except (ImportError, AttributeError, ValueError,
+                exceptions.FieldDoesNotExist) as error:
+            raise base.CommandError(str(error))
+        if not isinstance(field, oauth2_models.CredentialsField):
+            raise base.CommandError(
+                '{0}.{1} is not a CredentialsField.'.format(model_path,
+                                                            field_name))
+        return model_class, field
+
+    def _migrate_range(self, start, end):
+        """Migrates the rows with primary keys from ``start`` to ``end``.
+
+        Returns:
+            A tuple of the numbers of rows scanned and rewritten.
+        """
+        try:
+            last_pk = self.checkpoint.get(start, end)
+            queryset = self.model_class.objects.using(self.using).filter(
+                pk__lte=end)
+            if last_pk is None:
+                queryset = queryset.filter(pk__gte=start)
+            else:
+                queryset = queryset.filter(pk__gt=last_pk)
+            pks = (queryset.order_by('pk').values_list('pk', flat=True)
+                   .iterator(chunk_size=self.chunk_size))
+
+            scanned = rewritten = 0
+            began = time.perf_counter()
+            while True:
+                chunk = list(itertools.islice(pks, self.chunk_size))
+                if not chunk:
+                    break
+                rewritten += migrate_chunk(self.model_class, self.field,
+                                           chunk, self.dry_run, self.using)
+                scanned += len(chunk)
+                self.checkpoint.set(start, end, chunk[-1])
+                elapsed = time.perf_counter() - began
+                with self._output_lock:
+                    self.stdout.write(
+                        'pk {0}-{1}: {2} rows scanned, {3} rewritten, '
+                        '{4:.0f} rows/s'.format(
+                            start, end, scanned, rewritten,
+                            scanned / elapsed if elapsed else 0))
+            return scanned, rewritten
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                connections.close_all()
@@ -0,0 +1,205 @@
+# Copyright 2016 Google Inc.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Access tokens of the ambient service account on Compute Engine and GKE.
+
+On Google Cloud, the metadata server hands out access tokens for the service
+account the instance runs as, so no key file needs to be deployed:
+
+.. code-block:: python
+   :caption: views.py
+   :name: metadata
+
+   from googleoauth2django import metadata
+
+   def report(request):
+       token = metadata.get_token_source().token()
+
+Token sources are shared by the whole process. A token is cached until
+``REFRESH_MARGIN`` seconds before it expires, and concurrent requests for an
+expired token wait for a single call to the metadata server, so under load
+a token is fetched once per expiry window rather than once per request. The
+calls go through the pooled connections of
+:mod:`googleoauth2django.transport`, which keep the connection to the
+metadata server open.
+
+The metadata server is found at ``GCE_METADATA_ROOT`` if that environment
+variable is set, as with ``google.auth`` and ``oauth2client``.
+"""
+
+import datetime
+import os
+import threading
+import time
+
+from google.auth import credentials as google_credentials
+
+from googleoauth2django import metrics
+from googleoauth2django import stats
+from googleoauth2django import transport
+
+METADATA_ROOT = 'http://{0}/computeMetadata/v1/'.format(
+    os.getenv('GCE_METADATA_ROOT', 'metadata.google.internal'))
+METADATA_HEADERS = {'Metadata-Flavor': 'Google'}
+TIMEOUT = 3
+# Cached tokens are fetched again when they expire within this many seconds.
+REFRESH_MARGIN = 60
+
+_TOKEN_METRIC = 'googleoauth2django_metadata_token_total'
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+_lock = threading.Lock()
+_sources = {}
+
+
+class MetadataError(Exception):
+    """The metadata server did not return a token."""
+
+
+def get(path, root=METADATA_ROOT, params=None, session=None):
+    """Fetches a resource from the metadata server.
+
+    Args:
+        path: The path of the resource, such as
+              ``'instance/service-accounts/default/email'``.
+        root: The URL of the metadata server root.
+        params: Optional dictionary of query parameters.
+        session: Optional ``requests.Session``, defaults to the shared
+                 session of :mod:`googleoauth2django.transport`.
+
+    Returns:
+        A dictionary for JSON resources, otherwise a string.
+
+    Raises:
+        MetadataError: The metadata server could not be reached or returned
+                       an error.
+    """
+    import requests
+
+    session = session or transport.get_session()
+    try:
+        with stats.phase(stats.PHASE_GOOGLE):
+            response = session.get(root + path, params=params,
+                                   headers=METADATA_HEADERS, timeout=TIMEOUT)
+    except requests.RequestException as error:
+        raise MetadataError(str(error))
+    if response.status_code != 200:
+        raise MetadataError('Failed to retrieve {0} from the metadata '
+                            'server: {1}'.format(path, response.status_code))
+    if response.headers.get('Content-Type', '').startswith(
+            'application/json'):
+        return response.json()
+    return response.text
+
+
+class TokenSource(object):
+    """Caches the access tokens of a service account of the instance.
+
+    Args:
+        service_account: The email of the service account, or ``'default'``.
+        scopes: Optional scopes to request, instead of the scopes of the
+                instance.
+        root: The URL of the metadata server root.
+        session: Optional ``requests.Session``.
+    """
+
+    def __init__(self, service_account='default', scopes=None,
+                 root=METADATA_ROOT, session=None):
+        self.service_account = service_account
+        self.scopes = tuple(scopes) if scopes else None
+        self.root = root
+        self.session = session
+        self._lock = threading.Lock()
+        # A tuple of the expiry and the token.
+        self._token = None
+
+    def _fetch(self):
+        params = {'scopes': ','.join(self.scopes)} if self.scopes else None
+        data = get('instance/service-accounts/{0}/token'.format(
+            self.service_account), self.root, params, self.session)
+        if not isinstance(data, dict) or 'access_token' not in data:
+            raise MetadataError('Unexpected token response.')
+        return time.time() + data['expires_in'], data['access_token']
+
+    def token_with_expiry(self):
+        """Returns an access token and its expiry as a POSIX timestamp.
+
+        Raises:
+            MetadataError: The token could not be fetched.
+        """
+        cached = self._token
+        if cached is not None and cached[0] - REFRESH_MARGIN > time.time():
+            metrics.inc(_TOKEN_METRIC, result='cached')
+            return cached[1], cached[0]
+
+        # Only one thread calls the metadata server; the others wait for it
+        # and then read the new token.
+        with self._lock:
+            cached = self._token
+            if (cached is not None and
+                    cached[0] - REFRESH_MARGIN > time.time()):
+                metrics.inc(_TOKEN_METRIC, result='cached')
+                return cached[1], cached[0]
+            self._token = cached = self._fetch()
+        metrics.inc(_TOKEN_METRIC, result='fetched')
+        return cached[1], cached[0]
+
+    def token(self):
+        """Returns an access token, see :meth:`token_with_expiry`."""
+        return self.token_with_expiry()[0]
+
+    def credentials(self):
+        """Returns ``google.auth`` credentials using the cached tokens."""
+        return MetadataCredentials(self)
+
+
+class MetadataCredentials(google_credentials.Credentials):
+    """``google.auth`` credentials refreshed from a :class:`TokenSource`."""
+
+    def __init__(self, source):
+        super(MetadataCredentials, self).__init__()
+        self.source = source
+
+    def refresh(self, request):
+        self.token, expiry = self.source.token_with_expiry()
+        # google.auth compares naive UTC datetimes.
+        self.expiry = _EPOCH + datetime.timedelta(
+            seconds=expiry - REFRESH_MARGIN)
+
+
+def get_token_source(service_account='default', scopes=None):
+    """Returns the process-wide token source of a service account.
+
+    Args:
+        service_account: The email of the service account, or ``'default'``.
+        scopes: Optional scopes to request.
+
+    Returns:
+        A :class:`TokenSource`.
+    """
+    key = (service_account, tuple(sorted(scopes)) if scopes else None)
+    source = _sources.get(key)
+    if source is None:
+        with _lock:
+            source = _sources.get(key)
+            if source is None:
+                source = _sources[key] = TokenSource(service_account,
+                                                     scopes)
+    return source
+
+
+def clear():
+    """Drops the process-wide token sources and their tokens."""
+    with _lock:
+        _sources.clear()
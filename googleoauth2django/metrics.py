@@ -0,0 +1,291 @@
+# Copyright 2016 Google Inc.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Metrics instrumentation for the Django OAuth2 Helper.
+
+The views, decorators, storage and model field report counters and latency
+histograms through a pluggable :class:`Exporter`. Instrumentation is off by
+default; while no exporter is configured every hook returns immediately.
+
+To enable the built-in in-memory exporter:
+
+.. code-block:: python
+   :caption: settings.py
+   :name: metrics_exporter
+
+   GOOGLE_OAUTH2_METRICS_EXPORTER = True
+   # or the dotted path of an Exporter subclass:
+   # GOOGLE_OAUTH2_METRICS_EXPORTER = 'myapp.metrics.StatsdExporter'
+
+The in-memory exporter can be scraped in the Prometheus text format by
+routing :func:`prometheus_view`. It is not part of the default
+``site.urls`` since it should usually not be exposed publicly.
+
+.. code-block:: python
+   :caption: urls.py
+   :name: metrics_urls
+
+   from googleoauth2django import metrics
+
+   urlpatterns += [url(r'^internal/oauth2-metrics$', metrics.prometheus_view)]
+
+Reported metrics:
+
+* ``googleoauth2django_authorize_redirects_total{target}``
+* ``googleoauth2django_callback_total{result}``
+* ``googleoauth2django_token_exchange_seconds``
+* ``googleoauth2django_storage_seconds{backend,operation}``
+* ``googleoauth2django_codec_seconds{codec,operation}``
+* ``googleoauth2django_has_credentials_total{result}``
+* ``googleoauth2django_decorator_total{decorator,outcome}``
+* ``googleoauth2django_warmup_seconds{step}``
+* ``googleoauth2django_negative_cache_total{result}``
+* ``googleoauth2django_storage_writes_skipped_total{backend}``
+* ``googleoauth2django_discovery_total{result}``
+* ``googleoauth2django_batch_seconds``
+* ``googleoauth2django_fanout_seconds``
+* ``googleoauth2django_tokeninfo_total{result}``
+* ``googleoauth2django_service_account_tokens_total{result}``
+* ``googleoauth2django_metadata_token_total{result}``
+* ``googleoauth2django_shared_token_cache_total{result}``
+* ``googleoauth2django_broker_total{result}``
+* ``googleoauth2django_broker_refresh_total{result}``
+"""
+
+import bisect
+import importlib
+import threading
+import time
+
+from django import http
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_exporter = None
+
+
+class Exporter(object):
+    """Base class for metrics exporters.
+
+    Exporters receive already-normalized labels, a tuple of ``(name, value)``
+    pairs sorted by name.
+    """
+
+    def inc(self, name, labels, value=1):
+        """Increments the counter ``name`` by ``value``."""
+        raise NotImplementedError
+
+    def observe(self, name, labels, value):
+        """Records ``value`` in the histogram ``name``."""
+        raise NotImplementedError
+
+
+class InMemoryExporter(Exporter):
+    """Thread-safe exporter that keeps all metrics in process memory.
+
+    Args:
+        buckets: Upper bounds, in seconds, of the histogram buckets.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                # Bucket counts, with a trailing +Inf bucket, sum and count.
+                histogram = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self.histograms[key] = histogram
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def counter_value(self, name, **labels):
+        """Returns the current value of a counter, 0 if never incremented."""
+        return self.counters.get((name, _normalize(labels)), 0)
+
+    def histogram_count(self, name, **labels):
+        """Returns the number of observations recorded in a histogram."""
+        histogram = self.histograms.get((name, _normalize(labels)))
+        return 0 if histogram is None else histogram[2]
+
+    def reset(self):
+        """Drops all recorded values."""
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+def _normalize(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def _format_labels(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ''
+    return '{{{0}}}'.format(','.join(
+        '{0}="{1}"'.format(name, _escape(value)) for name, value in pairs))
+
+
+def render_prometheus(exporter):
+    """Renders an :class:`InMemoryExporter` in the Prometheus text format.
+
+    Args:
+        exporter: The :class:`InMemoryExporter` to render.
+
+    Returns:
+        The metrics as a string.
+    """
+    with exporter._lock:
+        counters = sorted(exporter.counters.items())
+        histograms = sorted((key, (list(value[0]), value[1], value[2]))
+                            for key, value in exporter.histograms.items())
+
+    lines = []
+    typed = set()
+    for (name, labels), value in counters:
+        if name not in typed:
+            typed.add(name)
+            lines.append('# TYPE {0} counter'.format(name))
+        lines.append('{0}{1} {2}'.format(name, _format_labels(labels), value))
+
+    for (name, labels), (buckets, total, count) in histograms:
+        if name not in typed:
+            typed.add(name)
+            lines.append('# TYPE {0} histogram'.format(name))
+        cumulative = 0
+        bounds = [repr(bound) for bound in exporter.buckets] + ['+Inf']
+        for bound, bucket_count in zip(bounds, buckets):
+            cumulative += bucket_count
+            lines.append('{0}_bucket{1} {2}'.format(
+                name, _format_labels(labels, (('le', bound),)), cumulative))
+        lines.append('{0}_sum{1} {2!r}'.format(
+            name, _format_labels(labels), total))
+        lines.append('{0}_count{1} {2}'.format(
+            name, _format_labels(labels), count))
+
+    return '\n'.join(lines) + '\n'
+
+
+def prometheus_view(request):
+    """View exposing the in-memory metrics in the Prometheus text format.
+
+    Args:
+        request: The Django request object.
+
+    Returns:
+        A plain text response, or a 404 if the configured exporter is not an
+        :class:`InMemoryExporter`.
+    """
+    exporter = _exporter
+    if not isinstance(exporter, InMemoryExporter):
+        raise http.Http404('In-memory metrics exporter is not enabled.')
+    return http.HttpResponse(render_prometheus(exporter),
+                             content_type='text/plain; version=0.0.4')
+
+
+def set_exporter(exporter):
+    """Installs ``exporter`` process-wide. ``None`` disables metrics."""
+    global _exporter
+    _exporter = exporter
+
+
+def get_exporter():
+    """Returns the installed exporter, or None if metrics are disabled."""
+    return _exporter
+
+
+def configure(settings_instance):
+    """Installs the exporter configured in the Django settings.
+
+    Args:
+        settings_instance: An instance of ``django.conf.settings``.
+    """
+    setting = getattr(settings_instance, 'GOOGLE_OAUTH2_METRICS_EXPORTER',
+                      None)
+    if not setting:
+        set_exporter(None)
+    elif setting is True:
+        set_exporter(InMemoryExporter())
+    else:
+        module_name, class_name = setting.rsplit('.', 1)
+        module = importlib.import_module(module_name)
+        set_exporter(getattr(module, class_name)())
+
+
+def inc(name, value=1, **labels):
+    """Increments a counter, if metrics are enabled."""
+    exporter = _exporter
+    if exporter is not None:
+        exporter.inc(name, _normalize(labels), value)
+
+
+class _NullTimer(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer(object):
+    __slots__ = ('_exporter', '_name', '_labels', '_start')
+
+    def __init__(self, exporter, name, labels):
+        self._exporter = exporter
+        self._name = name
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._exporter.observe(self._name, _normalize(self._labels),
+                               time.perf_counter() - self._start)
+        return False
+
+
+def timer(name, **labels):
+    """Returns a context manager recording its duration in a histogram.
+
+    When metrics are disabled a shared no-op context manager is returned.
+    """
+    exporter = _exporter
+    if exporter is None:
+        return _NULL_TIMER
+    return _Timer(exporter, name, labels)
@@ -15,22 +15,72 @@
 """Contains classes used for the Django ORM storage."""
 
 import base64
-import pickle
+import json
 
 from django.db import models
 from django.utils import encoding
-from google.oauth2.credentials import Credentials
-import jsonpickle
+
+from googleoauth2django import metrics
+from googleoauth2django import stats
+from googleoauth2django.helpers import session_codec
+
+_CODEC_METRIC = 'googleoauth2django_codec_seconds'
+
+# Formats CredentialsField can write. Every format, and the pickle strings
+# written by the oldest versions, can be read whatever the field writes.
+CODEC_JSONPICKLE = 'jsonpickle'
+CODEC_JSON = 'json'
+CODECS = (CODEC_JSONPICKLE, CODEC_JSON)
+CODEC_PICKLE = 'pickle'
+
+# Stored JSON values start with the format version of session_codec.
+_JSON_PREFIX = b'{"v":'
+_JSONPICKLE_PREFIX = b'{"py/'
+
+
+def stored_codec(value):
+    """Returns the codec a value read from the database was written with.
+
+    Args:
+        value: The raw column value, as text, bytes or a memoryview.
+
+    Returns:
+        One of ``CODECS`` or ``CODEC_PICKLE``.
+    """
+    data = base64.b64decode(encoding.smart_bytes(value))
+    if data.startswith(_JSON_PREFIX):
+        return CODEC_JSON
+    if data.startswith(_JSONPICKLE_PREFIX):
+        return CODEC_JSONPICKLE
+    return CODEC_PICKLE
 
 
 class CredentialsField(models.Field):
-    """Django ORM field for storing OAuth2 Credentials."""
+    """Django ORM field for storing OAuth2 Credentials.
+
+    Args:
+        codec: The format new values are written in, ``'jsonpickle'`` (the
+               default) or ``'json'``, which is smaller and faster to decode.
+               Rows written in another format stay readable and can be
+               rewritten with the ``oauth2_migrate_credentials`` management
+               command.
+    """
 
     def __init__(self, *args, **kwargs):
         if 'null' not in kwargs:
             kwargs['null'] = True
+        self.codec = kwargs.pop('codec', CODEC_JSONPICKLE)
+        if self.codec not in CODECS:
+            raise ValueError('Unknown credentials codec {0!r}.'.format(
+                self.codec))
         super(CredentialsField, self).__init__(*args, **kwargs)
 
+    def deconstruct(self):
+        name, path, args, kwargs = super(CredentialsField, self).deconstruct()
+        if self.codec != CODEC_JSONPICKLE:
+            kwargs['codec'] = self.codec
+        return name, path, args, kwargs
+
     def get_internal_type(self):
         return 'BinaryField'
 
@@ -45,15 +95,24 @@ class CredentialsField(models.Field):
         bytes (from serialization etc) to an instance of this class"""
         if value is None:
             return None
-        elif isinstance(value, Credentials):
+
+        # Imported lazily: this module is loaded by every process that loads
+        # the app registry, including short-lived management commands.
+        from google.oauth2.credentials import Credentials
+
+        if isinstance(value, Credentials):
             return value
-        else:
+        with metrics.timer(_CODEC_METRIC, codec='orm', operation='decode'), \
+                stats.phase(stats.PHASE_DECODE):
+            data = base64.b64decode(encoding.smart_bytes(value))
+            if data.startswith(_JSON_PREFIX):
+                return session_codec.from_dict(json.loads(data.decode()))
+            import jsonpickle
             try:
-                return jsonpickle.decode(
-                    base64.b64decode(encoding.smart_bytes(value)).decode())
+                return jsonpickle.decode(data.decode())
             except ValueError:
-                return pickle.loads(
-                    base64.b64decode(encoding.smart_bytes(value)))
+                import pickle
+                return pickle.loads(data)
 
     def get_prep_value(self, value):
         """Overrides ``models.Field`` method. This is used to convert
@@ -62,9 +121,16 @@ class CredentialsField(models.Field):
         """
         if value is None:
             return None
-        else:
-            return encoding.smart_text(
-                base64.b64encode(jsonpickle.encode(value).encode()))
+
+        with metrics.timer(_CODEC_METRIC, codec='orm', operation='encode'), \
+                stats.phase(stats.PHASE_ENCODE):
+            if self.codec == CODEC_JSON:
+                data = json.dumps(session_codec.to_dict(value),
+                                  separators=(',', ':'))
+            else:
+                import jsonpickle
+                data = jsonpickle.encode(value)
+            return encoding.smart_text(base64.b64encode(data.encode()))
 
     def value_to_string(self, obj):
         """Convert the field value from the provided model to a string.
@@ -79,3 +145,25 @@ class CredentialsField(models.Field):
         """
         value = self.value_from_object(obj)
         return self.get_prep_value(value)
+
+
+class GoogleSubjectField(models.CharField):
+    """Django ORM field for the Google account id of stored credentials.
+
+    The ``oauth2_callback`` view fills it in with the ``sub`` claim of the
+    ID token when it is named by the ``subject_property`` key of
+    ``GOOGLE_OAUTH2_STORAGE_MODEL``. It is unique, so a Google account is
+    linked to at most one user, and a user is found by Google account with a
+    single indexed query. Rows without an account id are NULL, which does not
+    conflict with other rows.
+
+    Models that already have this field need a migration adding the unique
+    constraint, after making sure no two rows share an account id.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', 255)
+        kwargs.setdefault('null', True)
+        kwargs.setdefault('blank', True)
+        kwargs.setdefault('unique', True)
+        super(GoogleSubjectField, self).__init__(*args, **kwargs)
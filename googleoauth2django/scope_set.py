@@ -0,0 +1,187 @@
+# Copyright 2016 Google Inc.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Interned sets of OAuth2 scopes.
+
+The decorators and :class:`googleoauth2django.UserOAuth2` compare the scopes
+a view requires with the scopes granted to the credentials on every request.
+The configured scopes, those of the settings, the tenants and the
+decorators, are interned once per process into a registry mapping each
+scope to a bit, so a set of them is an integer mask, and checking that
+granted scopes cover required ones is a single ``&``:
+
+.. code-block:: python
+
+   required = scope_set.mask(['email', 'profile'])
+   granted = scope_set.lookup(credentials.scopes)
+   if scope_set.covers(granted, required):
+       ...
+
+Scopes that come from requests or from stored credentials are looked up
+with :func:`lookup`, which never interns, so the registry only grows with
+the configuration. Their set is a mask if every scope is interned, and a
+frozenset of the scopes otherwise; :func:`covers`, :func:`union` and
+:func:`names` accept both, comparing frozensets as sets.
+
+Scopes are canonicalized with
+:func:`googleoauth2django.helpers._helpers.string_to_scopes`, so a space
+separated string and a list of the same scopes have the same mask. The
+masks of recently seen scope lists are memoized, so computing the mask of
+the scopes of stored credentials is a dictionary lookup.
+"""
+
+import threading
+
+from googleoauth2django.helpers import _helpers
+
+# The number of scope lists and of masks whose results are memoized.
+MAX_MEMOIZED = 1024
+
+_lock = threading.Lock()
+# Maps each configured scope to its bit. Empty scopes, from repeated spaces,
+# have none.
+_bits = {'': 0}
+# Maps scope lists, as strings or tuples, to their mask.
+_masks = {}
+# Maps masks to the frozenset of their scopes.
+_names = {}
+
+
+def _intern(scopes):
+    """Computes the mask of canonicalized scopes, interning new ones."""
+    result = 0
+    with _lock:
+        for scope in scopes:
+            bit = _bits.get(scope)
+            if bit is None:
+                bit = _bits[scope] = 1 << (len(_bits) - 1)
+            result |= bit
+    return result
+
+
+def _lookup(scopes):
+    """Computes the mask of canonicalized scopes, or returns None if one of
+    them is not interned."""
+    result = 0
+    for scope in scopes:
+        bit = _bits.get(scope)
+        if bit is None:
+            return None
+        result |= bit
+    return result
+
+
+def _key(scopes):
+    return scopes if isinstance(scopes, str) else tuple(scopes)
+
+
+def _memoize(key, result):
+    if len(_masks) >= MAX_MEMOIZED:
+        _masks.clear()
+    _masks[key] = result
+
+
+def mask(scopes):
+    """Returns the mask of a set of configured scopes, interning them.
+
+    Only pass scopes from the configuration, never from requests, see
+    :func:`lookup`.
+
+    Args:
+        scopes: A string of space separated scopes, an iterable of scopes,
+                None, or a mask, which is returned as is.
+
+    Returns:
+        An int with the bit of each scope set.
+    """
+    if isinstance(scopes, int):
+        return scopes
+    if not scopes:
+        return 0
+    key = _key(scopes)
+    result = _masks.get(key)
+    if result is None:
+        result = _intern(_helpers.string_to_scopes(key))
+        _memoize(key, result)
+    return result
+
+
+def lookup(scopes):
+    """Returns the set of any scopes, without interning them.
+
+    Args:
+        scopes: A string of space separated scopes, an iterable of scopes,
+                None, or a set returned by this function or :func:`mask`,
+                which is returned as is.
+
+    Returns:
+        The mask of the scopes if they are all interned, otherwise a
+        frozenset of the scopes.
+    """
+    if isinstance(scopes, (int, frozenset)):
+        return scopes
+    if not scopes:
+        return 0
+    key = _key(scopes)
+    result = _masks.get(key)
+    if result is None:
+        canonical = _helpers.string_to_scopes(key)
+        result = _lookup(canonical)
+        if result is None:
+            return frozenset(canonical) - {''}
+        _memoize(key, result)
+    return result
+
+
+def names(scopes_mask):
+    """Returns the scopes of a set.
+
+    Args:
+        scopes_mask: A set returned by :func:`mask` or :func:`lookup`.
+
+    Returns:
+        A frozenset of scopes.
+    """
+    if isinstance(scopes_mask, frozenset):
+        return scopes_mask
+    result = _names.get(scopes_mask)
+    if result is None:
+        result = frozenset(scope for scope, bit in list(_bits.items())
+                           if bit & scopes_mask)
+        if len(_names) >= MAX_MEMOIZED:
+            _names.clear()
+        _names[scopes_mask] = result
+    return result
+
+
+def to_string(scopes_mask):
+    """Returns the scopes of a set as a space separated string, sorted so
+    equal sets give equal strings."""
+    return _helpers.scopes_to_string(sorted(names(scopes_mask)))
+
+
+def union(first, second):
+    """Returns the union of two sets returned by :func:`mask` or
+    :func:`lookup`."""
+    if isinstance(first, int) and isinstance(second, int):
+        return first | second
+    return names(first) | names(second)
+
+
+def covers(granted, required):
+    """Returns True if every scope of the ``required`` set is in the
+    ``granted`` set."""
+    if isinstance(granted, int) and isinstance(required, int):
+        return granted & required == required
+    return names(granted) >= names(required)
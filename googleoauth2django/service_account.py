@@ -0,0 +1,206 @@
+# Copyright 2016 Google Inc.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Service account access with self-signed JWTs.
+
+Google APIs accept a JWT signed with a service account key as an access
+token, so background jobs acting as a service account never need to call
+the token endpoint:
+
+.. code-block:: python
+   :caption: jobs.py
+   :name: service_account
+
+   from googleoauth2django import batch
+   from googleoauth2django import service_account
+
+   account = service_account.ServiceAccount.from_file(
+       '/etc/secrets/service-account.json')
+   token = account.token(
+       scopes=['https://www.googleapis.com/auth/devstorage.read_only'])
+   calls = batch.Batch(BATCH_URI, token, batch.MAX_BATCH_SIZE)
+
+A token is either scoped, or issued for the ``audience`` of one API, such as
+``'https://pubsub.googleapis.com/'``. Tokens are cached per audience, scopes
+and subject, and reused until ``REFRESH_MARGIN`` seconds before they expire,
+so a job signs at most one token an hour for each of them. Key files are
+read once and cached until they change on disk, and their keys are parsed
+once by :mod:`googleoauth2django.crypt`.
+
+:meth:`ServiceAccount.credentials` wraps the same tokens in
+``google.auth`` credentials, for libraries such as
+:func:`googleoauth2django.discovery.build`.
+"""
+
+import datetime
+import json
+import os
+import threading
+import time
+
+from google.auth import credentials as google_credentials
+from google.auth import jwt
+
+from googleoauth2django import crypt
+from googleoauth2django import metrics
+
+TOKEN_LIFETIME = 60 * 60
+# Cached tokens are signed again when they expire within this many seconds.
+REFRESH_MARGIN = 5 * 60
+
+_TOKEN_METRIC = 'googleoauth2django_service_account_tokens_total'
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+_lock = threading.Lock()
+# Maps the path of a key file to a tuple of its (mtime, size) and the parsed
+# service account info and signer.
+_key_files = {}
+
+
+def clear():
+    """Drops the parsed key files."""
+    with _lock:
+        _key_files.clear()
+
+
+def load_key_file(path):
+    """Returns the service account info and signer of a JSON key file.
+
+    The file is parsed once, and again only after it changes on disk.
+
+    Args:
+        path: The path of the key file downloaded from the Cloud Console.
+
+    Returns:
+        A tuple of the service account info dictionary and a
+        ``google.auth.crypt.Signer``.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = _key_files.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with open(path) as key_file:
+        info = json.load(key_file)
+    loaded = (info, crypt.signer(info['private_key'],
+                                 info.get('private_key_id')))
+    with _lock:
+        _key_files[path] = (version, loaded)
+    return loaded
+
+
+class ServiceAccount(object):
+    """Signs access tokens for a service account.
+
+    Args:
+        email: The service account's email address.
+        signer: A ``google.auth.crypt.Signer`` for the service account key.
+    """
+
+    def __init__(self, email, signer):
+        self.email = email
+        self.signer = signer
+        self._lock = threading.Lock()
+        # Maps (audience, scopes, subject) to (expiry, token).
+        self._tokens = {}
+
+    @classmethod
+    def from_file(cls, path):
+        """Creates a service account from a JSON key file."""
+        info, signer = load_key_file(path)
+        return cls(info['client_email'], signer)
+
+    def token_with_expiry(self, audience=None, scopes=None, subject=None):
+        """Returns a self-signed JWT access token and its expiry.
+
+        Args:
+            audience: The URL of the API the token is for, such as
+                      ``'https://pubsub.googleapis.com/'``.
+            scopes: Optional scopes of the token, in place of an audience.
+            subject: The ``sub`` claim, defaults to the service account.
+
+        Returns:
+            A tuple of the token and its expiry as a POSIX timestamp.
+
+        Raises:
+            ValueError: Neither an audience nor scopes were given.
+        """
+        if audience is None and not scopes:
+            raise ValueError('Tokens need an audience or scopes.')
+        scopes = tuple(sorted(scopes)) if scopes else None
+        key = (audience, scopes, subject)
+        cached = self._tokens.get(key)
+        if cached is not None and cached[0] - REFRESH_MARGIN > time.time():
+            metrics.inc(_TOKEN_METRIC, result='reused')
+            return cached[1], cached[0]
+
+        with self._lock:
+            cached = self._tokens.get(key)
+            if (cached is not None and
+                    cached[0] - REFRESH_MARGIN > time.time()):
+                metrics.inc(_TOKEN_METRIC, result='reused')
+                return cached[1], cached[0]
+            token, expiry = self._sign(audience, scopes, subject)
+            self._tokens[key] = (expiry, token)
+        metrics.inc(_TOKEN_METRIC, result='signed')
+        return token, expiry
+
+    def token(self, audience=None, scopes=None, subject=None):
+        """Returns a self-signed JWT access token, see
+        :meth:`token_with_expiry`."""
+        return self.token_with_expiry(audience, scopes, subject)[0]
+
+    def _sign(self, audience, scopes, subject):
+        now = int(time.time())
+        expiry = now + TOKEN_LIFETIME
+        payload = {'iss': self.email, 'sub': subject or self.email,
+                   'iat': now, 'exp': expiry}
+        if audience is not None:
+            payload['aud'] = audience
+        if scopes:
+            payload['scope'] = ' '.join(scopes)
+        return jwt.encode(self.signer, payload).decode('ascii'), expiry
+
+    def credentials(self, audience=None, scopes=None, subject=None):
+        """Returns ``google.auth`` credentials using the cached tokens.
+
+        Args:
+            audience: See :meth:`token_with_expiry`.
+            scopes: See :meth:`token_with_expiry`.
+            subject: See :meth:`token_with_expiry`.
+
+        Returns:
+            A ``google.auth.credentials.Credentials`` instance.
+        """
+        return JWTCredentials(self, audience, scopes, subject)
+
+
+class JWTCredentials(google_credentials.Credentials):
+    """``google.auth`` credentials refreshed from the tokens cached by a
+    :class:`ServiceAccount`."""
+
+    def __init__(self, account, audience=None, scopes=None, subject=None):
+        super(JWTCredentials, self).__init__()
+        self.account = account
+        self.audience = audience
+        self.scopes = scopes
+        self.subject = subject
+
+    def refresh(self, request):
+        self.token, expiry = self.account.token_with_expiry(
+            self.audience, self.scopes, self.subject)
+        # google.auth compares naive UTC datetimes.
+        self.expiry = _EPOCH + datetime.timedelta(
+            seconds=expiry - REFRESH_MARGIN)
@@ -0,0 +1,148 @@
+# Copyright 2016 Google Inc.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Per-request OAuth2 cost breakdown.
+
+When :class:`OAuth2StatsMiddleware` is installed, the time and number of
+calls spent in each phase of the OAuth2 helper are collected for the current
+request. They are exposed as ``request.oauth_stats`` and emitted in a
+``Server-Timing`` response header.
+
+.. code-block:: python
+   :caption: settings.py
+   :name: stats_middleware
+
+   MIDDLEWARE = [
+       'googleoauth2django.stats.OAuth2StatsMiddleware',
+       'django.contrib.sessions.middleware.SessionMiddleware',
+       # ...
+   ]
+
+The phases are:
+
+* ``oauth-settings``: loading the helper settings.
+* ``oauth-storage``: reading and writing credentials, including decoding.
+* ``oauth-decode``: decoding stored credentials.
+* ``oauth-encode``: encoding credentials to store them.
+* ``oauth-google``: round trips to Google.
+
+Without the middleware no collector is active and every hook returns a
+shared no-op context manager.
+"""
+
+import collections
+import threading
+import time
+
+from googleoauth2django import metrics
+
+PHASE_SETTINGS = 'oauth-settings'
+PHASE_STORAGE = 'oauth-storage'
+PHASE_DECODE = 'oauth-decode'
+PHASE_ENCODE = 'oauth-encode'
+PHASE_GOOGLE = 'oauth-google'
+
+_local = threading.local()
+
+
+class RequestStats(object):
+    """Time and call counts per phase for a single request.
+
+    Attributes:
+        phases: An ordered mapping of phase name to a ``[calls, seconds]``
+                list, in order of first use.
+    """
+
+    def __init__(self):
+        self.phases = collections.OrderedDict()
+
+    def record(self, name, seconds):
+        """Adds one call of ``seconds`` duration to the phase ``name``."""
+        phase = self.phases.get(name)
+        if phase is None:
+            self.phases[name] = [1, seconds]
+        else:
+            phase[0] += 1
+            phase[1] += seconds
+
+    def as_dict(self):
+        """Returns the stats as a dictionary, convenient for logging."""
+        return dict((name, {'calls': calls, 'ms': seconds * 1000.0})
+                    for name, (calls, seconds) in self.phases.items())
+
+    def server_timing(self):
+        """Formats the stats as a ``Server-Timing`` header value."""
+        return ', '.join(
+            '{0};dur={1:.3f};desc="{2} call{3}"'.format(
+                name, seconds * 1000.0, calls, '' if calls == 1 else 's')
+            for name, (calls, seconds) in self.phases.items())
+
+
+class _Phase(object):
+    __slots__ = ('_stats', '_name', '_start')
+
+    def __init__(self, stats, name):
+        self._stats = stats
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stats.record(self._name, time.perf_counter() - self._start)
+        return False
+
+
+def current():
+    """Returns the :class:`RequestStats` of the current request, if any."""
+    return getattr(_local, 'stats', None)
+
+
+def phase(name):
+    """Returns a context manager timing the phase ``name``.
+
+    When no collector is active a shared no-op context manager is returned.
+    """
+    stats = getattr(_local, 'stats', None)
+    if stats is None:
+        return metrics._NULL_TIMER
+    return _Phase(stats, name)
+
+
+class OAuth2StatsMiddleware(object):
+    """Collects per-phase OAuth2 costs and emits a ``Server-Timing`` header.
+
+    Args:
+        get_response: The next middleware or view in the chain.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        request.oauth_stats = stats
+        _local.stats = stats
+        try:
+            response = self.get_response(request)
+        finally:
+            _local.stats = None
+
+        header = stats.server_timing()
+        if header:
+            existing = response.get('Server-Timing')
+            response['Server-Timing'] = (
+                '{0}, {1}'.format(existing, header) if existing else header)
+        return response
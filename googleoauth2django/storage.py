@@ -12,10 +12,182 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-"""Contains a storage module that stores credentials using the Django ORM."""
+"""Contains a storage module that stores credentials using the Django ORM.
 
+Most visitors of an ``oauth_enabled`` page have never authorized, so looking
+up their credentials is a query that returns nothing. With
+``GOOGLE_OAUTH2_NEGATIVE_CACHE`` configured, :class:`DjangoORMStorage`
+remembers such misses for a short time, either in the Django cache or in the
+user's session:
+
+.. code-block:: python
+   :caption: settings.py
+   :name: negative_cache
+
+   GOOGLE_OAUTH2_NEGATIVE_CACHE = {
+       'backend': 'cache',  # or 'session'
+       'timeout': 60,
+       'alias': 'default',  # the cache to use with the 'cache' backend
+   }
+
+The remembered miss is forgotten whenever credentials are stored or deleted
+through the storage, which includes the ``oauth2_callback`` view. Credentials
+written to the model directly show up once ``timeout`` has passed.
+
+Credentials are read and written through the database routers, so a router
+sending reads to a replica moves the credential reads off the primary. A
+``using`` alias in ``GOOGLE_OAUTH2_STORAGE_MODEL`` sends both to one
+database instead. Replicas lag behind the primary, and a user redirected by
+``oauth2_callback`` could find the credentials just stored missing from the
+replica; with ``read_your_writes`` set, the user's reads go to the primary
+for that many seconds after each write, remembered in the session:
+
+.. code-block:: python
+   :caption: settings.py
+   :name: storage_databases
+
+   GOOGLE_OAUTH2_STORAGE_MODEL = {
+       'model': 'path.to.model.MyModel',
+       'user_property': 'user_id',
+       'credentials_property': 'credential',
+       'using': None,  # or a database alias
+       'read_your_writes': 5,
+   }
+"""
+
+import time
+
+from django.db import router
+from django.db import transaction
+
+from googleoauth2django import metrics
 from googleoauth2django.helpers.dictionary_storage import Storage
 
+_NEGATIVE_CACHE_METRIC = 'googleoauth2django_negative_cache_total'
+_NEGATIVE_CACHE_SESSION_KEY = 'google_oauth2_no_credentials'
+_WRITE_PIN_SESSION_KEY = 'google_oauth2_pinned_until'
+DEFAULT_NEGATIVE_CACHE_TIMEOUT = 60
+
+
+class CacheNegativeCache(object):
+    """Remembers in the Django cache that a storage key has no credentials.
+
+    Args:
+        key: string, the cache key for the storage entity.
+        timeout: int, seconds to remember the miss for.
+        alias: string, the name of the cache in ``CACHES``.
+    """
+
+    def __init__(self, key, timeout=DEFAULT_NEGATIVE_CACHE_TIMEOUT,
+                 alias='default'):
+        self.key = key
+        self.timeout = timeout
+        self.alias = alias
+
+    def _cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def hit(self):
+        """Returns True if the key is known to have no credentials."""
+        return self._cache().get(self.key) is not None
+
+    def add(self):
+        """Remembers that the key has no credentials."""
+        self._cache().set(self.key, True, self.timeout)
+
+    def discard(self):
+        """Forgets a remembered miss."""
+        self._cache().delete(self.key)
+
+
+class SessionNegativeCache(object):
+    """Remembers in the session that a storage key has no credentials.
+
+    Args:
+        session: The session of the current request.
+        key: string, the key of the storage entity.
+        timeout: int, seconds to remember the miss for.
+    """
+
+    def __init__(self, session, key, timeout=DEFAULT_NEGATIVE_CACHE_TIMEOUT):
+        self.session = session
+        self.key = key
+        self.timeout = timeout
+
+    def hit(self):
+        """Returns True if the key is known to have no credentials."""
+        entry = self.session.get(_NEGATIVE_CACHE_SESSION_KEY)
+        return (entry is not None and entry[0] == self.key and
+                entry[1] > time.time())
+
+    def add(self):
+        """Remembers that the key has no credentials."""
+        self.session[_NEGATIVE_CACHE_SESSION_KEY] = [
+            self.key, time.time() + self.timeout]
+
+    def discard(self):
+        """Forgets a remembered miss."""
+        self.session.pop(_NEGATIVE_CACHE_SESSION_KEY, None)
+
+
+def make_negative_cache(config, request, model_class, key_name, key_value,
+                        extra_keys=None):
+    """Builds the negative cache configured by
+    ``GOOGLE_OAUTH2_NEGATIVE_CACHE``.
+
+    Args:
+        config: dict, the ``GOOGLE_OAUTH2_NEGATIVE_CACHE`` setting, or None.
+        request: The current request.
+        model_class: The storage model class.
+        key_name: string, key name for the entity that has the credentials.
+        key_value: The key value for the entity, usually the user.
+        extra_keys: Optional dictionary of the other fields identifying the
+                    entity, such as its tenant.
+
+    Returns:
+        A :class:`CacheNegativeCache` or :class:`SessionNegativeCache`, or
+        None if the negative cache is disabled.
+    """
+    if not config:
+        return None
+    key = 'googleoauth2django:no-credentials:{0}:{1}={2}'.format(
+        model_class._meta.label_lower, key_name,
+        getattr(key_value, 'pk', key_value))
+    for name, value in sorted((extra_keys or {}).items()):
+        key += ':{0}={1}'.format(name, value)
+    timeout = config.get('timeout', DEFAULT_NEGATIVE_CACHE_TIMEOUT)
+    backend = config.get('backend', 'cache')
+    if backend == 'session':
+        return SessionNegativeCache(request.session, key, timeout)
+    elif backend == 'cache':
+        return CacheNegativeCache(key, timeout,
+                                  config.get('alias', 'default'))
+    raise ValueError(
+        'Unknown GOOGLE_OAUTH2_NEGATIVE_CACHE backend {0!r}.'.format(backend))
+
+
+class SessionWritePin(object):
+    """Sends the reads of a session to the primary database for a while
+    after a write.
+
+    Args:
+        session: The session of the current request.
+        timeout: int, seconds reads are pinned for after a write.
+    """
+
+    def __init__(self, session, timeout):
+        self.session = session
+        self.timeout = timeout
+
+    def active(self):
+        """Returns True if reads go to the primary database."""
+        return self.session.get(_WRITE_PIN_SESSION_KEY, 0) > time.time()
+
+    def pin(self):
+        """Pins the reads after a write."""
+        self.session[_WRITE_PIN_SESSION_KEY] = time.time() + self.timeout
+
 
 class DjangoORMStorage(Storage):
     """Store and retrieve a single credential to and from the Django datastore.
@@ -25,7 +197,9 @@ class DjangoORMStorage(Storage):
     on a db model class.
     """
 
-    def __init__(self, model_class, key_name, key_value, property_name):
+    def __init__(self, model_class, key_name, key_value, property_name,
+                 negative_cache=None, using=None, write_pin=None,
+                 extra_keys=None):
         """Constructor for Storage.
 
         Args:
@@ -35,12 +209,27 @@ class DjangoORMStorage(Storage):
                credentials.
             property_name: string, name of the property that is an
                            CredentialsProperty.
+            negative_cache: optional :class:`CacheNegativeCache` or
+                            :class:`SessionNegativeCache` remembering that
+                            the entity has no credentials.
+            using: optional database alias for reads and writes, instead of
+                   the database routers.
+            write_pin: optional :class:`SessionWritePin` sending reads to
+                       the database of writes after a write.
+            extra_keys: optional dictionary of the other fields identifying
+                        the entity, such as its tenant.
         """
         super(DjangoORMStorage, self).__init__()
         self.model_class = model_class
         self.key_name = key_name
         self.key_value = key_value
         self.property_name = property_name
+        self.negative_cache = negative_cache
+        self.using = using
+        self.write_pin = write_pin
+        self.extra_keys = dict(extra_keys or {})
+        # Other fields of the entity written together with the credentials.
+        self.extra_fields = {}
 
     def locked_get(self):
         """Retrieve stored credential from the Django ORM.
@@ -53,14 +242,20 @@ class DjangoORMStorage(Storage):
              defined in the constructor for this Storage object.
 
         """
-        query = {self.key_name: self.key_value}
-        entities = self.model_class.objects.filter(**query)
+        if self.negative_cache is not None and self.negative_cache.hit():
+            metrics.inc(_NEGATIVE_CACHE_METRIC, result='hit')
+            return None
+
+        entities = self._objects(self._read_alias()).filter(**self._query())
         if len(entities) > 0:
             credential = getattr(entities[0], self.property_name)
             if getattr(credential, 'set_store', None) is not None:
                 credential.set_store(self)
             return credential
         else:
+            if self.negative_cache is not None:
+                metrics.inc(_NEGATIVE_CACHE_METRIC, result='miss')
+                self.negative_cache.add()
             return None
 
     def locked_put(self, credentials):
@@ -69,13 +264,86 @@ class DjangoORMStorage(Storage):
         Args:
             credentials: Credentials, the credentials to store.
         """
-        entity, _ = self.model_class.objects.get_or_create(
-            **{self.key_name: self.key_value})
+        entity, _ = self._objects(self.using).get_or_create(**self._query())
 
         setattr(entity, self.property_name, credentials)
-        entity.save()
+        for name, value in self.extra_fields.items():
+            setattr(entity, name, value)
+        if self.using is None:
+            entity.save()
+        else:
+            entity.save(using=self.using)
+        self._written()
+
+    def update(self, credentials, token=None):
+        """Writes credentials over the stored ones, if they are still there.
+
+        Unlike :meth:`put`, no entity is created, so credentials deleted
+        meanwhile are not brought back. The entity is locked while it is
+        read and written.
+
+        Args:
+            credentials: Credentials, the credentials to store.
+            token: Optional access token the stored credentials must still
+                   hold, so newer credentials stored by another process are
+                   not overwritten.
+
+        Returns:
+            True if the credentials were written, False if the entity is
+            gone or holds other credentials.
+        """
+        alias = self.using or router.db_for_write(self.model_class)
+        self.acquire_lock()
+        try:
+            with transaction.atomic(using=alias):
+                entity = (self.model_class.objects.using(alias)
+                          .select_for_update().filter(**self._query())
+                          .first())
+                if entity is None:
+                    return False
+                stored = getattr(entity, self.property_name)
+                if token is not None and getattr(stored, 'token',
+                                                 None) != token:
+                    return False
+                setattr(entity, self.property_name, credentials)
+                for name, value in self.extra_fields.items():
+                    setattr(entity, name, value)
+                entity.save(using=alias, update_fields=[
+                    self.property_name] + list(self.extra_fields))
+            self._fingerprint = self.fingerprint(credentials)
+            self._written()
+            return True
+        finally:
+            self.release_lock()
 
     def locked_delete(self):
         """Delete Credentials from the datastore."""
+        self._objects(self.using).filter(**self._query()).delete()
+        self._written()
+
+    def _query(self):
+        """Returns the lookups identifying the entity."""
         query = {self.key_name: self.key_value}
-        self.model_class.objects.filter(**query).delete()
+        query.update(self.extra_keys)
+        return query
+
+    def _objects(self, alias):
+        """Returns the manager of the model, on ``alias`` if it is set."""
+        if alias is None:
+            return self.model_class.objects
+        return self.model_class.objects.using(alias)
+
+    def _read_alias(self):
+        """Returns the database alias to read from, or None to let the
+        routers choose."""
+        if self.using is not None:
+            return self.using
+        if self.write_pin is not None and self.write_pin.active():
+            return router.db_for_write(self.model_class)
+        return None
+
+    def _written(self):
+        if self.negative_cache is not None:
+            self.negative_cache.discard()
+        if self.write_pin is not None:
+            self.write_pin.pin()
@@ -0,0 +1,277 @@
+# Copyright 2016 Google Inc.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""OAuth clients of the tenants served by one deployment.
+
+A deployment serving several customer domains, each with its own OAuth
+client, lists them in ``GOOGLE_OAUTH2_TENANTS``:
+
+.. code-block:: python
+   :caption: settings.py
+   :name: tenants
+
+   GOOGLE_OAUTH2_TENANTS = [
+       {
+           'name': 'acme',
+           'hosts': ['acme.example.com', 'www.acme.com'],
+           'client_id': 'acme-client-id',
+           'client_secret': 'acme-client-secret',
+           # Optional, defaults to GOOGLE_OAUTH2_SCOPES.
+           'scopes': ['email', 'https://www.googleapis.com/auth/drive'],
+       },
+       {
+           'name': 'globex',
+           'hosts': ['globex.example.com'],
+           'client_secrets_json': '/etc/secrets/globex.json',
+       },
+   ]
+
+The setting can also be the dotted path of a list, or of a function
+returning the tenants, for example from a database table. The tenants are
+loaded with the rest of the settings, once per process, and indexed by host
+and by name. The views, decorators and :class:`googleoauth2django.UserOAuth2`
+use the client of the tenant serving the host of the request, see
+:func:`googleoauth2django.get_tenant`. Requests for other hosts use the
+client of ``GOOGLE_OAUTH2_CLIENT_ID`` or ``GOOGLE_OAUTH2_CLIENT_SECRETS_JSON``
+if there is one, and are answered with a 404 otherwise. A tenant whose
+client secrets file is rewritten is loaded again, alone, by the next request
+for one of its hosts.
+
+Credentials stored in the session are kept under a key of their tenant, its
+``storage_key`` which defaults to its name, so a session shared by the
+hosts of several tenants keeps the credentials of each. The storage key also
+scopes the shared token cache and the token broker, and credentials stored
+in a model are kept per tenant when the model has a field for it, named by
+``tenant_property``; the default client's credentials have a NULL storage
+key:
+
+.. code-block:: python
+   :caption: settings.py
+   :name: tenants_storage_model
+
+   GOOGLE_OAUTH2_STORAGE_MODEL = {
+       'model': 'path.to.model.MyModel',
+       'user_property': 'user_id',
+       'credentials_property': 'credential',
+       'tenant_property': 'tenant',
+   }
+
+The user field of such a model cannot be a ``OneToOneField``, and a
+:class:`googleoauth2django.models.GoogleSubjectField` on it is declared
+with ``unique=False``, with the tenant and subject fields unique together
+instead. Storage keys must not contain colons.
+
+Bearer tokens are accepted from the clients of all the tenants unless
+``GOOGLE_OAUTH2_BEARER_AUDIENCES`` is set.
+"""
+
+import importlib
+
+from django import http
+
+from googleoauth2django import scope_set
+from googleoauth2django.helpers import clientsecrets
+
+
+class UnknownTenant(http.Http404):
+    """No tenant serves the host of the request."""
+
+
+class Tenant(object):
+    """The OAuth client of a tenant.
+
+    Args:
+        name: The name of the tenant, or None for the default client.
+        client_id: The OAuth2 Client ID.
+        client_secret: The OAuth2 Client Secret.
+        scopes: The default scopes of the tenant.
+        hosts: The hosts served by the tenant.
+        storage_key: Optional key of the tenant's credentials in sessions,
+                     defaults to the name.
+        client_secrets_json: Optional client secrets file the client was
+                             loaded from.
+    """
+
+    def __init__(self, name, client_id, client_secret, scopes, hosts=(),
+                 storage_key=None, client_secrets_json=None):
+        self.name = name
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.scopes = tuple(scopes)
+        self.scope_mask = scope_set.mask(self.scopes)
+        self.hosts = tuple(host.lower() for host in hosts)
+        self.storage_key = storage_key if storage_key is not None else name
+        self.client_secrets_json = client_secrets_json
+        # Imported here, the package imports this module.
+        import googleoauth2django
+        self.client_config = {
+            'web': {
+                'client_id': client_id,
+                'client_secret': client_secret,
+                'auth_uri': googleoauth2django.GOOGLE_AUTH_URI,
+                'token_uri': googleoauth2django.GOOGLE_TOKEN_URI,
+            }
+        }
+
+    def __repr__(self):
+        return 'Tenant({0!r})'.format(self.name)
+
+
+def tenant_from_dict(config, default_scopes, cache=None):
+    """Builds a :class:`Tenant` from an entry of ``GOOGLE_OAUTH2_TENANTS``.
+
+    Args:
+        config: The dictionary of the tenant.
+        default_scopes: The scopes of the tenant if it does not set its
+                        own.
+        cache: Optional cache of client secrets files, see
+               :func:`googleoauth2django.helpers.clientsecrets.loadfile`.
+
+    Raises:
+        ValueError: The entry is incomplete, or its client secrets are not
+                    for a web application.
+        googleoauth2django.helpers.clientsecrets.Error: The client secrets
+                                                        file is invalid.
+    """
+    if 'name' not in config:
+        raise ValueError('Tenant {0!r} has no name.'.format(config))
+    if 'client_secrets_json' in config:
+        client_type, client_info = clientsecrets.loadfile(
+            config['client_secrets_json'], cache=cache)
+        if client_type != clientsecrets.TYPE_WEB:
+            raise ValueError('The client secrets of tenant {0} are not for '
+                             'a web application.'.format(config['name']))
+        client_id = client_info['client_id']
+        client_secret = client_info['client_secret']
+    elif 'client_id' in config and 'client_secret' in config:
+        client_id = config['client_id']
+        client_secret = config['client_secret']
+    else:
+        raise ValueError('Tenant {0} needs a client_secrets_json, or a '
+                         'client_id and client_secret.'.format(
+                             config['name']))
+    return Tenant(config['name'], client_id, client_secret,
+                  config.get('scopes', default_scopes),
+                  config.get('hosts', ()), config.get('storage_key'),
+                  config.get('client_secrets_json'))
+
+
+class TenantRegistry(object):
+    """Tenants indexed by name and by host.
+
+    Args:
+        tenants: An iterable of :class:`Tenant`.
+        default: Optional :class:`Tenant` of the hosts of no tenant.
+
+    Raises:
+        ValueError: Two tenants have the same name or host.
+    """
+
+    def __init__(self, tenants, default=None):
+        self.default = default
+        self._by_name = {}
+        self._by_host = {}
+        for tenant in tenants:
+            if tenant.name in self._by_name:
+                raise ValueError('Duplicate tenant {0}.'.format(tenant.name))
+            self._by_name[tenant.name] = tenant
+            for host in tenant.hosts:
+                if host in self._by_host:
+                    raise ValueError('Host {0} is served by tenants {1} and '
+                                     '{2}.'.format(host,
+                                                   self._by_host[host].name,
+                                                   tenant.name))
+                self._by_host[host] = tenant
+
+    def __len__(self):
+        return len(self._by_name)
+
+    def __iter__(self):
+        return iter(self._by_name.values())
+
+    def get(self, name):
+        """Returns the tenant of a name, or None."""
+        return self._by_name.get(name)
+
+    def reload(self, tenant, cache=None):
+        """Loads the client secrets file of a tenant again, and replaces
+        the tenant.
+
+        Args:
+            tenant: A :class:`Tenant` of the registry with a
+                    ``client_secrets_json``.
+            cache: Optional cache of client secrets files.
+
+        Returns:
+            The new :class:`Tenant`.
+
+        Raises:
+            ValueError: The client secrets are not for a web application.
+            googleoauth2django.helpers.clientsecrets.Error: The client
+                                                            secrets file is
+                                                            invalid.
+        """
+        reloaded = tenant_from_dict({
+            'name': tenant.name,
+            'hosts': tenant.hosts,
+            'client_secrets_json': tenant.client_secrets_json,
+            'storage_key': tenant.storage_key,
+        }, tenant.scopes, cache)
+        self._by_name[tenant.name] = reloaded
+        for host in tenant.hosts:
+            self._by_host[host] = reloaded
+        return reloaded
+
+    def for_host(self, host):
+        """Returns the tenant serving a host.
+
+        Args:
+            host: The host of a request, with or without its port.
+
+        Raises:
+            UnknownTenant: No tenant serves the host, and there is no
+                           default client.
+        """
+        host = host.lower()
+        tenant = self._by_host.get(host)
+        if tenant is None and ':' in host and not host.endswith(']'):
+            tenant = self._by_host.get(host.rsplit(':', 1)[0])
+        if tenant is None:
+            tenant = self.default
+            if tenant is None:
+                raise UnknownTenant('No OAuth client for {0}.'.format(host))
+        return tenant
+
+
+def load(config, default_scopes, default=None, cache=None):
+    """Builds the registry of ``GOOGLE_OAUTH2_TENANTS``.
+
+    Args:
+        config: A list of tenant dictionaries, or the dotted path of one or
+                of a function returning one.
+        default_scopes: The scopes of tenants that do not set theirs.
+        default: Optional :class:`Tenant` of the hosts of no tenant.
+        cache: Optional cache of client secrets files.
+
+    Returns:
+        A :class:`TenantRegistry`.
+    """
+    if isinstance(config, str):
+        module_name, name = config.rsplit('.', 1)
+        config = getattr(importlib.import_module(module_name), name)
+        if callable(config):
+            config = config()
+    return TenantRegistry(
+        (tenant_from_dict(entry, default_scopes, cache) for entry in config),
+        default)
@@ -0,0 +1,403 @@
+# Copyright 2016 Google Inc.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Access tokens shared by the worker processes of a host.
+
+Each worker of a preforking server such as gunicorn loads and decodes the
+credentials of a user from the storage, and refreshes them when they expire.
+With ``GOOGLE_OAUTH2_SHARED_TOKEN_CACHE`` configured, the access tokens are
+also kept in a memory-mapped file shared by all the workers of the host:
+
+.. code-block:: python
+   :caption: settings.py
+   :name: shared_token_cache
+
+   GOOGLE_OAUTH2_SHARED_TOKEN_CACHE = {
+       'path': '/dev/shm/googleoauth2django-tokens',
+       'slots': 4096,  # optional, the number of tokens kept
+       'ttl': 60,  # optional, seconds a cached token is used for
+   }
+
+:func:`googleoauth2django.get_storage` then returns a
+:class:`SharedTokenStorage` in front of the configured storage. While the
+access token of a user is valid, it is read from the file without a query
+or decoding the credentials, as lightweight credentials whose
+:meth:`~SharedCredentials.refresh` loads the full credentials from the
+storage. A slot is locked while its token is refreshed, so a single worker
+of the host refreshes an expired token and the others use its new token.
+
+Credentials deleted through the storage of a worker are dropped from the
+file, but not those deleted on another host or directly in the model. A
+cached token is therefore used for at most ``ttl`` seconds after it was
+written, then read again from the storage. Cached credentials have no
+refresh token; their ``id_token`` is loaded from the storage when it is
+first used.
+
+The file holds a fixed number of slots of ``SLOT_SIZE`` bytes, and the slot
+of a token is chosen by a hash of its storage key, so that a token can
+replace a token of another user in the same slot. Readers do not lock: a
+slot starts with a sequence number that writers make odd while they write
+and even when they are done, and readers retry when it changed during the
+read. Writers lock the byte range of the slot with ``fcntl.lockf``.
+
+The file is not persistent and only holds access tokens, never refresh
+tokens, but should be readable by the user of the workers only. It is
+created with mode 0600.
+"""
+
+import contextlib
+import datetime
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+
+from google.auth import exceptions
+from google.oauth2 import credentials as oauth2_credentials
+
+from googleoauth2django import metrics
+from googleoauth2django.helpers.dictionary_storage import Storage
+
+DEFAULT_SLOTS = 4096
+DEFAULT_TTL = 60
+SLOT_SIZE = 2048
+# Cached tokens are not used once they expire within this many seconds.
+REFRESH_MARGIN = 300
+
+_MAGIC = b'GOA2TOK2'
+# The magic, the number of slots and the slot size.
+_FILE_HEADER = struct.Struct('<8sII')
+# The sequence number, the key digest, the expiry, the time it was written
+# and the payload length.
+_SLOT_HEADER = struct.Struct('<Q16sddH')
+_SEQUENCE = struct.Struct('<Q')
+MAX_PAYLOAD = SLOT_SIZE - _SLOT_HEADER.size
+_READ_ATTEMPTS = 3
+_CACHE_METRIC = 'googleoauth2django_shared_token_cache_total'
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+_lock = threading.Lock()
+_caches = {}
+
+
+def _timestamp(expiry):
+    return (expiry - _EPOCH).total_seconds()
+
+
+class SharedTokenCache(object):
+    """A memory-mapped file of access tokens, keyed by storage key.
+
+    Args:
+        path: The path of the file, created if it does not exist. A path
+              in ``/dev/shm`` keeps the file in memory.
+        slots: The number of tokens kept in the file.
+        ttl: Seconds a token is returned for after it was written.
+
+    Raises:
+        ValueError: The file exists with a different layout.
+    """
+
+    def __init__(self, path, slots=DEFAULT_SLOTS, ttl=DEFAULT_TTL):
+        self.path = path
+        self.slots = slots
+        self.ttl = ttl
+        size = _FILE_HEADER.size + slots * SLOT_SIZE
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, _FILE_HEADER.size, 0)
+        try:
+            if os.fstat(self._fd).st_size == 0:
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, _FILE_HEADER.pack(_MAGIC, slots,
+                                                      SLOT_SIZE), 0)
+            header = _FILE_HEADER.unpack(
+                os.pread(self._fd, _FILE_HEADER.size, 0))
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, _FILE_HEADER.size, 0)
+        if header != (_MAGIC, slots, SLOT_SIZE):
+            os.close(self._fd)
+            raise ValueError('{0} is not a token cache of {1} slots.'.format(
+                path, slots))
+        self._map = mmap.mmap(self._fd, size)
+        # lockf only excludes other processes, the threads of this process
+        # also take one of these locks.
+        self._thread_locks = [threading.Lock() for _ in range(64)]
+
+    def _slot(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'),
+                                 digest_size=16).digest()
+        index = int.from_bytes(digest[:8], 'little') % self.slots
+        return _FILE_HEADER.size + index * SLOT_SIZE, digest
+
+    def _read(self, offset):
+        for _ in range(_READ_ATTEMPTS):
+            (sequence, digest, expiry, written,
+             length) = _SLOT_HEADER.unpack_from(self._map, offset)
+            if sequence & 1:
+                continue
+            start = offset + _SLOT_HEADER.size
+            payload = self._map[start:start + length]
+            if _SEQUENCE.unpack_from(self._map, offset)[0] == sequence:
+                return digest, expiry, written, payload
+        return None
+
+    def get(self, key):
+        """Returns the cached token of a storage key, unless it is about to
+        expire or was written more than ``ttl`` seconds ago.
+
+        Args:
+            key: string, the storage key.
+
+        Returns:
+            A tuple of the access token, its expiry as a POSIX timestamp and
+            its scopes, or None.
+        """
+        offset, digest = self._slot(key)
+        entry = self._read(offset)
+        now = time.time()
+        if (entry is None or entry[0] != digest or
+                entry[1] - REFRESH_MARGIN <= now or
+                entry[2] + self.ttl <= now):
+            return None
+        token, _, scopes = entry[3].decode('utf-8').partition('\n')
+        return token, entry[1], scopes.split() if scopes else []
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        """Locks the slot of a storage key against other threads and
+        processes of the host.
+
+        Args:
+            key: string, the storage key.
+        """
+        offset, _ = self._slot(key)
+        with self._thread_locks[offset // SLOT_SIZE %
+                                len(self._thread_locks)]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, SLOT_SIZE, offset)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, SLOT_SIZE, offset)
+
+    def _write(self, offset, digest, expiry, payload):
+        sequence = _SEQUENCE.unpack_from(self._map, offset)[0]
+        _SEQUENCE.pack_into(self._map, offset, sequence | 1)
+        _SLOT_HEADER.pack_into(self._map, offset, sequence | 1, digest,
+                               expiry, time.time(), len(payload))
+        start = offset + _SLOT_HEADER.size
+        self._map[start:start + len(payload)] = payload
+        _SEQUENCE.pack_into(self._map, offset, (sequence | 1) + 1)
+
+    def put(self, key, token, expiry, scopes=()):
+        """Caches the access token of a storage key.
+
+        Args:
+            key: string, the storage key.
+            token: string, the access token.
+            expiry: The expiry of the token as a POSIX timestamp.
+            scopes: The scopes of the token.
+
+        Returns:
+            False if the token and scopes are too long for a slot, in which
+            case any token cached for the key is dropped.
+        """
+        with self.lock(key):
+            return self._put(key, token, expiry, scopes)
+
+    def _put(self, key, token, expiry, scopes):
+        # The slot of the key must be locked.
+        offset, digest = self._slot(key)
+        payload = '{0}\n{1}'.format(token, ' '.join(scopes)).encode('utf-8')
+        if len(payload) > MAX_PAYLOAD:
+            self._delete(key)
+            return False
+        self._write(offset, digest, expiry, payload)
+        return True
+
+    def delete(self, key):
+        """Drops the token cached for a storage key, if any."""
+        with self.lock(key):
+            self._delete(key)
+
+    def _delete(self, key):
+        offset, digest = self._slot(key)
+        entry = self._read(offset)
+        if entry is not None and entry[0] == digest:
+            self._write(offset, bytes(16), 0.0, b'')
+
+    def close(self):
+        """Unmaps the file."""
+        self._map.close()
+        os.close(self._fd)
+
+
+def get_cache(path, slots=DEFAULT_SLOTS, ttl=DEFAULT_TTL):
+    """Returns the process-wide :class:`SharedTokenCache` of a file.
+
+    Args:
+        path: The path of the file.
+        slots: The number of tokens kept in the file.
+        ttl: Seconds a token is returned for after it was written.
+    """
+    cache = _caches.get(path)
+    if cache is None:
+        with _lock:
+            cache = _caches.get(path)
+            if cache is None:
+                cache = _caches[path] = SharedTokenCache(path, slots, ttl)
+    return cache
+
+
+def clear():
+    """Closes the process-wide caches."""
+    with _lock:
+        for cache in _caches.values():
+            cache.close()
+        _caches.clear()
+
+
+class SharedCredentials(oauth2_credentials.Credentials):
+    """Credentials holding a token read from a :class:`SharedTokenCache`.
+
+    They hold no refresh token; :meth:`refresh` loads the full credentials
+    from the storage, and so does the first use of :attr:`id_token`.
+    """
+
+    def __init__(self, storage, token, expiry, scopes, client_id=None):
+        super(SharedCredentials, self).__init__(
+            token, expiry=_EPOCH + datetime.timedelta(seconds=expiry),
+            scopes=scopes, client_id=client_id)
+        self._storage = storage
+        self._id_token_loaded = False
+
+    @property
+    def id_token(self):
+        """The ID token of the credentials in the storage, or None."""
+        if not self._id_token_loaded:
+            credentials = self._storage.backend.get()
+            if credentials is not None:
+                self._id_token = getattr(credentials, 'id_token', None)
+            self._id_token_loaded = True
+        return self._id_token
+
+    def refresh(self, request):
+        self.token, self.expiry = self._storage.refresh(request, self.token)
+
+
+class SharedTokenStorage(Storage):
+    """Reads access tokens from a :class:`SharedTokenCache` in front of
+    another storage.
+
+    Args:
+        backend: The storage of the credentials.
+        cache: A :class:`SharedTokenCache`.
+        key: string, the key of the credentials in the cache.
+        client_id: Optional client ID of the credentials read from the
+                   cache.
+    """
+
+    def __init__(self, backend, cache, key, client_id=None):
+        super(SharedTokenStorage, self).__init__()
+        self.backend = backend
+        self.cache = cache
+        self.key = key
+        self.client_id = client_id
+
+    @property
+    def extra_fields(self):
+        """The ``extra_fields`` of the backend storage."""
+        return self.backend.extra_fields
+
+    def fingerprint(self, credentials):
+        """Fingerprints :class:`SharedCredentials` by their token only, as
+        reading their ID token would load the backend credentials."""
+        if isinstance(credentials, SharedCredentials):
+            return '{0} {1} {2}'.format(credentials.token, credentials.expiry,
+                                        credentials.scopes)
+        return super(SharedTokenStorage, self).fingerprint(credentials)
+
+    def _cache_put(self, credentials):
+        if credentials is None or credentials.expiry is None:
+            self.cache.delete(self.key)
+        else:
+            self.cache.put(self.key, credentials.token,
+                           _timestamp(credentials.expiry),
+                           credentials.scopes or ())
+
+    def locked_get(self):
+        """Returns the cached token as :class:`SharedCredentials`, or the
+        credentials of the backend storage."""
+        entry = self.cache.get(self.key)
+        if entry is not None:
+            metrics.inc(_CACHE_METRIC, result='hit')
+            token, expiry, scopes = entry
+            return SharedCredentials(self, token, expiry, scopes,
+                                     self.client_id)
+        metrics.inc(_CACHE_METRIC, result='miss')
+        credentials = self.backend.get()
+        if credentials is not None and credentials.valid:
+            self._cache_put(credentials)
+        return credentials
+
+    def locked_put(self, credentials):
+        """Writes the credentials to the backend storage and the cache.
+
+        :class:`SharedCredentials` only hold an access token, they are not
+        written to the backend storage.
+        """
+        if not isinstance(credentials, SharedCredentials):
+            self.backend.put(credentials)
+        self._cache_put(credentials)
+
+    def locked_delete(self):
+        """Deletes the credentials from the backend storage and the
+        cache."""
+        self.cache.delete(self.key)
+        return self.backend.delete()
+
+    def refresh(self, request, stale_token=None):
+        """Refreshes the access token, once per host.
+
+        The slot of the token is locked during the refresh. A token
+        refreshed by another thread or process meanwhile is used instead.
+
+        Args:
+            request: A ``google.auth.transport.Request``.
+            stale_token: The expired token, if known.
+
+        Returns:
+            A tuple of the new access token and its expiry.
+        """
+        with self.cache.lock(self.key):
+            entry = self.cache.get(self.key)
+            if entry is not None and entry[0] != stale_token:
+                metrics.inc(_CACHE_METRIC, result='refreshed_elsewhere')
+                return entry[0], _EPOCH + datetime.timedelta(
+                    seconds=entry[1])
+            credentials = self.backend.get()
+            if credentials is None:
+                raise exceptions.RefreshError(
+                    'The credentials were deleted.')
+            credentials.refresh(request)
+            self.backend.put(credentials)
+            if credentials.expiry is None:
+                self.cache._delete(self.key)
+            else:
+                self.cache._put(self.key, credentials.token,
+                                _timestamp(credentials.expiry),
+                                credentials.scopes or ())
+        metrics.inc(_CACHE_METRIC, result='refreshed')
+        return credentials.token, credentials.expiry
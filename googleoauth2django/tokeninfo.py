@@ -0,0 +1,141 @@
+# Copyright 2016 Google Inc.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cached lookups of access tokens at Google's tokeninfo endpoint.
+
+The scopes stored with credentials are the ones the helper requested, which
+can differ from what Google granted, for example after a partial consent.
+With ``GOOGLE_OAUTH2_VERIFY_SCOPES = True``, ``UserOAuth2.has_credentials``
+also checks the requested scopes against the scopes Google reports for the
+access token.
+
+Lookups are cached in the Django cache named by
+``GOOGLE_OAUTH2_TOKENINFO_CACHE`` (``'default'`` by default), keyed by a
+hash of the access token, for the remaining lifetime of the token. Each
+token therefore costs a single call to Google however many requests use it.
+"""
+
+import hashlib
+
+import django.conf
+
+import googleoauth2django
+from googleoauth2django import metrics
+from googleoauth2django import stats
+from googleoauth2django import transport
+
+TIMEOUT = 10
+# Seconds an unknown or revoked token is remembered as invalid.
+INVALID_TTL = 60
+
+_TOKENINFO_METRIC = 'googleoauth2django_tokeninfo_total'
+_INVALID = 'invalid'
+
+# Short scope names accepted at authorization time, as tokeninfo reports
+# them.
+_SCOPE_ALIASES = {
+    'email': 'https://www.googleapis.com/auth/userinfo.email',
+    'profile': 'https://www.googleapis.com/auth/userinfo.profile',
+}
+
+
+def _cache():
+    from django.core.cache import caches
+    return caches[getattr(django.conf.settings,
+                          'GOOGLE_OAUTH2_TOKENINFO_CACHE', 'default')]
+
+
+def _cache_key(token):
+    return 'googleoauth2django:tokeninfo:{0}'.format(
+        hashlib.sha256(token.encode('utf-8')).hexdigest())
+
+
+def _fetch(token):
+    """Looks up ``token`` at the tokeninfo endpoint.
+
+    Returns:
+        The token information as a dictionary, or None if Google does not
+        consider the token valid.
+    """
+    with stats.phase(stats.PHASE_GOOGLE):
+        response = transport.get_session().get(
+            googleoauth2django.GOOGLE_TOKEN_INFO_URI,
+            params={'access_token': token}, timeout=TIMEOUT)
+    if response.status_code == 400:
+        return None
+    response.raise_for_status()
+    return response.json()
+
+
+def get_token_info(token):
+    """Returns Google's information about an access token.
+
+    Args:
+        token: string, the access token.
+
+    Returns:
+        A dictionary with the ``scope``, ``expires_in`` and other fields of
+        the tokeninfo response, or None if the token is not valid.
+    """
+    cache = _cache()
+    key = _cache_key(token)
+    info = cache.get(key)
+    if info is not None:
+        metrics.inc(_TOKENINFO_METRIC, result='hit')
+        return None if info == _INVALID else info
+
+    info = _fetch(token)
+    if info is None:
+        metrics.inc(_TOKENINFO_METRIC, result='invalid')
+        cache.set(key, _INVALID, INVALID_TTL)
+        return None
+
+    metrics.inc(_TOKENINFO_METRIC, result='fetched')
+    ttl = int(info.get('expires_in', 0))
+    if ttl > 0:
+        cache.set(key, info, ttl)
+    return info
+
+
+def granted_scopes(token):
+    """Returns the scopes Google granted to an access token.
+
+    Args:
+        token: string, the access token.
+
+    Returns:
+        A frozenset of scopes, or None if the token is not valid.
+    """
+    info = get_token_info(token)
+    if info is None:
+        return None
+    return frozenset(info.get('scope', '').split())
+
+
+def has_scopes(token, scopes):
+    """Checks that Google granted ``scopes`` to an access token.
+
+    Args:
+        token: string, the access token.
+        scopes: An iterable of scopes. The short ``email`` and ``profile``
+                scopes match their ``userinfo`` URLs.
+
+    Returns:
+        True if the token is valid and has been granted every scope.
+    """
+    granted = granted_scopes(token)
+    if granted is None:
+        return False
+    return all(scope in granted or _SCOPE_ALIASES.get(scope) in granted
+               for scope in scopes)
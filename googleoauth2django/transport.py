@@ -0,0 +1,103 @@
+# Copyright 2016 Google Inc.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Shared HTTP transport for calls made to Google.
+
+All requests the helper makes to Google go through a single process-wide
+``requests`` connection pool, so that TLS connections are reused across
+requests instead of being opened for every token exchange. Only the pool is
+shared: every caller gets its own ``requests.Session``, so cookies set by a
+response to one user's request never reach another's. ``requests`` is
+imported on first use.
+
+A child process forked from a process that already opened connections, such
+as a pre-fork server master that ran the warm-up, starts with an empty pool
+instead of sharing the TLS connections of its parent.
+"""
+
+import os
+import threading
+
+POOL_CONNECTIONS = 10
+POOL_MAXSIZE = 10
+
+_lock = threading.Lock()
+_adapter = None
+
+
+def get_adapter(url='https://'):
+    """Returns the process-wide connection pool adapter.
+
+    The adapter can be mounted on other sessions, such as the
+    ``OAuth2Session`` of a flow, to share the pooled connections.
+
+    Args:
+        url: The URL the adapter is for. HTTP and HTTPS share one adapter.
+
+    Returns:
+        A ``requests.adapters.HTTPAdapter`` keeping up to ``POOL_MAXSIZE``
+        connections per host open.
+    """
+    global _adapter
+    if _adapter is None:
+        with _lock:
+            if _adapter is None:
+                from requests import adapters
+
+                _adapter = adapters.HTTPAdapter(
+                    pool_connections=POOL_CONNECTIONS,
+                    pool_maxsize=POOL_MAXSIZE)
+    return _adapter
+
+
+def get_session():
+    """Returns a new ``requests.Session`` using the shared connection pool.
+
+    The session should not be closed, closing it closes the shared pool.
+
+    Returns:
+        A ``requests.Session`` whose HTTP and HTTPS adapters are the adapter
+        of :func:`get_adapter`.
+    """
+    import requests
+
+    session = requests.Session()
+    adapter = get_adapter()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def _reset_after_fork():
+    """Drops the pool inherited from the parent process.
+
+    The connections are not closed, they still belong to the parent.
+    """
+    global _adapter, _lock
+    _adapter = None
+    _lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def preconnect(url, timeout=5):
+    """Opens a connection to the host of ``url`` and keeps it in the pool.
+
+    Args:
+        url: A URL on the host to connect to.
+        timeout: Seconds to wait for the host.
+    """
+    get_session().head(url, timeout=timeout, allow_redirects=False)
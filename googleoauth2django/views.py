@@ -19,28 +19,56 @@ view. The authorize view kicks off the three-legged OAuth flow, and the
 callback view validates the flow and if successful stores the credentials
 in the configured storage."""
 
+import contextlib
 import hashlib
 import json
+import logging
 import os
+from urllib import parse
 
 from django import http
 from django import shortcuts
 from django.conf import settings
+from django.contrib import auth
+from django.db import router
+from django.db import transaction
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.utils import html
-from google_auth_oauthlib.flow import Flow
-import jsonpickle
-from oauthlib.oauth2.rfc6749.errors import OAuth2Error
-from six.moves.urllib import parse
 
 import googleoauth2django
+from googleoauth2django import bearer
 from googleoauth2django import get_oauth2_settings
 from googleoauth2django import get_storage
+from googleoauth2django import metrics
 from googleoauth2django import signals
+from googleoauth2django import stats
+from googleoauth2django import transport
+
+# google_auth_oauthlib, oauthlib and jsonpickle are imported inside the views
+# that use them, so that processes which never serve the OAuth2 flow (workers
+# of other apps, management commands) do not pay for importing them.
+
+logger = logging.getLogger(__name__)
 
 _CSRF_KEY = 'google_oauth2_csrf_token'
 _FLOW_KEY = 'google_oauth2_flow_{0}'
+_CALLBACK_METRIC = 'googleoauth2django_callback_total'
+_REDIRECT_METRIC = 'googleoauth2django_authorize_redirects_total'
+
+
+def _callback_failure(result, message):
+    """Counts a failed callback and builds the matching error response.
+
+    Args:
+        result: The ``result`` label reported to the metrics exporter.
+        message: The body of the bad request response.
+
+    Returns:
+        A ``django.http.HttpResponseBadRequest``.
+    """
+    metrics.inc(_CALLBACK_METRIC, result=result)
+    return http.HttpResponseBadRequest(message)
 
 
 def _make_flow(request, scopes, return_url=None):
@@ -55,6 +83,9 @@ def _make_flow(request, scopes, return_url=None):
     Returns:
         An OAuth2 flow object that has been stored in the session.
     """
+    from google_auth_oauthlib.flow import Flow
+    import jsonpickle
+
     # Generate a CSRF token to prevent malicious requests.
     csrf_token = hashlib.sha256(os.urandom(1024)).hexdigest()
 
@@ -64,16 +95,9 @@ def _make_flow(request, scopes, return_url=None):
         'csrf_token': csrf_token,
         'return_url': return_url,
     })
-    oauth2_settings = get_oauth2_settings()
+    tenant = googleoauth2django.get_tenant(request)
     flow_settings = {
-        "client_config": {
-            "web": {
-               "client_id": oauth2_settings.client_id,
-               "client_secret": oauth2_settings.client_secret,
-               "auth_uri": googleoauth2django.GOOGLE_AUTH_URI,
-               "token_uri": googleoauth2django.GOOGLE_TOKEN_URI
-            }
-        },
+        "client_config": tenant.client_config,
         "scopes": scopes,
         "state": state,
         "redirect_uri": request.build_absolute_uri(
@@ -100,9 +124,35 @@ def _get_flow_for_token(csrf_token, request):
     """
     flow_settings_pickle = request.session.get(_FLOW_KEY.format(csrf_token),
                                                None)
-    return None if flow_settings_pickle is None \
-        else Flow.from_client_config(**jsonpickle.decode(
-            flow_settings_pickle))
+    if flow_settings_pickle is None:
+        return None
+
+    from google_auth_oauthlib.flow import Flow
+    import jsonpickle
+
+    flow = Flow.from_client_config(**jsonpickle.decode(flow_settings_pickle))
+    # Exchange the code over the shared connection pool.
+    flow.oauth2session.mount('https://', transport.get_adapter())
+    return flow
+
+
+def _verified_claims(request, credentials):
+    """Verifies the ID token returned with ``credentials``.
+
+    Returns:
+        The claims of the ID token, or None if there is no ID token or it
+        could not be verified.
+    """
+    if not credentials.id_token:
+        return None
+    try:
+        return bearer.verify_id_token(
+            credentials.id_token,
+            (googleoauth2django.get_tenant(request).client_id,))
+    except bearer.InvalidToken:
+        logger.warning('Ignoring the ID token of new credentials, it could '
+                       'not be verified.', exc_info=True)
+        return None
 
 
 def oauth2_callback(request):
@@ -123,45 +173,86 @@ def oauth2_callback(request):
         reason = request.GET.get(
             'error_description', request.GET.get('error', ''))
         reason = html.escape(reason)
-        return http.HttpResponseBadRequest(
-            'Authorization failed {0}'.format(reason))
+        return _callback_failure(
+            'authorization_failed', 'Authorization failed {0}'.format(reason))
 
     try:
         encoded_state = request.GET['state']
         code = request.GET['code']
     except KeyError:
-        return http.HttpResponseBadRequest(
+        return _callback_failure(
+            'missing_parameters',
             'Request missing state or authorization code')
 
     try:
         server_csrf = request.session[_CSRF_KEY]
     except KeyError:
-        return http.HttpResponseBadRequest(
-            'No existing session for this flow.')
+        return _callback_failure(
+            'no_session', 'No existing session for this flow.')
 
     try:
         state = json.loads(encoded_state)
         client_csrf = state['csrf_token']
         return_url = state['return_url']
     except (ValueError, KeyError):
-        return http.HttpResponseBadRequest('Invalid state parameter.')
+        return _callback_failure('invalid_state', 'Invalid state parameter.')
 
     if client_csrf != server_csrf:
-        return http.HttpResponseBadRequest('Invalid CSRF token.')
+        return _callback_failure('invalid_csrf', 'Invalid CSRF token.')
 
     flow = _get_flow_for_token(client_csrf, request)
 
     if not flow:
-        return http.HttpResponseBadRequest('Missing Oauth2 flow.')
+        return _callback_failure('missing_flow', 'Missing Oauth2 flow.')
+
+    from oauthlib.oauth2.rfc6749.errors import OAuth2Error
 
     try:
-        flow.fetch_token(code=code)
+        with metrics.timer('googleoauth2django_token_exchange_seconds'), \
+                stats.phase(stats.PHASE_GOOGLE):
+            flow.fetch_token(code=code)
         credentials = flow.credentials
     except OAuth2Error as exchange_error:
-        return http.HttpResponseBadRequest(
+        return _callback_failure(
+            type(exchange_error).__name__,
             'An error has occurred: {0}'.format(exchange_error))
 
-    get_storage(request).put(credentials)
+    oauth2_settings = get_oauth2_settings()
+    claims = _verified_claims(request, credentials)
+    # Signing in, linking the Google account and storing the credentials
+    # succeed or fail together, in a transaction on each database written.
+    user = None
+    anonymous_user = request.user
+    try:
+        with contextlib.ExitStack() as transactions:
+            for alias in _callback_databases(oauth2_settings):
+                transactions.enter_context(transaction.atomic(using=alias))
+            if oauth2_settings.login and not request.user.is_authenticated:
+                if claims is not None:
+                    user = auth.authenticate(request, google_claims=claims)
+                if user is None:
+                    return _callback_failure('login_failed',
+                                             'Could not sign in with Google.')
+                # The session is logged in once the transactions commit,
+                # until then the credentials are only stored for the user.
+                request.user = user
+
+            # Built for the signed in user.
+            django_storage = get_storage(request)
+            if claims is not None:
+                googleoauth2django.store_identity(request, claims)
+                subject_property = (
+                    oauth2_settings.storage_model_subject_property)
+                if subject_property is not None:
+                    django_storage.extra_fields[subject_property] = (
+                        claims['sub'])
+            django_storage.put(credentials)
+    except Exception:
+        request.user = anonymous_user
+        raise
+    if user is not None:
+        auth.login(request, user)
+    metrics.inc(_CALLBACK_METRIC, result='success')
 
     signals.oauth2_authorized.send(sender=signals.oauth2_authorized,
                                    request=request, credentials=credentials)
@@ -169,6 +260,21 @@ def oauth2_callback(request):
     return shortcuts.redirect(return_url)
 
 
+def _callback_databases(oauth2_settings):
+    """Returns the aliases of the databases the callback writes to: the
+    database of the storage model, and of the users when logging in."""
+    aliases = []
+    if oauth2_settings.storage_model:
+        aliases.append(oauth2_settings.storage_model_using or
+                       router.db_for_write(
+                           googleoauth2django.get_storage_model_class()))
+    if oauth2_settings.login or not aliases:
+        alias = router.db_for_write(auth.get_user_model())
+        if alias not in aliases:
+            aliases.append(alias)
+    return aliases
+
+
 def oauth2_authorize(request):
     """ View to start the OAuth2 Authorization flow.
 
@@ -190,18 +296,23 @@ def oauth2_authorize(request):
         return_url = request.META.get('HTTP_REFERER', '/')
 
     oauth2_settings = get_oauth2_settings()
-    scopes = request.GET.getlist('scopes', oauth2_settings.scopes)
+    scopes = request.GET.getlist(
+        'scopes', googleoauth2django.get_tenant(request).scopes)
     # Model storage (but not session storage) requires a logged in user
     if oauth2_settings.storage_model:
         if not request.user.is_authenticated:
-            return redirect('{0}?next={1}'.format(
-                settings.LOGIN_URL, parse.quote(request.get_full_path())))
+            # With GOOGLE_OAUTH2_LOGIN, the callback logs the user in.
+            if not oauth2_settings.login:
+                metrics.inc(_REDIRECT_METRIC, target='login')
+                return redirect('{0}?next={1}'.format(
+                    settings.LOGIN_URL, parse.quote(request.get_full_path())))
         # This checks for the case where we ended up here because of a logged
         # out user but we had credentials for it in the first place
         else:
             user_oauth = googleoauth2django.UserOAuth2(request, scopes,
                                                        return_url)
             if user_oauth.has_credentials():
+                metrics.inc(_REDIRECT_METRIC, target='return_url')
                 return redirect(return_url)
 
     flow = _make_flow(request=request, scopes=scopes, return_url=return_url)
@@ -213,4 +324,5 @@ def oauth2_authorize(request):
         # Enable incremental authorization. Recommended as a best practice.
         include_granted_scopes='true')
 
+    metrics.inc(_REDIRECT_METRIC, target='google')
     return shortcuts.redirect(auth_url)
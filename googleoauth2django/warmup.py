@@ -0,0 +1,137 @@
+# Copyright 2016 Google Inc.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Startup warm-up for the Django OAuth2 Helper.
+
+Without warm-up, the first OAuth2 request served by a new process loads the
+client secrets, imports the flow libraries, builds the URL resolver and opens
+a TLS connection to Google. Enabling warm-up does that work in
+``AppConfig.ready()`` instead, so rolling restarts do not cause a latency
+spike.
+
+.. code-block:: python
+   :caption: settings.py
+   :name: warmup
+
+   # Run every warm-up step.
+   GOOGLE_OAUTH2_WARMUP = True
+   # Or only some of them.
+   GOOGLE_OAUTH2_WARMUP = ('settings', 'imports', 'urls')
+
+Since ``ready()`` also runs for management commands, warm-up is best enabled
+only in the settings used by the web server. Connections opened by the
+``connections`` step are dropped in processes forked afterwards, so with a
+pre-fork server that loads the application before forking, such as gunicorn
+with ``--preload``, the step only helps if ``ready()`` also runs in the
+workers. Every step is timed; the times
+are logged to the ``googleoauth2django.warmup`` logger and recorded in the
+``googleoauth2django_warmup_seconds`` metric. A failing step is logged and
+does not prevent the process from starting.
+"""
+
+import collections
+import logging
+import time
+
+from django.urls import reverse
+
+import googleoauth2django
+from googleoauth2django import metrics
+from googleoauth2django import transport
+
+logger = logging.getLogger(__name__)
+
+_STEPS = collections.OrderedDict()
+
+
+def register(name):
+    """Decorator registering a warm-up step under ``name``."""
+    def decorator(step):
+        _STEPS[name] = step
+        return step
+    return decorator
+
+
+@register('settings')
+def _warm_settings():
+    """Loads the settings and client secrets."""
+    googleoauth2django.get_oauth2_settings()
+
+
+@register('imports')
+def _warm_imports():
+    """Imports the libraries the views and credentials import lazily."""
+    import google.oauth2.credentials  # noqa: F401
+    import google_auth_oauthlib.flow  # noqa: F401
+    import jsonpickle  # noqa: F401
+    import oauthlib.oauth2.rfc6749.errors  # noqa: F401
+    import requests_oauthlib  # noqa: F401
+
+
+@register('urls')
+def _warm_urls():
+    """Populates the URL resolver cache used to build redirect URLs."""
+    reverse('google_oauth:authorize')
+    reverse('google_oauth:callback')
+
+
+@register('connections')
+def _warm_connections():
+    """Opens a pooled connection to the Google token endpoint."""
+    transport.preconnect(googleoauth2django.GOOGLE_TOKEN_URI)
+
+
+def run(steps=None):
+    """Runs the warm-up steps.
+
+    Args:
+        steps: Names of the steps to run, defaults to all registered steps.
+
+    Returns:
+        An ordered mapping of step name to the seconds it took.
+    """
+    report = collections.OrderedDict()
+    start = time.perf_counter()
+    for name, step in _STEPS.items():
+        if steps is not None and name not in steps:
+            continue
+        step_start = time.perf_counter()
+        try:
+            with metrics.timer('googleoauth2django_warmup_seconds',
+                               step=name):
+                step()
+        except Exception:
+            logger.warning('OAuth2 warm-up step %s failed.', name,
+                           exc_info=True)
+        report[name] = time.perf_counter() - step_start
+        logger.info('OAuth2 warm-up step %s took %.1fms.', name,
+                    report[name] * 1000)
+    logger.info('OAuth2 warm-up took %.1fms.',
+                (time.perf_counter() - start) * 1000)
+    return report
+
+
+def configure(settings_instance):
+    """Runs the warm-up steps enabled by ``GOOGLE_OAUTH2_WARMUP``.
+
+    Args:
+        settings_instance: An instance of ``django.conf.settings``.
+
+    Returns:
+        The report of :func:`run`, or None if warm-up is disabled.
+    """
+    setting = getattr(settings_instance, 'GOOGLE_OAUTH2_WARMUP', False)
+    if not setting:
+        return None
+    return run(None if setting is True else setting)
@@ -0,0 +1,88 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compares the RSA backends used to sign and verify tokens.
+
+For each backend of ``googleoauth2django.crypt``, reports the time to parse
+a key and a certificate, to sign a JWT, and to verify a JWT with and without
+the verifier cache, and the share of a CPU core spent verifying tokens at
+the given volume.
+
+Usage::
+
+    python scripts/bench_crypt.py [tokens per second]
+"""
+
+import os
+import sys
+import time
+import timeit
+
+from google.auth import jwt
+
+from googleoauth2django import crypt
+
+NUMBER = 200
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'tests', 'data')
+
+
+def _read(name):
+    with open(os.path.join(DATA_DIR, name)) as data_file:
+        return data_file.read()
+
+
+def _us(function):
+    function()
+    return timeit.timeit(function, number=NUMBER) / NUMBER * 1e6
+
+
+def _bench(backend, private_key, certs, volume):
+    module = crypt._backend_module(backend)
+    now = int(time.time())
+    payload = {'iss': 'robot@example.com', 'aud': 'audience', 'iat': now,
+               'exp': now + 3600}
+    signer = crypt.signer(private_key, 'key-1', backend)
+    token = jwt.encode(signer, payload).decode('ascii')
+
+    def verify_uncached():
+        crypt.clear()
+        crypt.decode_jwt(token, certs, 'audience', backend)
+
+    parse_key = _us(lambda: module.RSASigner.from_string(private_key))
+    parse_cert = _us(lambda: module.RSAVerifier.from_string(certs['key-1']))
+    sign = _us(lambda: jwt.encode(signer, payload))
+    uncached = _us(verify_uncached)
+    cached = _us(lambda: crypt.decode_jwt(token, certs, 'audience', backend))
+    print('{0:<13} {1:>10.0f} {2:>10.0f} {3:>10.0f} {4:>11.0f} {5:>11.0f} '
+          '{6:>10.1f}%'.format(backend, parse_key, parse_cert, sign,
+                               uncached, cached, cached * volume / 1e4))
+
+
+def main():
+    volume = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    private_key = _read('privatekey.pem')
+    certs = {'key-1': _read('public_cert.pem')}
+    available = crypt.available_backends()
+    print('{0:<13} {1:>10} {2:>10} {3:>10} {4:>11} {5:>11} {6:>11}'.format(
+        'backend', 'key (us)', 'cert (us)', 'sign (us)', 'verify (us)',
+        'cached (us)', 'core@{0}/s'.format(volume)))
+    for backend, _ in crypt.BACKENDS:
+        if backend in available:
+            _bench(backend, private_key, certs, volume)
+        else:
+            print('{0:<13} not installed'.format(backend))
+
+
+if __name__ == '__main__':
+    main()
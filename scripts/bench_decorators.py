@@ -0,0 +1,73 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measures the overhead of the OAuth2 decorators on a view.
+
+Reports the time of a request to a view that returns at once, undecorated
+and decorated with ``oauth_enabled`` and ``oauth_required``, for a user
+whose credentials cover the scopes of the view. The credentials are kept
+on the request, so only the work of the decorators is measured.
+
+Usage::
+
+    DJANGO_SETTINGS_MODULE=tests.settings python scripts/bench_decorators.py
+"""
+
+import timeit
+
+import django
+from django.test import RequestFactory
+import mock
+
+import googleoauth2django
+from googleoauth2django import decorators
+
+NUMBER = 50000
+SCOPES = ['https://www.googleapis.com/auth/drive',
+          'https://www.googleapis.com/auth/calendar']
+
+
+class _Credentials(object):
+
+    def __init__(self, scopes):
+        self.valid = True
+        self.scopes = scopes
+
+
+def _view(request):
+    return None
+
+
+def main():
+    django.setup()
+    request = RequestFactory().get('/view?page=2')
+    request.session = {}
+    granted = list(googleoauth2django.get_oauth2_settings().scopes) + SCOPES
+    credentials = _Credentials(granted)
+    views = [
+        ('undecorated', _view),
+        ('oauth_enabled', decorators.oauth_enabled(_view, scopes=SCOPES)),
+        ('oauth_required', decorators.oauth_required(_view, scopes=SCOPES)),
+    ]
+    print('{0:<16} {1:>10}'.format('view', 'time (us)'))
+    with mock.patch('googleoauth2django._credentials_from_request',
+                    lambda request: credentials):
+        for name, view in views:
+            view(request)
+            elapsed = timeit.timeit(lambda: view(request), number=NUMBER)
+            print('{0:<16} {1:>10.2f}'.format(name, elapsed / NUMBER * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compares scope checks with sets of strings and with interned masks.
+
+For views requiring a growing number of scopes, and credentials granted
+them all, reports the time to build the required scope set and check that
+the credentials cover it, with the sets of strings the decorators used to
+build on every request and with :mod:`googleoauth2django.scope_set` masks,
+and the time of a request to an ``oauth_enabled`` view calling
+``has_credentials``.
+
+Usage::
+
+    DJANGO_SETTINGS_MODULE=tests.settings python scripts/bench_scopes.py
+"""
+
+import timeit
+
+import django
+from django.test import RequestFactory
+import mock
+
+import googleoauth2django
+from googleoauth2django import decorators
+from googleoauth2django import scope_set
+
+NUMBER = 20000
+SIZES = (1, 10, 50, 200)
+
+
+def _scopes(size):
+    return ['https://www.googleapis.com/auth/scope{0}'.format(i)
+            for i in range(size)]
+
+
+def _bench_sets(default_scopes, view_scopes, granted):
+    def check():
+        required = set(default_scopes) | set(view_scopes)
+        return set(required | set(granted)).issubset(set(granted))
+    return timeit.timeit(check, number=NUMBER) / NUMBER * 1e6
+
+
+def _bench_masks(default_scopes, view_scopes, granted):
+    default_mask = scope_set.mask(default_scopes)
+    view_mask = scope_set.mask(view_scopes)
+
+    def check():
+        required = default_mask | view_mask
+        return scope_set.covers(scope_set.lookup(granted), required)
+    return timeit.timeit(check, number=NUMBER) / NUMBER * 1e6
+
+
+def _bench_view(view_scopes, granted):
+    @decorators.oauth_enabled(scopes=view_scopes)
+    def view(request):
+        return request.oauth.has_credentials()
+
+    request = RequestFactory().get('/')
+    request.session = {}
+    credentials = mock.Mock(valid=True, scopes=granted)
+    with mock.patch('googleoauth2django._credentials_from_request',
+                    return_value=credentials):
+        assert view(request)
+        return timeit.timeit(lambda: view(request),
+                             number=NUMBER // 10) / (NUMBER // 10) * 1e6
+
+
+def main():
+    django.setup()
+    default_scopes = googleoauth2django.get_oauth2_settings().scopes
+    print('{0:>6} {1:>10} {2:>10} {3:>10}'.format(
+        'scopes', 'sets (us)', 'masks (us)', 'view (us)'))
+    for size in SIZES:
+        view_scopes = _scopes(size)
+        granted = list(default_scopes) + view_scopes
+        print('{0:>6} {1:>10.2f} {2:>10.2f} {3:>10.1f}'.format(
+            size, _bench_sets(default_scopes, view_scopes, granted),
+            _bench_masks(default_scopes, view_scopes, granted),
+            _bench_view(view_scopes, granted)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compares the session formats used for credentials.
+
+For each format, reports the size of the encoded session as stored by the
+signed cookie and database session backends, and the time to save and load
+a signed cookie session, including decoding the credentials.
+
+Usage::
+
+    DJANGO_SETTINGS_MODULE=tests.settings \
+        python scripts/bench_session_format.py
+"""
+
+import datetime
+import timeit
+
+import django
+from django.contrib.sessions.backends import db
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from google.oauth2.credentials import Credentials
+import jsonpickle
+
+from googleoauth2django.helpers import session_codec
+
+NUMBER = 2000
+
+
+def _credentials():
+    credentials = Credentials(
+        'ya29.' + 'a' * 160, refresh_token='1/' + 'r' * 60,
+        id_token='eyJ' + 'i' * 800,
+        token_uri='https://oauth2.googleapis.com/token',
+        client_id='1234567890-' + 'c' * 32 + '.apps.googleusercontent.com',
+        client_secret='s' * 24,
+        scopes=['email', 'profile',
+                'https://www.googleapis.com/auth/calendar'])
+    credentials.expiry = datetime.datetime(2019, 2, 1, 12, 30, 15)
+    return credentials
+
+
+def _bench(name, encode, decode):
+    store = SessionStore()
+    credentials = _credentials()
+
+    def save():
+        store._session_cache = {'credentials': encode(credentials)}
+        return store._get_session_key()
+
+    cookie = save()
+
+    def load():
+        data = store._session_cache = SessionStore(
+            session_key=cookie).load()
+        return decode(data['credentials'])
+
+    load()
+    db_size = len(db.SessionStore().encode(
+        {'credentials': encode(credentials)}))
+    save_us = timeit.timeit(save, number=NUMBER) / NUMBER * 1e6
+    load_us = timeit.timeit(load, number=NUMBER) / NUMBER * 1e6
+    print('{0:<12} {1:>8} {2:>8} {3:>10.1f} {4:>10.1f}'.format(
+        name, len(cookie), db_size, save_us, load_us))
+
+
+def main():
+    django.setup()
+    print('{0:<12} {1:>8} {2:>8} {3:>10} {4:>10}'.format(
+        'format', 'cookie', 'db', 'save (us)', 'load (us)'))
+    _bench('jsonpickle', jsonpickle.encode, jsonpickle.decode)
+    _bench('dict', session_codec.encode, session_codec.decode)
+    _bench('compressed',
+           lambda credentials: session_codec.encode(credentials, True),
+           session_codec.decode)
+
+
+if __name__ == '__main__':
+    main()
@@ -14,7 +14,8 @@ dev_deps = [
     'django-extensions'
 ]
 extras = {
-    'dev': dev_deps
+    'dev': dev_deps,
+    'discovery': ['google-api-python-client>=1.7.0'],
 }
 setup(
     name='googleoauth2django',
@@ -14,14 +14,90 @@
 
 """Setups the Django test environment and provides helper classes."""
 
+import datetime
+import os
+import time
+
 import django
 from django import test
 from django.contrib.sessions.backends.file import SessionStore
 from django.test.runner import DiscoverRunner
+from google.auth import exceptions
+
+from googleoauth2django.helpers.dictionary_storage import Storage
 
 django.setup()
 default_app_config = 'tests.apps.AppConfig'
 
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+def read_data(name):
+    """Returns the contents of a file of the tests data directory."""
+    with open(os.path.join(DATA_DIR, name)) as data_file:
+        return data_file.read()
+
+
+class FakeCredentials(object):
+    """Credentials counting their refreshes, and logging them to a file when
+    given one."""
+
+    def __init__(self, token, expires_in, refreshable=True, log_path=None,
+                 id_token=None):
+        self.token = token
+        self.expiry = (datetime.datetime.utcnow() +
+                       datetime.timedelta(seconds=expires_in))
+        self.scopes = ['email']
+        self.id_token = id_token
+        self.refreshable = refreshable
+        self.log_path = log_path
+        self.refreshes = 0
+
+    @property
+    def valid(self):
+        return self.expiry > datetime.datetime.utcnow()
+
+    def refresh(self, request):
+        if not self.refreshable:
+            raise exceptions.RefreshError('No refresh token.')
+        time.sleep(0.05)
+        if self.log_path is not None:
+            with open(self.log_path, 'a') as log:
+                log.write('{0}\n'.format(os.getpid()))
+        self.refreshes += 1
+        self.token = 'refreshed{0}'.format(self.refreshes)
+        self.expiry = (datetime.datetime.utcnow() +
+                       datetime.timedelta(seconds=3600))
+
+
+class MemoryStorage(Storage):
+    """Keeps the credentials object as is, and the token it was stored
+    with."""
+
+    def __init__(self, credentials=None):
+        super(MemoryStorage, self).__init__()
+        self.credentials = credentials
+        self.stored_token = getattr(credentials, 'token', None)
+        self.puts = 0
+
+    def locked_get(self):
+        return self.credentials
+
+    def locked_put(self, credentials):
+        self.puts += 1
+        self.credentials = credentials
+        self.stored_token = credentials.token
+
+    def locked_delete(self):
+        self.credentials = None
+
+    def update(self, credentials, token=None):
+        if self.credentials is None or (token is not None and
+                                        self.stored_token != token):
+            return False
+        self.locked_put(credentials)
+        return True
+
 
 class TestWithDjangoEnvironment(test.TestCase):
     @classmethod
@@ -17,9 +17,12 @@
 import errno
 from io import StringIO
 import os
+import shutil
 import tempfile
 import unittest
 
+import mock
+
 from googleoauth2django import GOOGLE_AUTH_URI, \
     GOOGLE_REVOKE_URI, GOOGLE_TOKEN_URI
 from googleoauth2django.helpers import _helpers
@@ -275,3 +278,60 @@ class CachedClientsecretsTests(unittest.TestCase):
         client_type, client_info = clientsecrets.loadfile(VALID_FILE)
         self.assertEqual('web', client_type)
         self.assertEqual('foo_client_secret', client_info['client_secret'])
+
+
+class FileCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.filename = os.path.join(directory, 'client_secrets.json')
+        self._write('foo_client_secret')
+
+    def _write(self, client_secret):
+        with open(VALID_FILE) as source:
+            contents = source.read()
+        with open(self.filename, 'w') as file_obj:
+            file_obj.write(
+                contents.replace('foo_client_secret', client_secret))
+
+    def _client_secret(self, cache):
+        return clientsecrets.loadfile(
+            self.filename, cache=cache)[1]['client_secret']
+
+    def test_file_read_once(self):
+        cache = clientsecrets.FileCache()
+        self.assertTrue(cache.changed(self.filename))
+        self.assertEqual(self._client_secret(cache), 'foo_client_secret')
+        self.assertFalse(cache.changed(self.filename))
+        with mock.patch('googleoauth2django.helpers.clientsecrets._loadfile',
+                        side_effect=AssertionError) as loadfile:
+            self.assertEqual(self._client_secret(cache), 'foo_client_secret')
+        self.assertFalse(loadfile.called)
+
+    def test_rewritten_file_read_again(self):
+        cache = clientsecrets.FileCache()
+        self._client_secret(cache)
+        self._write('rotated_secret')
+        # Rewritten within the resolution of the modification time.
+        stat = os.stat(self.filename)
+        os.utime(self.filename, ns=(stat.st_atime_ns,
+                                    stat.st_mtime_ns + 1000000))
+        self.assertTrue(cache.changed(self.filename))
+        self.assertEqual(self._client_secret(cache), 'rotated_secret')
+
+    def test_missing_file(self):
+        cache = clientsecrets.FileCache()
+        with self.assertRaises(clientsecrets.InvalidClientSecretsError):
+            clientsecrets.loadfile(NONEXISTENT_FILE, cache=cache)
+        self.assertTrue(cache.changed(NONEXISTENT_FILE))
+
+    def test_shared_django_cache(self):
+        shared = clientsecrets.DjangoCacheAdapter()
+        self._client_secret(clientsecrets.FileCache(shared))
+        with mock.patch('googleoauth2django.helpers.clientsecrets._loadfile',
+                        side_effect=AssertionError) as loadfile:
+            self.assertEqual(
+                self._client_secret(clientsecrets.FileCache(shared)),
+                'foo_client_secret')
+        self.assertFalse(loadfile.called)
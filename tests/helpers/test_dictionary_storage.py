@@ -20,6 +20,7 @@ from google.oauth2.credentials import Credentials
 import jsonpickle
 
 from googleoauth2django import GOOGLE_TOKEN_URI
+from googleoauth2django import metrics
 from googleoauth2django.helpers import dictionary_storage
 
 
@@ -65,6 +66,17 @@ class _FakeLock(object):
         self._release_count += 1
 
 
+class _CountingDict(dict):
+
+    def __init__(self):
+        super(_CountingDict, self).__init__()
+        self.writes = 0
+
+    def __setitem__(self, key, value):
+        self.writes += 1
+        super(_CountingDict, self).__setitem__(key, value)
+
+
 class DictionaryStorageTests(unittest.TestCase):
 
     def test_constructor_defaults(self):
@@ -151,3 +163,42 @@ class DictionaryStorageTests(unittest.TestCase):
         self.assertEqual(lock._release_count, 0)
         storage.release_lock()
         self.assertEqual(lock._release_count, 1)
+
+    def test_put_unchanged_is_skipped(self):
+        exporter = metrics.InMemoryExporter()
+        metrics.set_exporter(exporter)
+        self.addCleanup(metrics.set_exporter, None)
+        dictionary = _CountingDict()
+        dictionary['credentials'] = jsonpickle.encode(_generate_credentials())
+        storage = dictionary_storage.DictionaryStorage(dictionary,
+                                                       'credentials')
+
+        credentials = storage.get()
+        storage.put(credentials)
+
+        self.assertEqual(dictionary.writes, 1)
+        self.assertEqual(exporter.counter_value(
+            'googleoauth2django_storage_writes_skipped_total',
+            backend='DictionaryStorage'), 1)
+
+    def test_put_changed_is_written(self):
+        dictionary = _CountingDict()
+        storage = dictionary_storage.DictionaryStorage(dictionary,
+                                                       'credentials')
+
+        credentials = _generate_credentials()
+        storage.put(credentials)
+        storage.put(credentials)
+        self.assertEqual(dictionary.writes, 1)
+
+        credentials.token = 'refreshed'
+        storage.put(credentials)
+        self.assertEqual(dictionary.writes, 2)
+
+        storage.delete()
+        storage.put(credentials)
+        self.assertEqual(dictionary.writes, 3)
+
+        credentials._id_token = 'new-id-token'
+        storage.put(credentials)
+        self.assertEqual(dictionary.writes, 4)
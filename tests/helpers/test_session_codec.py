@@ -0,0 +1,99 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for googleoauth2django.helpers.session_codec."""
+
+import datetime
+import json
+import unittest
+
+from google.oauth2.credentials import Credentials
+import jsonpickle
+
+from googleoauth2django import GOOGLE_TOKEN_URI
+from googleoauth2django.helpers import dictionary_storage
+from googleoauth2django.helpers import session_codec
+
+
+def _generate_credentials():
+    credentials = Credentials(
+        'token', refresh_token='refresh_token', token_uri=GOOGLE_TOKEN_URI,
+        client_id='client_id', client_secret='client_secret',
+        scopes=['email', 'profile'])
+    credentials.expiry = datetime.datetime(2019, 2, 1, 12, 30, 15)
+    return credentials
+
+
+class SessionCodecTests(unittest.TestCase):
+
+    def _assert_same(self, returned, credentials):
+        self.assertIsInstance(returned, Credentials)
+        for field in ('token', 'refresh_token', 'id_token', 'token_uri',
+                      'client_id', 'client_secret', 'scopes', 'expiry'):
+            self.assertEqual(getattr(returned, field),
+                             getattr(credentials, field))
+
+    def test_dict_round_trip(self):
+        credentials = _generate_credentials()
+        encoded = session_codec.encode(credentials)
+        self.assertIsInstance(encoded, dict)
+        self.assertNotIn('id_token', encoded)
+        # Must survive Django's JSON session serializer unchanged.
+        self.assertEqual(json.loads(json.dumps(encoded)), encoded)
+        self._assert_same(session_codec.decode(encoded), credentials)
+
+    def test_extra_fields_round_trip(self):
+        credentials = Credentials(
+            'token', refresh_token='refresh_token', id_token='id_token',
+            token_uri=GOOGLE_TOKEN_URI, client_id='client_id',
+            client_secret='client_secret', scopes=['email'],
+            default_scopes=['openid'], granted_scopes=['email', 'openid'],
+            quota_project_id='project', rapt_token='rapt',
+            enable_reauth_refresh=True, trust_boundary={'locations': []},
+            universe_domain='example.com', account='user@example.com')
+        encoded = session_codec.encode(credentials)
+        self.assertEqual(json.loads(json.dumps(encoded)), encoded)
+        returned = session_codec.decode(encoded)
+        self._assert_same(returned, credentials)
+        for field in ('default_scopes', 'granted_scopes', 'quota_project_id',
+                      'rapt_token', 'universe_domain', 'account',
+                      '_enable_reauth_refresh', '_trust_boundary'):
+            self.assertEqual(getattr(returned, field),
+                             getattr(credentials, field))
+
+    def test_compressed_round_trip(self):
+        credentials = _generate_credentials()
+        encoded = session_codec.encode(credentials, compress=True)
+        self.assertTrue(encoded.startswith(session_codec.COMPRESSED_PREFIX))
+        self._assert_same(session_codec.decode(encoded), credentials)
+
+    def test_no_expiry(self):
+        credentials = _generate_credentials()
+        credentials.expiry = None
+        self.assertIsNone(
+            session_codec.decode(session_codec.encode(credentials)).expiry)
+
+    def test_legacy_jsonpickle(self):
+        credentials = _generate_credentials()
+        self._assert_same(
+            session_codec.decode(jsonpickle.encode(credentials)), credentials)
+
+    def test_dictionary_storage_compress(self):
+        dictionary = {}
+        storage = dictionary_storage.DictionaryStorage(
+            dictionary, 'credentials', compress=True)
+        storage.put(_generate_credentials())
+        self.assertTrue(dictionary['credentials'].startswith(
+            session_codec.COMPRESSED_PREFIX))
+        self._assert_same(storage.get(), _generate_credentials())
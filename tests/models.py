@@ -14,12 +14,21 @@
 
 """Models used in our tests"""
 
+import uuid
+
 from django.contrib.auth.models import User
 from django.db import models
 
 from googleoauth2django.models import CredentialsField
+from googleoauth2django.models import GoogleSubjectField
 
 
 class CredentialsModel(models.Model):
     user_id = models.OneToOneField(User, on_delete=models.CASCADE)
     credentials = CredentialsField()
+    google_sub = GoogleSubjectField()
+
+
+class UUIDCredentialsModel(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    credentials = CredentialsField()
@@ -0,0 +1,177 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the Google sign-in authentication backend."""
+
+import json
+
+from django.contrib.auth import models as django_models
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.db import transaction
+from django.test import override_settings
+from google.oauth2.credentials import Credentials
+import mock
+
+from googleoauth2django import backends
+from googleoauth2django import views
+from tests import models
+from tests import TestWithDjangoEnvironment
+
+CLAIMS = {'sub': '1234', 'email': 'bill@example.com'}
+
+
+class _Settings(object):
+    """The settings used by the backend and the callback."""
+    client_id = 'client-id'
+    login = True
+    storage_model = 'tests.models.CredentialsModel'
+    storage_model_user_property = 'user_id'
+    storage_model_credentials_property = 'credentials'
+    storage_model_subject_property = 'google_sub'
+    negative_cache = None
+    storage_model_using = None
+    storage_model_read_your_writes = None
+    shared_token_cache = None
+    broker = None
+    tenants = None
+
+
+class _BackendTestCase(TestWithDjangoEnvironment):
+
+    def setUp(self):
+        super(_BackendTestCase, self).setUp()
+        cache.clear()
+        for target in ('googleoauth2django.get_oauth2_settings',
+                       'googleoauth2django.views.get_oauth2_settings'):
+            patcher = mock.patch(target, return_value=_Settings())
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class GoogleOAuth2BackendTest(_BackendTestCase):
+
+    def setUp(self):
+        super(GoogleOAuth2BackendTest, self).setUp()
+        self.backend = backends.GoogleOAuth2Backend()
+        self.user = django_models.User.objects.create_user(
+            username='bill', email='bill@example.com', password='hunter2')
+        models.CredentialsModel.objects.create(user_id=self.user,
+                                               google_sub='1234')
+
+    def test_authenticate_linked_user(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                self.backend.authenticate(None, google_claims=CLAIMS),
+                self.user)
+
+    def test_authenticate_creates_user(self):
+        user = self.backend.authenticate(
+            None, google_claims={'sub': '5678', 'email': 'ted@example.com'})
+        self.assertEqual(user.username, '5678')
+        self.assertEqual(user.email, 'ted@example.com')
+        self.assertFalse(user.has_usable_password())
+
+    def test_authenticate_unknown_user_not_created(self):
+        self.backend.create_unknown_user = False
+        self.assertIsNone(
+            self.backend.authenticate(None, google_claims={'sub': '5678'}))
+
+    def test_authenticate_inactive_user(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(
+            self.backend.authenticate(None, google_claims=CLAIMS))
+
+    def test_authenticate_without_claims(self):
+        self.assertIsNone(self.backend.authenticate(
+            None, username='bill', password='hunter2'))
+
+    def test_get_user(self):
+        self.assertEqual(self.backend.get_user(self.user.pk), self.user)
+        self.assertIsNone(self.backend.get_user(0))
+        # Changes made elsewhere are seen on the next lookup.
+        django_models.User.objects.filter(pk=self.user.pk).update(
+            is_active=False)
+        self.assertIsNone(self.backend.get_user(self.user.pk))
+
+    def test_subject_linked_once(self):
+        user = django_models.User.objects.create_user(username='ted')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            models.CredentialsModel.objects.create(user_id=user,
+                                                   google_sub='1234')
+        # Rows without an account id do not conflict.
+        models.CredentialsModel.objects.create(user_id=user)
+        models.CredentialsModel.objects.create(
+            user_id=django_models.User.objects.create_user(username='ann'))
+
+
+class SignInCallbackTest(_BackendTestCase):
+
+    def setUp(self):
+        super(SignInCallbackTest, self).setUp()
+        settings_override = override_settings(
+            AUTHENTICATION_BACKENDS=[backends.BACKEND])
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _callback(self, claims):
+        state = {'csrf_token': 'token', 'return_url': '/return'}
+        request = self.factory.get('oauth2/oauth2callback', data={
+            'state': json.dumps(state), 'code': 123})
+        self.session['google_oauth2_csrf_token'] = 'token'
+        self.session['google_oauth2_flow_token'] = 'flow'
+        request.session = self.session
+        request.user = django_models.AnonymousUser()
+        with mock.patch('googleoauth2django.views._get_flow_for_token') as (
+                get_flow), mock.patch(
+                    'googleoauth2django.views._verified_claims',
+                    return_value=claims):
+            get_flow.return_value.credentials = Credentials(
+                token='access_token', id_token='header.payload.signature')
+            response = views.oauth2_callback(request)
+        return request, response
+
+    def test_signs_in_new_user(self):
+        request, response = self._callback(CLAIMS)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], '/return')
+        self.assertEqual(request.user.username, '1234')
+        self.assertEqual(self.session['_auth_user_backend'], backends.BACKEND)
+        entity = models.CredentialsModel.objects.get(user_id=request.user)
+        self.assertEqual(entity.google_sub, '1234')
+        self.assertEqual(entity.credentials.token, 'access_token')
+
+    def test_signs_in_linked_user(self):
+        user = django_models.User.objects.create_user(username='bill')
+        models.CredentialsModel.objects.create(user_id=user,
+                                               google_sub='1234')
+        request, _ = self._callback(CLAIMS)
+        self.assertEqual(request.user, user)
+        self.assertEqual(models.CredentialsModel.objects.get(
+            user_id=user).credentials.token, 'access_token')
+
+    def test_not_signed_in_when_storing_fails(self):
+        with mock.patch('googleoauth2django.storage.DjangoORMStorage.'
+                        'locked_put', side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                self._callback(CLAIMS)
+        self.assertNotIn('_auth_user_id', self.session)
+        self.assertFalse(django_models.User.objects.exists())
+
+    def test_no_id_token(self):
+        request, response = self._callback(None)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(request.user.is_authenticated)
+        self.assertFalse(models.CredentialsModel.objects.exists())
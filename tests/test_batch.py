@@ -0,0 +1,133 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for batched API calls, against a local stub batch server."""
+
+import email.parser
+from http import server
+import json
+import threading
+import unittest
+
+import requests
+
+from googleoauth2django import batch
+
+
+class _StubBatchHandler(server.BaseHTTPRequestHandler):
+    """Answers each call of a batch with a JSON echo of its request line.
+
+    Calls to paths starting with ``/missing`` get a 404.
+    """
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        message = email.parser.BytesParser().parsebytes(
+            b'Content-Type: ' + self.headers['Content-Type'].encode() +
+            b'\r\n\r\n' + body)
+        self.server.batches.append(
+            (self.headers['Authorization'], len(message.get_payload())))
+
+        parts = []
+        for part in message.get_payload():
+            request_line, _, rest = part.get_payload().partition('\r\n')
+            method, path, _ = request_line.split(' ')
+            call_body = rest.partition('\r\n\r\n')[2]
+            status = '404 Not Found' if path.startswith('/missing') else (
+                '200 OK')
+            content = json.dumps({'method': method, 'path': path,
+                                  'body': call_body})
+            parts.append(
+                '--stub\r\nContent-Type: application/http\r\n'
+                'Content-ID: <response-{0}>\r\n\r\nHTTP/1.1 {1}\r\n'
+                'Content-Type: application/json\r\n\r\n{2}\r\n'.format(
+                    part['Content-ID'].strip('<>'), status, content))
+        # Answer out of order, as the batch endpoint is allowed to.
+        response = (''.join(reversed(parts)) + '--stub--\r\n').encode()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'multipart/mixed; boundary=stub')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+
+class BatchTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = server.HTTPServer(('127.0.0.1', 0), _StubBatchHandler)
+        cls.server.batches = []
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+        cls.batch_uri = 'http://127.0.0.1:{0}/batch'.format(
+            cls.server.server_port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.batches[:] = []
+
+    def test_execute(self):
+        calls = batch.Batch(self.batch_uri, 'token',
+                            session=requests.Session())
+        for index in range(3):
+            self.assertEqual(index, calls.add(
+                'GET', 'https://www.googleapis.com/calendar/v3/events/{0}'
+                       '?fields=id'.format(index)))
+        calls.add('POST', 'https://www.googleapis.com/calendar/v3/events',
+                  body={'summary': 'lunch'})
+
+        responses = calls.execute()
+
+        self.assertEqual(self.server.batches, [('Bearer token', 4)])
+        self.assertEqual(
+            [response.json()['path'] for response in responses],
+            ['/calendar/v3/events/0?fields=id',
+             '/calendar/v3/events/1?fields=id',
+             '/calendar/v3/events/2?fields=id',
+             '/calendar/v3/events'])
+        self.assertEqual(json.loads(responses[3].json()['body']),
+                         {'summary': 'lunch'})
+        self.assertTrue(all(response.ok for response in responses))
+        self.assertEqual(len(calls), 0)
+
+    def test_max_size(self):
+        calls = batch.Batch(self.batch_uri, 'token', max_size=2,
+                            session=requests.Session())
+        for index in range(5):
+            calls.add('GET', '/drive/v3/files/{0}'.format(index))
+
+        responses = calls.execute()
+
+        self.assertEqual([size for _, size in self.server.batches], [2, 2, 1])
+        self.assertEqual([response.json()['path'] for response in responses],
+                         ['/drive/v3/files/{0}'.format(index)
+                          for index in range(5)])
+
+    def test_failed_call(self):
+        calls = batch.Batch(self.batch_uri, 'token',
+                            session=requests.Session())
+        calls.add('GET', '/missing')
+        response, = calls.execute()
+        self.assertEqual(response.status, 404)
+        self.assertFalse(response.ok)
+        self.assertEqual(response.headers['Content-Type'], 'application/json')
@@ -0,0 +1,201 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for bearer token authentication."""
+
+import threading
+import time
+
+from django import http
+from django.contrib.auth import models as django_models
+from google.auth import crypt
+from google.auth import jwt
+import mock
+
+from googleoauth2django import bearer
+from googleoauth2django import decorators
+from tests import models
+from tests import read_data
+from tests import TestWithDjangoEnvironment
+
+AUDIENCE = 'client-id'
+
+
+PRIVATE_KEY = read_data('privatekey.pem')
+CERTS = {'key-1': read_data('public_cert.pem')}
+
+
+def _id_token(key_id='key-1', **claims):
+    now = int(time.time())
+    payload = {'iss': 'https://accounts.google.com', 'aud': AUDIENCE,
+               'sub': '1234', 'iat': now, 'exp': now + 3600}
+    payload.update(claims)
+    signer = crypt.RSASigner.from_string(PRIVATE_KEY, key_id)
+    return jwt.encode(signer, payload).decode('ascii')
+
+
+class BearerTest(TestWithDjangoEnvironment):
+
+    def setUp(self):
+        super(BearerTest, self).setUp()
+        bearer._certs = (0, 0, {})
+        patcher = mock.patch('googleoauth2django.bearer._fetch_certs',
+                             return_value=(CERTS, 3600))
+        self.fetch_certs = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch('googleoauth2django.get_oauth2_settings')
+        patcher.start().return_value = mock.Mock(
+            bearer_audiences=(AUDIENCE,),
+            storage_model='tests.models.CredentialsModel',
+            storage_model_user_property='user_id',
+            storage_model_subject_property='google_sub')
+        self.addCleanup(patcher.stop)
+
+        self.user = django_models.User.objects.create_user(
+            username='bill', email='bill@example.com', password='hunter2')
+        models.CredentialsModel.objects.create(user_id=self.user,
+                                               google_sub='1234')
+
+    def test_verify_id_token(self):
+        claims = bearer.verify(_id_token(), (AUDIENCE,))
+        self.assertEqual(claims['sub'], '1234')
+        bearer.verify(_id_token(), (AUDIENCE,))
+        self.assertEqual(self.fetch_certs.call_count, 1)
+
+    def test_unknown_key_refetches_certs(self):
+        bearer.verify(_id_token(), (AUDIENCE,))
+        self.fetch_certs.return_value = ({'key-2': CERTS['key-1']}, 3600)
+        # Fetched again at most once per interval.
+        with self.assertRaises(bearer.InvalidToken):
+            bearer.verify(_id_token(key_id='key-2'), (AUDIENCE,))
+        self.assertEqual(self.fetch_certs.call_count, 1)
+
+        expiry, fetched, certs = bearer._certs
+        bearer._certs = (expiry, fetched - bearer.MIN_REFETCH_INTERVAL, certs)
+        bearer.verify(_id_token(key_id='key-2'), (AUDIENCE,))
+        self.assertEqual(self.fetch_certs.call_count, 2)
+        with self.assertRaises(bearer.InvalidToken):
+            bearer.verify(_id_token(key_id='key-3'), (AUDIENCE,))
+        self.assertEqual(self.fetch_certs.call_count, 2)
+
+    def test_fetch_does_not_block_cached_certs(self):
+        bearer.get_certs()
+        expiry, fetched, certs = bearer._certs
+        bearer._certs = (expiry, fetched - bearer.MIN_REFETCH_INTERVAL, certs)
+        started = threading.Event()
+        release = threading.Event()
+
+        def fetch():
+            started.set()
+            release.wait(5)
+            return CERTS, 3600
+
+        self.fetch_certs.side_effect = fetch
+        thread = threading.Thread(target=bearer.get_certs, args=('key-2',))
+        thread.start()
+        try:
+            self.assertTrue(started.wait(5))
+            # Another unknown key id uses the cached certificates while the
+            # fetch runs, instead of waiting for it.
+            self.assertEqual(bearer.get_certs('key-3'), CERTS)
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual(self.fetch_certs.call_count, 2)
+
+    def test_invalid_id_tokens(self):
+        for token in (_id_token(aud='other-client'),
+                      _id_token(iss='https://evil.example.com'),
+                      _id_token(exp=int(time.time()) - 3600),
+                      _id_token()[:-4] + 'AAAA'):
+            with self.assertRaises(bearer.InvalidToken):
+                bearer.verify(token, (AUDIENCE,))
+
+    @mock.patch('googleoauth2django.tokeninfo.get_token_info')
+    def test_verify_access_token(self, get_token_info):
+        get_token_info.return_value = {'aud': AUDIENCE, 'sub': '1234'}
+        self.assertEqual(bearer.verify('ya29.token', (AUDIENCE,))['sub'],
+                         '1234')
+
+        get_token_info.return_value = {'aud': 'other-client', 'sub': '1234'}
+        with self.assertRaises(bearer.InvalidToken):
+            bearer.verify('ya29.token', (AUDIENCE,))
+
+        get_token_info.return_value = None
+        with self.assertRaises(bearer.InvalidToken):
+            bearer.verify('ya29.token', (AUDIENCE,))
+
+    def test_get_user(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(bearer.get_user('1234'), self.user)
+        self.assertIsNone(bearer.get_user('5678'))
+
+    def test_inactive_user(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(bearer.get_user('1234'))
+        request = self.factory.get(
+            '/api', HTTP_AUTHORIZATION='Bearer ' + _id_token())
+        request.user = django_models.AnonymousUser()
+        bearer.authenticate(request)
+        self.assertIsNone(request.oauth_user)
+        self.assertFalse(request.user.is_authenticated)
+
+    def test_middleware(self):
+        middleware = bearer.BearerAuthenticationMiddleware(
+            lambda request: http.HttpResponse())
+        request = self.factory.get(
+            '/api', HTTP_AUTHORIZATION='Bearer ' + _id_token())
+        request.user = django_models.AnonymousUser()
+        middleware(request)
+        self.assertEqual(request.user, self.user)
+        self.assertEqual(request.oauth_claims['sub'], '1234')
+
+        request = self.factory.get('/api', HTTP_AUTHORIZATION='Bearer bad')
+        request.user = django_models.AnonymousUser()
+        with mock.patch('googleoauth2django.tokeninfo.get_token_info',
+                        return_value=None):
+            middleware(request)
+        self.assertIsNone(request.oauth_claims)
+        self.assertFalse(request.user.is_authenticated)
+
+    def test_bearer_required(self):
+        @decorators.bearer_required(require_user=True)
+        def test_view(request):
+            return http.HttpResponse(request.user.username)
+
+        request = self.factory.get('/api')
+        request.user = django_models.AnonymousUser()
+        response = test_view(request)
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('Bearer', response['WWW-Authenticate'])
+
+        request = self.factory.get(
+            '/api', HTTP_AUTHORIZATION='Bearer ' + _id_token(sub='5678'))
+        request.user = django_models.AnonymousUser()
+        self.assertEqual(test_view(request).status_code, 401)
+
+        # A session user does not stand in for the token's user.
+        request = self.factory.get(
+            '/api', HTTP_AUTHORIZATION='Bearer ' + _id_token(sub='5678'))
+        request.user = self.user
+        self.assertEqual(test_view(request).status_code, 401)
+
+        request = self.factory.get(
+            '/api', HTTP_AUTHORIZATION='Bearer ' + _id_token())
+        request.user = django_models.AnonymousUser()
+        response = test_view(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'bill')
@@ -0,0 +1,302 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the token broker and its clients."""
+
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from django.core import management
+from google.auth import exceptions
+import mock
+
+from googleoauth2django import broker
+from tests import FakeCredentials
+from tests import MemoryStorage
+
+
+class FramingTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        left, right = socket.socketpair()
+        self.addCleanup(left.close)
+        self.addCleanup(right.close)
+        broker.send_request(left, broker.OP_REFRESH, '42', 'stale')
+        self.assertEqual(broker.recv_request(right),
+                         (broker.OP_REFRESH, '42', 'stale'))
+        broker.send_request(left, broker.OP_GET, '42')
+        self.assertEqual(broker.recv_request(right),
+                         (broker.OP_GET, '42', None))
+        broker.send_response(right, broker.STATUS_OK, 12.5, 'token\nemail')
+        self.assertEqual(broker.recv_response(left),
+                         (broker.STATUS_OK, 12.5, 'token\nemail'))
+
+    def test_closed_connection(self):
+        left, right = socket.socketpair()
+        self.addCleanup(right.close)
+        broker.send_request(left, broker.OP_GET, '42')
+        left.close()
+        broker.recv_request(right)
+        with self.assertRaises(EOFError):
+            broker.recv_request(right)
+
+
+class BrokerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.storages = {
+            '1': MemoryStorage(FakeCredentials('token', 3600)),
+            '2': MemoryStorage(FakeCredentials('expired', -10)),
+            '3': MemoryStorage(FakeCredentials('expired', -10,
+                                               refreshable=False)),
+        }
+        self.make_storage = mock.Mock(
+            side_effect=lambda key: self.storages.get(key, MemoryStorage()))
+        self.broker = broker.Broker(self.make_storage, request=object())
+
+    def test_valid_token_loaded_once(self):
+        self.assertEqual(self.broker.token('1').token, 'token')
+        self.assertEqual(self.broker.token('1').token, 'token')
+        self.assertEqual(self.make_storage.call_count, 1)
+        self.assertEqual(self.storages['1'].puts, 0)
+
+    def test_expired_token_refreshed_and_stored(self):
+        credentials = self.broker.token('2')
+        self.assertEqual(credentials.token, 'refreshed1')
+        self.assertEqual(self.storages['2'].puts, 1)
+
+    def test_concurrent_requests_refresh_once(self):
+        tokens = []
+
+        def get_token():
+            tokens.append(self.broker.token('2').token)
+
+        threads = [threading.Thread(target=get_token) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(tokens, ['refreshed1'] * 20)
+        self.assertEqual(self.storages['2'].credentials.refreshes, 1)
+
+    def test_stale_token_refreshed(self):
+        self.assertEqual(self.broker.token('1', 'token').token,
+                         'refreshed1')
+        # A token refreshed meanwhile is not refreshed again.
+        self.assertEqual(self.broker.token('1', 'token').token,
+                         'refreshed1')
+
+    def test_entries_expire(self):
+        self.broker.token('1')
+        self.storages['1'].credentials = FakeCredentials('other', 3600)
+        self.assertEqual(self.broker.token('1').token, 'token')
+        with mock.patch('googleoauth2django.broker.time.time',
+                        return_value=time.time() + broker.ENTRY_TTL + 1):
+            self.assertEqual(self.broker.token('1').token, 'other')
+        self.assertEqual(self.make_storage.call_count, 1)
+
+        self.storages['1'].credentials = None
+        with mock.patch('googleoauth2django.broker.time.time',
+                        return_value=time.time() + 2 * broker.ENTRY_TTL + 2):
+            self.assertIsNone(self.broker.token('1'))
+        self.assertNotIn('1', self.broker._entries)
+
+    @mock.patch('googleoauth2django.broker.MAX_ENTRIES', 2)
+    def test_entries_bounded(self):
+        for key in ('1', '2', '1', '5'):
+            self.storages.setdefault(key, MemoryStorage(
+                FakeCredentials('token' + key, 3600)))
+            self.broker.token(key)
+        self.assertEqual(list(self.broker._entries), ['2', '5'])
+        self.assertLessEqual(len(self.broker._key_locks), 2)
+
+    def test_refresh_of_deleted_credentials_not_written(self):
+        self.broker.token('1')
+        self.storages['1'].credentials = None
+        self.assertIsNone(self.broker.token('1', 'token'))
+        self.assertEqual(self.storages['1'].puts, 0)
+        self.assertNotIn('1', self.broker._entries)
+
+    def test_refresh_does_not_overwrite_newer_credentials(self):
+        self.broker.token('1')
+        self.storages['1'].put(FakeCredentials('newer', 3600))
+        self.assertEqual(self.broker.token('1', 'token').token, 'newer')
+        self.assertEqual(self.storages['1'].puts, 1)
+        self.assertEqual(self.broker.token('1').token, 'newer')
+
+    def test_refresh_failure_remembered(self):
+        credentials = self.storages['3'].credentials
+        with mock.patch.object(credentials, 'refresh',
+                               side_effect=exceptions.RefreshError(
+                                   'invalid_grant')) as refresh:
+            for _ in range(3):
+                with self.assertRaises(exceptions.RefreshError):
+                    self.broker.token('3')
+            self.assertEqual(refresh.call_count, 1)
+            with mock.patch('googleoauth2django.broker.time.time',
+                            return_value=time.time() +
+                            broker.FAILURE_TTL + 1):
+                with self.assertRaises(exceptions.RefreshError):
+                    self.broker.token('3')
+            self.assertEqual(refresh.call_count, 2)
+        self.assertEqual(self.storages['3'].puts, 0)
+
+    def test_forget_clears_refresh_failure(self):
+        with self.assertRaises(exceptions.RefreshError):
+            self.broker.token('3')
+        self.storages['3'].put(FakeCredentials('new', 3600))
+        self.broker.forget('3')
+        self.assertEqual(self.broker.token('3').token, 'new')
+
+    def test_forget(self):
+        self.broker.token('1')
+        self.broker.forget('1')
+        self.broker.token('1')
+        self.assertEqual(self.make_storage.call_count, 2)
+
+    def test_handle(self):
+        status, expiry, payload = self.broker.handle(broker.OP_GET, '1')
+        self.assertEqual((status, payload), (broker.STATUS_OK,
+                                             'token\nemail'))
+        self.assertAlmostEqual(expiry, time.time() + 3600, delta=5)
+        self.assertEqual(self.broker.handle(broker.OP_GET, '4'),
+                         (broker.STATUS_NOT_FOUND, 0.0, ''))
+        self.assertEqual(self.broker.handle(broker.OP_GET, '3')[0],
+                         broker.STATUS_REFRESH_FAILED)
+        self.assertEqual(self.broker.handle(9, '1')[0], broker.STATUS_ERROR)
+        self.assertEqual(self.broker.handle(broker.OP_FORGET, '1')[0],
+                         broker.STATUS_OK)
+
+
+class BrokerServerTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'broker.sock')
+        self.storages = {'1': MemoryStorage(FakeCredentials('token', 3600))}
+        self.broker = broker.Broker(
+            lambda key: self.storages.get(key, MemoryStorage()),
+            request=object())
+        self.server = broker.BrokerServer(self.path, self.broker)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.client = broker.BrokerClient(self.path, timeout=5)
+        self.backend = MemoryStorage(FakeCredentials('local', 3600))
+        self.storage = broker.BrokerStorage(self.backend, self.client, '1',
+                                            'client-id')
+
+    def test_socket_private(self):
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+
+    def test_client(self):
+        token, expiry, scopes = self.client.token('1')
+        self.assertEqual((token, scopes), ('token', ['email']))
+        self.assertIsNone(self.client.token('2'))
+        self.assertEqual(self.client.token('1', 'token')[0], 'refreshed1')
+
+    def test_client_reconnects(self):
+        self.client.token('1')
+        self.client._local.sock.close()
+        self.client._local.sock = socket.socket(socket.AF_UNIX)
+        self.assertEqual(self.client.token('1')[0], 'token')
+
+    def test_storage_get_and_refresh(self):
+        credentials = self.storage.get()
+        self.assertIsInstance(credentials, broker.BrokerCredentials)
+        self.assertEqual(credentials.token, 'token')
+        self.assertEqual(credentials._client_id, 'client-id')
+        self.assertTrue(credentials.valid)
+
+        credentials.refresh(None)
+        self.assertEqual(credentials.token, 'refreshed1')
+        self.assertEqual(self.storages['1'].puts, 1)
+        self.assertEqual(self.backend.puts, 0)
+
+    def test_storage_put_tells_broker(self):
+        self.storage.get()
+        self.storage.put(self.storage.get())
+        self.assertEqual(self.backend.puts, 0)
+
+        credentials = FakeCredentials('new', 3600)
+        with mock.patch.object(self.broker, 'forget') as forget:
+            self.storage.put(credentials)
+        forget.assert_called_once_with('1')
+        self.assertIs(self.backend.credentials, credentials)
+
+    def test_storage_refresh_failure_not_loaded_from_backend(self):
+        self.storages['1'] = MemoryStorage(FakeCredentials('expired', -10))
+        credentials = self.storages['1'].credentials
+        with mock.patch.object(credentials, 'refresh',
+                               side_effect=exceptions.RefreshError(
+                                   'invalid_grant')) as refresh, \
+                mock.patch.object(self.backend, 'locked_get') as backend_get:
+            self.assertIsNone(self.storage.get())
+            self.assertIsNone(self.storage.get())
+            with self.assertRaises(broker.BrokerRefreshError):
+                self.storage.refresh(None, 'expired')
+        backend_get.assert_not_called()
+        self.assertEqual(refresh.call_count, 1)
+
+    def test_storage_without_broker(self):
+        self.server.shutdown()
+        self.server.server_close()
+        os.unlink(self.path)
+        self.assertEqual(self.storage.get().token, 'local')
+        with self.assertRaises(exceptions.RefreshError):
+            self.storage.refresh(None, 'local')
+
+
+class BrokerCommandTest(unittest.TestCase):
+
+    def test_requires_socket(self):
+        oauth2_settings = mock.Mock(broker=None)
+        with mock.patch('googleoauth2django.get_oauth2_settings',
+                        return_value=oauth2_settings):
+            with self.assertRaises(management.CommandError):
+                management.call_command('oauth2_broker')
+
+    def test_requires_storage_model(self):
+        oauth2_settings = mock.Mock(broker={'socket': '/tmp/broker.sock'},
+                                    storage_model=None)
+        with mock.patch('googleoauth2django.get_oauth2_settings',
+                        return_value=oauth2_settings):
+            with self.assertRaises(management.CommandError):
+                management.call_command('oauth2_broker')
+
+    def test_storage_factory_per_tenant(self):
+        from googleoauth2django.management.commands import oauth2_broker
+
+        oauth2_settings = mock.Mock(
+            storage_model_user_property='user_id',
+            storage_model_credentials_property='credentials',
+            storage_model_tenant_property='tenant', storage_model_using=None)
+        with mock.patch('googleoauth2django.get_oauth2_settings',
+                        return_value=oauth2_settings), \
+                mock.patch('googleoauth2django.get_storage_model_class'):
+            make_storage = oauth2_broker.make_storage_factory()
+            self.assertEqual(make_storage('acme:7')._query(),
+                             {'user_id': '7', 'tenant': 'acme'})
+            self.assertEqual(make_storage(':7')._query(),
+                             {'user_id': '7', 'tenant': None})
+            oauth2_settings.tenants = None
+            self.assertEqual(make_storage('7')._query(), {'user_id': '7'})
@@ -0,0 +1,136 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the settings system checks."""
+
+import os
+import unittest
+
+from django.core import checks as django_checks
+from django.test import override_settings
+
+from googleoauth2django import checks
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'helpers', 'data')
+MISSING_SECRETS = os.path.join(DATA_DIR, 'missing_client_secrets.json')
+STORAGE_MODEL = {
+    'model': 'tests.models.CredentialsModel',
+    'user_property': 'user_id',
+    'credentials_property': 'credentials'
+}
+
+
+class SystemChecksTest(unittest.TestCase):
+
+    def _ids(self, check):
+        return [error.id for error in check(None)]
+
+    def test_registered(self):
+        self.assertIn(checks.TAG,
+                      django_checks.registry.registry.tags_available())
+
+    def test_valid_settings(self):
+        self.assertEqual(self._ids(checks.check_client_secrets), [])
+        self.assertEqual(self._ids(checks.check_session_middleware), [])
+        self.assertEqual(self._ids(checks.check_storage_model), [])
+
+    @override_settings(GOOGLE_OAUTH2_CLIENT_ID=None)
+    def test_no_client_secrets(self):
+        self.assertEqual(self._ids(checks.check_client_secrets),
+                         ['googleoauth2django.E001'])
+
+    @override_settings(GOOGLE_OAUTH2_CLIENT_SECRETS_JSON=MISSING_SECRETS)
+    def test_invalid_client_secrets_file(self):
+        self.assertEqual(self._ids(checks.check_client_secrets),
+                         ['googleoauth2django.E002'])
+
+    @override_settings(MIDDLEWARE=None)
+    def test_no_middleware(self):
+        self.assertEqual(self._ids(checks.check_session_middleware),
+                         ['googleoauth2django.E003'])
+
+    @override_settings(MIDDLEWARE=())
+    def test_no_session_middleware(self):
+        self.assertEqual(self._ids(checks.check_session_middleware),
+                         ['googleoauth2django.E004'])
+
+    @override_settings(GOOGLE_OAUTH2_STORAGE_MODEL={
+        'model': 'tests.models.CredentialsModel'})
+    def test_storage_model_missing_keys(self):
+        self.assertEqual(self._ids(checks.check_storage_model),
+                         ['googleoauth2django.E005'])
+
+    @override_settings(GOOGLE_OAUTH2_STORAGE_MODEL=dict(
+        STORAGE_MODEL, model='tests.models.MissingModel'))
+    def test_storage_model_not_importable(self):
+        self.assertEqual(self._ids(checks.check_storage_model),
+                         ['googleoauth2django.E006'])
+
+    @override_settings(GOOGLE_OAUTH2_STORAGE_MODEL=STORAGE_MODEL)
+    def test_storage_model_valid(self):
+        self.assertEqual(self._ids(checks.check_storage_model), [])
+
+    @override_settings(GOOGLE_OAUTH2_NEGATIVE_CACHE={'backend': 'redis'})
+    def test_negative_cache_unknown_backend(self):
+        self.assertEqual(self._ids(checks.check_negative_cache),
+                         ['googleoauth2django.E007'])
+
+    @override_settings(GOOGLE_OAUTH2_NEGATIVE_CACHE={'backend': 'session'})
+    def test_negative_cache_valid(self):
+        self.assertEqual(self._ids(checks.check_negative_cache), [])
+
+    @override_settings(GOOGLE_OAUTH2_LOGIN=True)
+    def test_login_without_subject_property(self):
+        self.assertEqual(self._ids(checks.check_login),
+                         ['googleoauth2django.E008'])
+
+    @override_settings(GOOGLE_OAUTH2_LOGIN=True, GOOGLE_OAUTH2_STORAGE_MODEL={
+        'model': 'tests.models.CredentialsModel',
+        'user_property': 'user_id',
+        'credentials_property': 'credentials',
+        'subject_property': 'google_sub'})
+    def test_login_valid(self):
+        self.assertEqual(self._ids(checks.check_login), [])
+
+    @override_settings(GOOGLE_OAUTH2_SHARED_TOKEN_CACHE={
+        'path': os.path.join(DATA_DIR, 'missing', 'tokens')})
+    def test_shared_token_cache_missing_directory(self):
+        self.assertEqual(self._ids(checks.check_shared_token_cache),
+                         ['googleoauth2django.E009'])
+
+    @override_settings(GOOGLE_OAUTH2_SHARED_TOKEN_CACHE={
+        'path': os.path.join(DATA_DIR, 'tokens')})
+    def test_shared_token_cache_valid(self):
+        self.assertEqual(self._ids(checks.check_shared_token_cache), [])
+
+    @override_settings(GOOGLE_OAUTH2_BROKER={'socket': '/tmp/broker.sock'})
+    def test_broker_without_storage_model(self):
+        self.assertEqual(self._ids(checks.check_broker),
+                         ['googleoauth2django.E010'])
+
+    @override_settings(GOOGLE_OAUTH2_BROKER={'socket': '/tmp/broker.sock'},
+                       GOOGLE_OAUTH2_STORAGE_MODEL=STORAGE_MODEL)
+    def test_broker_valid(self):
+        self.assertEqual(self._ids(checks.check_broker), [])
+
+    @override_settings(GOOGLE_OAUTH2_TENANTS=[{'name': 'acme'}])
+    def test_tenants_incomplete(self):
+        self.assertEqual(self._ids(checks.check_tenants),
+                         ['googleoauth2django.E011'])
+
+    @override_settings(GOOGLE_OAUTH2_TENANTS=[{
+        'name': 'acme', 'hosts': ['acme.example.com'],
+        'client_id': 'id', 'client_secret': 'secret'}])
+    def test_tenants_valid(self):
+        self.assertEqual(self._ids(checks.check_tenants), [])
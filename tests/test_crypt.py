@@ -0,0 +1,110 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the cached signers and verifiers."""
+
+import base64
+import json
+import time
+import unittest
+
+from google.auth import jwt
+import mock
+
+from googleoauth2django import crypt
+from tests import read_data
+
+PRIVATE_KEY = read_data('privatekey.pem')
+CERTS = {'key-1': read_data('public_cert.pem')}
+
+
+class CryptTest(unittest.TestCase):
+
+    def setUp(self):
+        crypt.clear()
+
+    def _token(self, **claims):
+        now = int(time.time())
+        payload = {'aud': 'audience', 'iat': now, 'exp': now + 3600}
+        payload.update(claims)
+        return jwt.encode(crypt.signer(PRIVATE_KEY, 'key-1'),
+                          payload).decode('ascii')
+
+    def test_fastest_backend_first(self):
+        self.assertEqual(crypt.available_backends()[0], 'cryptography')
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ImportError):
+            crypt.signer(PRIVATE_KEY, backend='openssl')
+
+    def test_keys_parsed_once(self):
+        module = crypt._backend_module(None)
+        with mock.patch.object(module.RSAVerifier, 'from_string',
+                               wraps=module.RSAVerifier.from_string) as parse:
+            self.assertIs(crypt.verifier(CERTS['key-1']),
+                          crypt.verifier(CERTS['key-1']))
+            crypt.verifier(CERTS['key-1'].encode('utf-8'))
+        self.assertEqual(parse.call_count, 1)
+        self.assertIs(crypt.signer(PRIVATE_KEY, 'key-1'),
+                      crypt.signer(PRIVATE_KEY, 'key-1'))
+        self.assertIsNot(crypt.signer(PRIVATE_KEY, 'key-1'),
+                         crypt.signer(PRIVATE_KEY, 'key-2'))
+
+    def test_cache_is_bounded(self):
+        with mock.patch.object(crypt, 'MAX_CACHED_KEYS', 2):
+            for key_id in ('a', 'b', 'c'):
+                crypt.signer(PRIVATE_KEY, key_id)
+            self.assertEqual(len(crypt._keys), 1)
+
+    @staticmethod
+    def _encode(value):
+        return base64.urlsafe_b64encode(
+            json.dumps(value).encode()).decode().rstrip('=')
+
+    def test_decode_jwt(self):
+        claims = crypt.decode_jwt(self._token(sub='1234'), CERTS,
+                                  audience=['audience'])
+        self.assertEqual(claims['sub'], '1234')
+        self.assertEqual(claims, jwt.decode(self._token(sub='1234'),
+                                            certs=CERTS, verify=False))
+
+    def test_decode_invalid_jwt(self):
+        now = int(time.time())
+        for token in ('not-a-token',
+                      self._token(aud='other'),
+                      self._token(exp=now - 10),
+                      self._token(iat=now + 600),
+                      self._token()[:-4] + 'AAAA'):
+            with self.assertRaises(ValueError):
+                crypt.decode_jwt(token, CERTS, audience='audience')
+        with self.assertRaises(ValueError):
+            crypt.decode_jwt(self._token(), {'key-2': CERTS['key-1']})
+
+    def test_decode_jwt_not_objects(self):
+        header, payload, signature = self._token().split('.')
+        for token in ('{0}.{1}.{2}'.format(header, self._encode([1]),
+                                           signature),
+                      '{0}.{1}.{2}'.format(self._encode('RS256'), payload,
+                                           signature),
+                      self._token(iat='now')):
+            with self.assertRaises(ValueError):
+                crypt.decode_jwt(token, CERTS)
+
+    def test_decode_jwt_clock_skew(self):
+        now = int(time.time())
+        for token in (self._token(iat=now + 60),
+                      self._token(exp=now - 60)):
+            with self.assertRaises(ValueError):
+                crypt.decode_jwt(token, CERTS)
+            crypt.decode_jwt(token, CERTS, clock_skew_in_seconds=120)
@@ -19,6 +19,7 @@ import copy
 from django import http
 import django.conf
 from django.contrib.auth import models as django_models
+from django.core.signals import setting_changed
 import mock
 from six.moves import http_client
 from six.moves import reload_module
@@ -60,19 +61,17 @@ class OAuth2EnabledDecoratorTest(TestWithDjangoEnvironment):
         self.assertFalse(request.oauth.has_credentials())
         self.assertIsNone(request.oauth.http)
 
-    @mock.patch('googleoauth2django.helpers.dictionary_storage.jsonpickle')
-    @mock.patch('googleoauth2django.OAuth2Session')
-    def test_has_credentials_in_storage(self, http_mock, cred_jsonpickle_mock):
+    @mock.patch('googleoauth2django.helpers.session_codec.decode')
+    @mock.patch('requests_oauthlib.OAuth2Session')
+    def test_has_credentials_in_storage(self, http_mock, decode_mock):
         request = self.factory.get('/test')
         request.session = mock.Mock()
 
         credentials_mock = mock.Mock(
             scopes=set(django.conf.settings.GOOGLE_OAUTH2_SCOPES))
-        credentials_mock.has_scopes.return_value = True
         credentials_mock.valid = True
-        credentials_mock.scopes = set([])
 
-        cred_jsonpickle_mock.decode.return_value = credentials_mock
+        decode_mock.return_value = credentials_mock
         http_mock.return_value = 'would be an OAuth2Session object'
 
         @decorators.oauth_enabled
@@ -160,9 +159,9 @@ class OAuth2RequiredDecoratorTest(TestWithDjangoEnvironment):
         self.assertEqual(response.status_code, http_client.OK)
         self.assertEqual(response.content, b"test")
 
-    @mock.patch('googleoauth2django.helpers.dictionary_storage.jsonpickle')
+    @mock.patch('googleoauth2django.helpers.session_codec.decode')
     def test_has_credentials_in_storage_no_scopes(
-            self, cred_jsonpickle_mock):
+            self, decode_mock):
         request = self.factory.get('/test')
 
         request.session = mock.Mock()
@@ -170,7 +169,7 @@ class OAuth2RequiredDecoratorTest(TestWithDjangoEnvironment):
             scopes=set(django.conf.settings.GOOGLE_OAUTH2_SCOPES))
         credentials_mock.has_scopes.return_value = False
 
-        cred_jsonpickle_mock.decode.return_value = credentials_mock
+        decode_mock.return_value = credentials_mock
 
         @decorators.oauth_required
         def test_view(request):
@@ -180,15 +179,15 @@ class OAuth2RequiredDecoratorTest(TestWithDjangoEnvironment):
         self.assertEqual(
             response.status_code, django.http.HttpResponseRedirect.status_code)
 
-    @mock.patch('googleoauth2django.helpers.dictionary_storage.jsonpickle')
-    def test_specified_scopes(self, cred_jsonpickle_mock):
+    @mock.patch('googleoauth2django.helpers.session_codec.decode')
+    def test_specified_scopes(self, decode_mock):
         request = self.factory.get('/test')
         request.session = mock.Mock()
 
         credentials_mock = mock.Mock(
             scopes=set(django.conf.settings.GOOGLE_OAUTH2_SCOPES))
         credentials_mock.has_scopes = mock.Mock(return_value=False)
-        cred_jsonpickle_mock.decode.return_value = credentials_mock
+        decode_mock.return_value = credentials_mock
 
         @decorators.oauth_required(scopes=['additional-scope'])
         def test_view(request):
@@ -198,6 +197,35 @@ class OAuth2RequiredDecoratorTest(TestWithDjangoEnvironment):
         self.assertEqual(
             response.status_code, django.http.HttpResponseRedirect.status_code)
 
+    def test_return_url_on_every_request(self):
+        @decorators.oauth_required(return_url='/after')
+        def test_view(request):
+            return http.HttpResponse("test")  # pragma: NO COVER
+
+        for path in ('/first', '/second'):
+            request = self.factory.get(path)
+            request.session = self.session
+            response = test_view(request)
+            query = parse.parse_qs(parse.urlparse(response['Location']).query)
+            self.assertEqual(query['return_url'], ['/after'])
+
+    def test_plan_compiled_per_settings(self):
+        planner = decorators._ViewPlanner(['drive'], None)
+        plan = planner.plan()
+        self.assertIs(planner.plan(), plan)
+        self.assertEqual(plan.request_attribute, 'oauth')
+        self.assertIsNone(plan.login_prefix)
+        self.assertTrue(googleoauth2django.scope_set.covers(
+            plan.scope_mask, googleoauth2django.scope_set.mask(
+                django.conf.settings.GOOGLE_OAUTH2_SCOPES + ('drive',))))
+
+        setting_changed.send(sender=None,
+                             setting='GOOGLE_OAUTH2_REQUEST_ATTRIBUTE',
+                             value='google_oauth', enter=True)
+        django.conf.settings.GOOGLE_OAUTH2_REQUEST_ATTRIBUTE = 'google_oauth'
+        self.addCleanup(googleoauth2django._reset_oauth2_settings)
+        self.assertEqual(planner.plan().request_attribute, 'google_oauth')
+
 
 class OAuth2RequiredDecoratorStorageModelTest(TestWithDjangoEnvironment):
 
@@ -0,0 +1,112 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the discovery document cache."""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import mock
+
+from googleoauth2django import discovery
+
+DOCUMENT = {'name': 'calendar', 'version': 'v3',
+            'rootUrl': 'https://www.googleapis.com/'}
+
+
+class DiscoveryCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        discovery.clear()
+        self.addCleanup(discovery.clear)
+        patcher = mock.patch('googleoauth2django.transport.get_session')
+        self.session = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.session.get.return_value = mock.Mock(
+            status_code=200, text=json.dumps(DOCUMENT))
+
+    def test_memory_cache(self):
+        self.assertEqual(discovery.get_document('calendar', 'v3'), DOCUMENT)
+        self.assertIs(discovery.get_document('calendar', 'v3'),
+                      discovery.get_document('calendar', 'v3'))
+        self.session.get.assert_called_once_with(
+            'https://www.googleapis.com/discovery/v1/apis/calendar/v3/rest',
+            timeout=discovery.FETCH_TIMEOUT)
+
+    def test_ttl(self):
+        discovery.get_document('calendar', 'v3', ttl=-1)
+        discovery.get_document('calendar', 'v3', ttl=-1)
+        self.assertEqual(self.session.get.call_count, 2)
+
+    def test_v2_fallback(self):
+        self.session.get.side_effect = [
+            mock.Mock(status_code=404),
+            mock.Mock(status_code=200, text=json.dumps(DOCUMENT))]
+        self.assertEqual(discovery.get_document('calendar', 'v3'), DOCUMENT)
+        self.session.get.assert_called_with(
+            'https://calendar.googleapis.com/$discovery/rest?version=v3',
+            timeout=discovery.FETCH_TIMEOUT)
+
+    def test_disk_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+
+        discovery.get_document('calendar', 'v3', cache_dir=cache_dir)
+        self.assertTrue(os.path.exists(
+            os.path.join(cache_dir, 'calendar.v3.json')))
+
+        discovery.clear()
+        self.assertEqual(
+            discovery.get_document('calendar', 'v3', cache_dir=cache_dir),
+            DOCUMENT)
+        self.assertEqual(self.session.get.call_count, 1)
+
+        discovery.clear()
+        discovery.get_document('calendar', 'v3', ttl=-1, cache_dir=cache_dir)
+        self.assertEqual(self.session.get.call_count, 2)
+
+    def test_slow_fetch_only_delays_its_api(self):
+        fetching = threading.Event()
+        release = threading.Event()
+
+        def get(uri, timeout):
+            if 'calendar' in uri:
+                fetching.set()
+                release.wait(5)
+            return mock.Mock(status_code=200, text=json.dumps(DOCUMENT))
+
+        self.session.get.side_effect = get
+        thread = threading.Thread(target=discovery.get_document,
+                                  args=('calendar', 'v3'))
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(release.set)
+        fetching.wait(5)
+        self.assertEqual(discovery.get_document('drive', 'v3'), DOCUMENT)
+        self.assertTrue(thread.is_alive())
+
+    def test_build_gets_own_document(self):
+        googleapiclient = mock.Mock()
+        with mock.patch.dict('sys.modules', {
+                'googleapiclient': googleapiclient,
+                'googleapiclient.discovery': googleapiclient.discovery}):
+            discovery.build('calendar', 'v3', 'credentials')
+        build_from_document = googleapiclient.discovery.build_from_document
+        self.assertEqual(json.loads(build_from_document.call_args[0][0]),
+                         DOCUMENT)
+        self.assertEqual(discovery.get_document('calendar', 'v3'), DOCUMENT)
@@ -94,6 +94,23 @@ class TestCredentialsField(unittest.TestCase):
         credentials = models.CredentialsField()
         self.assertTrue(credentials.null)
 
+    def test_json_codec(self):
+        field = models.CredentialsField(codec='json')
+        value = field.get_prep_value(self.credentials)
+        self.assertEqual(models.stored_codec(value), 'json')
+        self.assertEqual(models.stored_codec(self.jsonpickle_str),
+                         'jsonpickle')
+        self.assertEqual(models.stored_codec(self.pickle_str), 'pickle')
+        credentials = field.to_python(value)
+        self.assertEqual(credentials.token, self.credentials.token)
+        self.assertEqual(credentials.scopes, ['email'])
+        self.assertEqual(field.deconstruct()[3]['codec'], 'json')
+        self.assertNotIn('codec', self.field.deconstruct()[3])
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            models.CredentialsField(codec='yaml')
+
 
 class CredentialWithSetStore(models.CredentialsField):
     def __init__(self):
@@ -17,13 +17,17 @@
 # Mock a Django environment
 import unittest
 
+from django.contrib.auth import models as django_models
 from django.db import models
 from google.oauth2.credentials import Credentials
 import mock
 
 from googleoauth2django import GOOGLE_TOKEN_URI
+from googleoauth2django import storage as storage_module
 from googleoauth2django.models import CredentialsField
 from googleoauth2django.storage import DjangoORMStorage
+from tests import models as tests_models
+from tests import TestWithDjangoEnvironment
 
 
 class CredentialWithSetStore(CredentialsField):
@@ -196,3 +200,152 @@ class TestDjangoStorage(unittest.TestCase):
                                    self.key_value, self.property_name)
         storage.delete()
         self.assertTrue(fake_entities.deleted)
+
+
+class TestNegativeCache(unittest.TestCase):
+    def setUp(self):
+        self.filter_mock = mock.Mock(return_value=mock.MagicMock(
+            __len__=mock.Mock(return_value=0)))
+        FakeCredentialsModelMock.objects = mock.Mock(
+            filter=self.filter_mock,
+            get_or_create=mock.Mock(return_value=(mock.Mock(), None)))
+
+    def _storage(self, negative_cache):
+        return DjangoORMStorage(FakeCredentialsModelMock, 'id', '1',
+                                'credentials', negative_cache=negative_cache)
+
+    def _check_remembers_miss(self, negative_cache):
+        storage = self._storage(negative_cache)
+        self.assertIsNone(storage.get())
+        self.assertIsNone(storage.get())
+        self.assertEqual(self.filter_mock.call_count, 1)
+
+        storage.put(mock.sentinel.credentials)
+        storage.get()
+        self.assertEqual(self.filter_mock.call_count, 2)
+
+        storage.delete()
+        storage.get()
+        self.assertEqual(self.filter_mock.call_count, 4)
+
+    def test_cache(self):
+        negative_cache = storage_module.CacheNegativeCache('test-key', 60)
+        negative_cache.discard()
+        self._check_remembers_miss(negative_cache)
+
+    def test_session(self):
+        self._check_remembers_miss(
+            storage_module.SessionNegativeCache({}, 'test-key', 60))
+
+    def test_session_expired(self):
+        session = {}
+        negative_cache = storage_module.SessionNegativeCache(
+            session, 'test-key', 60)
+        negative_cache.add()
+        self.assertTrue(negative_cache.hit())
+        session[storage_module._NEGATIVE_CACHE_SESSION_KEY][1] = 0
+        self.assertFalse(negative_cache.hit())
+
+    def test_session_other_key(self):
+        session = {}
+        storage_module.SessionNegativeCache(session, 'user-1', 60).add()
+        self.assertFalse(
+            storage_module.SessionNegativeCache(session, 'user-2', 60).hit())
+
+    def test_make_negative_cache(self):
+        request = mock.Mock(session={})
+        user = mock.Mock(pk=7)
+        self.assertIsNone(storage_module.make_negative_cache(
+            None, request, FakeCredentialsModel, 'user', user))
+
+        negative_cache = storage_module.make_negative_cache(
+            {'timeout': 5}, request, FakeCredentialsModel, 'user', user)
+        self.assertIsInstance(negative_cache,
+                              storage_module.CacheNegativeCache)
+        self.assertEqual(negative_cache.timeout, 5)
+        self.assertTrue(negative_cache.key.endswith(':user=7'))
+
+        negative_cache = storage_module.make_negative_cache(
+            {'backend': 'session'}, request, FakeCredentialsModel, 'user',
+            user)
+        self.assertIs(negative_cache.session, request.session)
+
+        with self.assertRaises(ValueError):
+            storage_module.make_negative_cache(
+                {'backend': 'redis'}, request, FakeCredentialsModel, 'user',
+                user)
+
+
+class TestDatabaseRouting(unittest.TestCase):
+    def setUp(self):
+        self.entity = mock.Mock()
+        self.objects = mock.Mock(
+            get_or_create=mock.Mock(return_value=(self.entity, None)))
+        self.objects.filter.return_value = mock.MagicMock(
+            __len__=mock.Mock(return_value=0))
+        self.objects.using.return_value = self.objects
+        FakeCredentialsModelMock.objects = self.objects
+
+    def test_using(self):
+        storage = DjangoORMStorage(FakeCredentialsModelMock, 'id', '1',
+                                   'credentials', using='credentials-db')
+        storage.get()
+        storage.put(mock.sentinel.credentials)
+        storage.delete()
+        self.assertEqual(self.objects.using.call_args_list,
+                         [mock.call('credentials-db')] * 3)
+        self.entity.save.assert_called_once_with(using='credentials-db')
+
+    @mock.patch('googleoauth2django.storage.router.db_for_write',
+                return_value='primary')
+    def test_reads_pinned_after_write(self, db_for_write):
+        session = {}
+        storage = DjangoORMStorage(
+            FakeCredentialsModelMock, 'id', '1', 'credentials',
+            write_pin=storage_module.SessionWritePin(session, 5))
+        storage.get()
+        self.objects.using.assert_not_called()
+
+        storage.put(mock.sentinel.credentials)
+        self.entity.save.assert_called_once_with()
+        storage.get()
+        self.objects.using.assert_called_once_with('primary')
+
+        session[storage_module._WRITE_PIN_SESSION_KEY] = 0
+        storage.get()
+        self.assertEqual(self.objects.using.call_count, 1)
+
+    def test_pinned_by_delete(self):
+        pin = storage_module.SessionWritePin({}, 5)
+        self.assertFalse(pin.active())
+        DjangoORMStorage(FakeCredentialsModelMock, 'id', '1', 'credentials',
+                         write_pin=pin).delete()
+        self.assertTrue(pin.active())
+
+
+class TestUpdate(TestWithDjangoEnvironment):
+    def setUp(self):
+        super(TestUpdate, self).setUp()
+        self.user = django_models.User.objects.create_user(username='bill')
+        self.storage = DjangoORMStorage(tests_models.CredentialsModel,
+                                        'user_id', self.user, 'credentials')
+
+    def _stored_token(self):
+        return tests_models.CredentialsModel.objects.get(
+            user_id=self.user).credentials.token
+
+    def test_update(self):
+        self.storage.put(Credentials('token'))
+        self.assertTrue(self.storage.update(Credentials('new'), 'token'))
+        self.assertEqual(self._stored_token(), 'new')
+        self.assertTrue(self.storage.update(Credentials('newer')))
+        self.assertEqual(self._stored_token(), 'newer')
+
+    def test_update_replaced(self):
+        self.storage.put(Credentials('other'))
+        self.assertFalse(self.storage.update(Credentials('new'), 'token'))
+        self.assertEqual(self._stored_token(), 'other')
+
+    def test_update_deleted(self):
+        self.assertFalse(self.storage.update(Credentials('new')))
+        self.assertFalse(tests_models.CredentialsModel.objects.exists())
@@ -0,0 +1,179 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for concurrent API calls, against a local stub server."""
+
+import asyncio
+from http import server
+import threading
+import time
+import unittest
+
+import mock
+
+from googleoauth2django import fanout
+
+
+class _SlowHandler(server.BaseHTTPRequestHandler):
+    """Answers after sleeping for the number of milliseconds in the path."""
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight,
+                                            self.server.in_flight)
+        time.sleep(int(self.path.strip('/')) / 1000.0)
+        with self.server.lock:
+            self.server.in_flight -= 1
+        body = self.headers['Authorization'].encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class AsyncHttpTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                                _SlowHandler)
+        cls.server.lock = threading.Lock()
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.in_flight = 0
+        self.server.max_in_flight = 0
+
+    def _url(self, milliseconds):
+        return 'http://127.0.0.1:{0}/{1}'.format(self.server.server_port,
+                                                 milliseconds)
+
+    def test_concurrent(self):
+        http = fanout.AsyncHttp('token')
+        start = time.perf_counter()
+        responses = fanout.run(http.gather(
+            *[http.get(self._url(200)) for _ in range(4)]))
+        self.assertLess(time.perf_counter() - start, 0.6)
+        self.assertEqual([response.text for response in responses],
+                         ['Bearer token'] * 4)
+
+    def test_max_concurrency(self):
+        http = fanout.AsyncHttp('token', max_concurrency=2)
+        fanout.run(http.gather(*[http.get(self._url(50)) for _ in range(6)]))
+        self.assertEqual(self.server.max_in_flight, 2)
+        # The client can be used again from another event loop.
+        fanout.run(http.gather(http.get(self._url(0))))
+
+    def test_max_concurrency_per_key(self):
+        # Two clients of one user, used from two threads at once.
+        clients = [fanout.AsyncHttp('token', max_concurrency=2, key='alice')
+                   for _ in range(2)]
+
+        def fan_out(http):
+            fanout.run(http.gather(
+                *[http.get(self._url(50)) for _ in range(4)]))
+
+        threads = [threading.Thread(target=fan_out, args=(http,))
+                   for http in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.server.max_in_flight, 2)
+        self.assertEqual(fanout._limiter.in_flight('alice'), 0)
+
+    def test_other_keys_not_blocked(self):
+        alice = fanout.AsyncHttp('token', max_concurrency=100, key='alice')
+        bob = fanout.AsyncHttp('token', key='bob')
+        self.assertEqual(alice.max_concurrency, fanout.max_share())
+        started = threading.Event()
+
+        def fan_out():
+            started.set()
+            fanout.run(alice.gather(
+                *[alice.get(self._url(300)) for _ in range(20)]))
+
+        thread = threading.Thread(target=fan_out)
+        thread.start()
+        started.wait()
+        time.sleep(0.05)
+        start = time.perf_counter()
+        fanout.run(bob.gather(bob.get(self._url(0))))
+        self.assertLess(time.perf_counter() - start, 0.2)
+        thread.join()
+
+    def test_deadline_releases_slots(self):
+        http = fanout.AsyncHttp('token', max_concurrency=1, key='carol')
+        results = fanout.run(http.gather(
+            *[http.get(self._url(100)) for _ in range(3)], deadline=0.05,
+            return_exceptions=True))
+        self.assertTrue(all(isinstance(result, Exception)
+                            for result in results))
+        # The slot of the request being sent is freed once it is done.
+        time.sleep(0.15)
+        self.assertEqual(fanout._limiter.in_flight('carol'), 0)
+        self.assertEqual(fanout._limiter._waiters, {})
+
+    def test_deadline(self):
+        http = fanout.AsyncHttp('token')
+        with self.assertRaises(fanout.DeadlineExceeded):
+            fanout.run(http.gather(http.get(self._url(0)),
+                                   http.get(self._url(500)), deadline=0.2))
+
+    def test_deadline_return_exceptions(self):
+        http = fanout.AsyncHttp('token')
+        fast, slow = fanout.run(http.gather(
+            http.get(self._url(0)), http.get(self._url(500)), deadline=0.2,
+            return_exceptions=True))
+        self.assertEqual(fast.status_code, 200)
+        self.assertIsInstance(slow, fanout.DeadlineExceeded)
+
+    def test_deadline_bounds_request_timeout(self):
+        session = mock.Mock()
+        http = fanout.AsyncHttp('token', session=session)
+        fanout.run(http.gather(http.get(self._url(0)), deadline=0.5))
+        timeout = session.request.call_args[1]['timeout']
+        self.assertLessEqual(timeout, 0.5)
+        fanout.run(http.gather(http.get(self._url(0), timeout=0.1),
+                               deadline=0.5))
+        self.assertEqual(session.request.call_args[1]['timeout'], 0.1)
+        fanout.run(http.gather(http.get(self._url(0))))
+        self.assertEqual(session.request.call_args[1]['timeout'],
+                         fanout.TIMEOUT)
+
+    def test_cancelled_request(self):
+        http = fanout.AsyncHttp('token')
+
+        async def cancelled():
+            raise asyncio.CancelledError()
+
+        fast, result = fanout.run(http.gather(
+            http.get(self._url(0)), cancelled(), deadline=1,
+            return_exceptions=True))
+        self.assertEqual(fast.status_code, 200)
+        self.assertIsInstance(result, asyncio.CancelledError)
+
+    def test_no_requests(self):
+        self.assertEqual(fanout.run(fanout.AsyncHttp('token').gather()), [])
@@ -15,12 +15,17 @@
 """Tests the initialization logic of django_util."""
 
 import copy
+import json
+import os
+import shutil
+import tempfile
 import unittest
 
 import django.conf
 from django.conf.urls import url
 from django.contrib.auth import models as django_models
 from django.core import exceptions
+from django.core.signals import setting_changed
 import mock
 from six.moves import reload_module
 
@@ -90,21 +95,50 @@ class OAuth2SetupTest(unittest.TestCase):
                 object.__new__(googleoauth2django.OAuth2Settings),
                 django.conf.settings)
 
-    @mock.patch("googleoauth2django.clientsecrets")
-    def test_no_session_middleware(self, clientsecrets):
-        django.conf.settings.MIDDLEWARE = ()
+    def test_client_config(self):
+        oauth2_settings = googleoauth2django.OAuth2Settings(
+            django.conf.settings)
+        self.assertEqual(oauth2_settings.client_config['web']['client_id'],
+                         django.conf.settings.GOOGLE_OAUTH2_CLIENT_ID)
+        self.assertEqual(oauth2_settings.client_config['web']['token_uri'],
+                         googleoauth2django.GOOGLE_TOKEN_URI)
+
+    def test_get_oauth2_settings_cached(self):
+        oauth2_settings = googleoauth2django.get_oauth2_settings()
+        self.assertIs(googleoauth2django.get_oauth2_settings(),
+                      oauth2_settings)
+        setting_changed.send(sender=None, setting='GOOGLE_OAUTH2_SCOPES',
+                             value=None, enter=True)
+        self.assertIsNot(googleoauth2django.get_oauth2_settings(),
+                         oauth2_settings)
+
+    def test_get_oauth2_settings_rotated_secrets(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        filename = os.path.join(directory, 'client_secrets.json')
+
+        def write_secrets(client_secret):
+            with open(filename, 'w') as file_obj:
+                json.dump({'web': {
+                    'client_id': 'myid', 'client_secret': client_secret,
+                    'redirect_uris': [], 'auth_uri': 'a', 'token_uri': 't'}},
+                    file_obj)
+
+        write_secrets('hunter2')
+        django.conf.settings.GOOGLE_OAUTH2_CLIENT_SECRETS_JSON = filename
+        self.addCleanup(googleoauth2django._reset_oauth2_settings)
+        googleoauth2django._reset_oauth2_settings()
+        oauth2_settings = googleoauth2django.get_oauth2_settings()
+        self.assertEqual(oauth2_settings.client_secret, 'hunter2')
+        self.assertEqual(oauth2_settings.client_secrets_files, (filename,))
 
-        with self.assertRaises(exceptions.ImproperlyConfigured):
-            googleoauth2django.OAuth2Settings.__init__(
-                object.__new__(googleoauth2django.OAuth2Settings),
-                django.conf.settings)
-
-    def test_no_middleware(self):
-        django.conf.settings.MIDDLEWARE = None
-        with self.assertRaises(exceptions.ImproperlyConfigured):
-            googleoauth2django.OAuth2Settings.__init__(
-                object.__new__(googleoauth2django.OAuth2Settings),
-                django.conf.settings)
+        with mock.patch('googleoauth2django.SECRETS_CHECK_INTERVAL', 0):
+            self.assertIs(googleoauth2django.get_oauth2_settings(),
+                          oauth2_settings)
+            write_secrets('rotated-secret')
+            self.assertEqual(
+                googleoauth2django.get_oauth2_settings().client_secret,
+                'rotated-secret')
 
     def test_storage_model(self):
         STORAGE_MODEL = {
@@ -120,6 +154,21 @@ class OAuth2SetupTest(unittest.TestCase):
                          STORAGE_MODEL['user_property'])
         self.assertEqual(oauth2_settings.storage_model_credentials_property,
                          STORAGE_MODEL['credentials_property'])
+        self.assertIsNone(oauth2_settings.storage_model_using)
+        self.assertIsNone(oauth2_settings.storage_model_read_your_writes)
+
+    def test_storage_model_databases(self):
+        django.conf.settings.GOOGLE_OAUTH2_STORAGE_MODEL = {
+            'model': 'tests.models.CredentialsModel',
+            'user_property': 'user_id',
+            'credentials_property': 'credentials',
+            'using': 'credentials',
+            'read_your_writes': 5,
+        }
+        oauth2_settings = googleoauth2django.OAuth2Settings(
+            django.conf.settings)
+        self.assertEqual(oauth2_settings.storage_model_using, 'credentials')
+        self.assertEqual(oauth2_settings.storage_model_read_your_writes, 5)
 
 
 class MockObjectWithSession(object):
@@ -151,6 +200,15 @@ class SessionStorageTest(TestWithDjangoEnvironment):
         django_storage = googleoauth2django.get_storage(request)
         django_storage.delete()
 
+    def test_storage_reused_per_request(self):
+        request = MockObjectWithSession(self.session)
+        django_storage = googleoauth2django.get_storage(request)
+        self.assertIs(googleoauth2django.get_storage(request), django_storage)
+
+        request.user = mock.Mock()
+        self.assertIsNot(googleoauth2django.get_storage(request),
+                         django_storage)
+
 
 class TestUserOAuth2Object(TestWithDjangoEnvironment):
 
@@ -177,3 +235,71 @@ class TestUserOAuth2Object(TestWithDjangoEnvironment):
         request.user = django_models.AnonymousUser()
         oauth2 = googleoauth2django.UserOAuth2(request)
         self.assertIsNone(oauth2.credentials)
+
+    def test_build_service_no_credentials(self):
+        request = self.factory.get('/')
+        request.session = self.session
+        request.user = django_models.AnonymousUser()
+        oauth2 = googleoauth2django.UserOAuth2(request)
+        self.assertIsNone(oauth2.build_service('calendar', 'v3'))
+
+    @mock.patch('googleoauth2django.discovery.build')
+    @mock.patch('googleoauth2django._credentials_from_request')
+    def test_build_service(self, credentials_from_request, build):
+        credentials = credentials_from_request.return_value
+        credentials.valid = True
+        credentials.scopes = django.conf.settings.GOOGLE_OAUTH2_SCOPES
+        request = self.factory.get('/')
+        oauth2 = googleoauth2django.UserOAuth2(request)
+
+        self.assertIs(oauth2.build_service('calendar', 'v3'),
+                      build.return_value)
+        build.assert_called_once_with(
+            'calendar', 'v3', credentials,
+            ttl=googleoauth2django.discovery.DEFAULT_TTL, cache_dir=None)
+
+    @mock.patch('googleoauth2django._credentials_from_request')
+    def test_async_http(self, credentials_from_request):
+        credentials = credentials_from_request.return_value
+        credentials.valid = True
+        credentials.scopes = django.conf.settings.GOOGLE_OAUTH2_SCOPES
+        oauth2 = googleoauth2django.UserOAuth2(self.factory.get('/'))
+
+        http = oauth2.async_http
+        self.assertIs(oauth2.async_http, http)
+        self.assertEqual(http.token, credentials.token)
+        self.assertEqual(http.max_concurrency,
+                         googleoauth2django.fanout.DEFAULT_MAX_CONCURRENCY)
+
+    def test_claims_from_session(self):
+        request = self.factory.get('/')
+        request.session = self.session
+        self.session['google_oauth2_claims'] = {
+            'sub': '1234', 'email': 'bill@example.com'}
+        oauth2 = googleoauth2django.UserOAuth2(request)
+        self.assertEqual(oauth2.email, 'bill@example.com')
+        self.assertEqual(oauth2.user_id, '1234')
+
+    @mock.patch('googleoauth2django._credentials_from_request')
+    def test_claims_from_id_token(self, credentials_from_request):
+        from google.auth import jwt
+        credentials_from_request.return_value.id_token = jwt.encode(
+            mock.Mock(sign=mock.Mock(return_value=b'sig'), key_id=None),
+            {'sub': '1234', 'email': 'bill@example.com', 'name': 'Bill'},
+        ).decode('ascii')
+        request = self.factory.get('/')
+        request.session = self.session
+        oauth2 = googleoauth2django.UserOAuth2(request)
+
+        self.assertEqual(oauth2.claims,
+                         {'sub': '1234', 'email': 'bill@example.com'})
+        self.assertEqual(self.session['google_oauth2_claims'], oauth2.claims)
+
+    @mock.patch('googleoauth2django._credentials_from_request')
+    def test_claims_without_id_token(self, credentials_from_request):
+        credentials_from_request.return_value = None
+        request = self.factory.get('/')
+        request.session = self.session
+        oauth2 = googleoauth2django.UserOAuth2(request)
+        self.assertEqual(oauth2.claims, {})
+        self.assertIsNone(oauth2.email)
@@ -0,0 +1,89 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Import time regression tests.
+
+Every test runs a fresh interpreter with ``-X importtime``, so that the
+results do not depend on what the test runner already imported.
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+
+# Django itself is imported up front so that only the cost of this package
+# is measured.
+_PRELOAD = ('import django.conf, django.db.models, django.dispatch, '
+            'django.conf.urls, django.http, django.shortcuts, django.urls')
+_PACKAGE_MODULES = ('googleoauth2django', 'googleoauth2django.decorators',
+                    'googleoauth2django.models', 'googleoauth2django.site',
+                    'googleoauth2django.views')
+
+# Libraries that must only be imported on first use.
+_LAZY_MODULES = ('asyncio', 'google.oauth2.credentials',
+                 'google_auth_oauthlib', 'jsonpickle', 'oauthlib', 'requests',
+                 'requests_oauthlib', 'urllib3')
+
+# Cumulative import time budget for the package, in microseconds. This is
+# several times the measured cost to stay clear of noise on busy machines.
+IMPORT_BUDGET_US = 25000
+
+
+def _import_times(statement):
+    """Runs ``statement`` in a new interpreter and parses ``-X importtime``.
+
+    Returns:
+        A tuple of a dictionary mapping every imported module to its
+        cumulative import time in microseconds, and the sum of the cumulative
+        times of the top-level imports of ``statement``.
+    """
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [root, env.get('PYTHONPATH')]))
+    env.pop('PYTHONPROFILEIMPORTTIME', None)
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c',
+         '{0}\n{1}'.format(_PRELOAD, statement)],
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True, check=True)
+
+    times = {}
+    total = 0
+    preloaded = True
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        module = name.strip()
+        times.setdefault(module, int(cumulative))
+        if module == 'googleoauth2django':
+            preloaded = False
+        if not preloaded and name == ' ' + module:
+            total += int(cumulative)
+    return times, total
+
+
+class ImportTimeTest(unittest.TestCase):
+
+    def test_lazy_dependencies_not_imported(self):
+        times, _ = _import_times('import ' + ', '.join(_PACKAGE_MODULES))
+        imported = sorted(module for module in _LAZY_MODULES
+                          if module in times)
+        self.assertEqual(imported, [])
+
+    def test_import_budget(self):
+        _, total = _import_times('import ' + ', '.join(_PACKAGE_MODULES))
+        self.assertLess(total, IMPORT_BUDGET_US)
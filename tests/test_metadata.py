@@ -0,0 +1,143 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for metadata server tokens, against a local stub server."""
+
+from http import server
+import json
+import threading
+import time
+import unittest
+
+import mock
+
+from googleoauth2django import metadata
+
+
+class _MetadataHandler(server.BaseHTTPRequestHandler):
+    """Hands out numbered tokens, slowly."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        server.BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        if self.headers['Metadata-Flavor'] != 'Google':
+            self.send_error(403)
+            return
+        with self.server.lock:
+            self.server.requests.append(self.path)
+            number = len(self.server.requests)
+        time.sleep(0.05)
+        if self.path.startswith('/computeMetadata/v1/instance/'
+                                'service-accounts/default/token'):
+            body = json.dumps({'access_token': 'token{0}'.format(number),
+                               'expires_in': 3599,
+                               'token_type': 'Bearer'}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+        else:
+            body = b'not found'
+            self.send_response(404)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TokenSourceTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                                _MetadataHandler)
+        cls.server.lock = threading.Lock()
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+        cls.root = 'http://127.0.0.1:{0}/computeMetadata/v1/'.format(
+            cls.server.server_port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.requests = []
+        self.server.connections = 0
+        metadata.clear()
+
+    def test_token_cached(self):
+        source = metadata.TokenSource(root=self.root)
+        token, expiry = source.token_with_expiry()
+        self.assertEqual(token, 'token1')
+        self.assertAlmostEqual(expiry, time.time() + 3599, delta=5)
+        self.assertEqual(source.token(), 'token1')
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_token_fetched_again_near_expiry(self):
+        source = metadata.TokenSource(root=self.root)
+        source.token()
+        later = time.time() + 3599 - metadata.REFRESH_MARGIN
+        with mock.patch('time.time', return_value=later):
+            self.assertEqual(source.token(), 'token2')
+        # Both fetches used the pooled connection, which earlier tests may
+        # have opened.
+        self.assertLessEqual(self.server.connections, 1)
+
+    def test_concurrent_requests_fetch_once(self):
+        source = metadata.TokenSource(root=self.root)
+        tokens = []
+
+        def get_token():
+            tokens.append(source.token())
+
+        threads = [threading.Thread(target=get_token) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(tokens, ['token1'] * 20)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_scopes(self):
+        source = metadata.TokenSource(scopes=['a', 'b'], root=self.root)
+        source.token()
+        self.assertIn('scopes=a%2Cb', self.server.requests[0])
+
+    def test_errors(self):
+        source = metadata.TokenSource('robot@example.com', root=self.root)
+        with self.assertRaises(metadata.MetadataError):
+            source.token()
+        source = metadata.TokenSource(root='http://127.0.0.1:1/')
+        with self.assertRaises(metadata.MetadataError):
+            source.token()
+
+    def test_get_token_source_shared(self):
+        self.assertIs(metadata.get_token_source(),
+                      metadata.get_token_source())
+        self.assertIsNot(metadata.get_token_source(scopes=['a']),
+                         metadata.get_token_source())
+
+    def test_credentials(self):
+        credentials = metadata.TokenSource(root=self.root).credentials()
+        credentials.refresh(None)
+        self.assertTrue(credentials.valid)
+        self.assertEqual(credentials.token, 'token1')
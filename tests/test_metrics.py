@@ -0,0 +1,212 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the metrics instrumentation."""
+
+import copy
+import json
+import unittest
+
+from django import http
+import django.conf
+from google.oauth2.credentials import Credentials
+import mock
+from six.moves import reload_module
+
+import googleoauth2django
+from googleoauth2django import GOOGLE_TOKEN_URI
+from googleoauth2django import metrics
+from googleoauth2django import models
+from googleoauth2django import views
+from googleoauth2django.helpers import dictionary_storage
+from tests import TestWithDjangoEnvironment
+
+
+def _generate_credentials():
+    return Credentials(
+        token='access_tokenz',
+        refresh_token='refresh_tokenz',
+        token_uri=GOOGLE_TOKEN_URI,
+        client_id='client_idz',
+        client_secret='client_secretz',
+        scopes=['email'])
+
+
+class InMemoryExporterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.exporter = metrics.InMemoryExporter(buckets=(0.1, 1.0))
+
+    def test_counter(self):
+        self.exporter.inc('requests_total', (('code', '200'),))
+        self.exporter.inc('requests_total', (('code', '200'),), 2)
+        self.assertEqual(
+            self.exporter.counter_value('requests_total', code='200'), 3)
+        self.assertEqual(
+            self.exporter.counter_value('requests_total', code='500'), 0)
+
+    def test_histogram(self):
+        self.exporter.observe('latency_seconds', (), 0.05)
+        self.exporter.observe('latency_seconds', (), 0.5)
+        self.exporter.observe('latency_seconds', (), 5)
+        self.assertEqual(self.exporter.histogram_count('latency_seconds'), 3)
+        self.assertEqual(
+            self.exporter.histograms[('latency_seconds', ())][0], [1, 1, 1])
+
+    def test_reset(self):
+        self.exporter.inc('requests_total', ())
+        self.exporter.observe('latency_seconds', (), 0.5)
+        self.exporter.reset()
+        self.assertEqual(self.exporter.counters, {})
+        self.assertEqual(self.exporter.histograms, {})
+
+    def test_render_prometheus(self):
+        self.exporter.inc('requests_total', (('path', 'a"b'),))
+        self.exporter.observe('latency_seconds', (('op', 'get'),), 0.5)
+        text = metrics.render_prometheus(self.exporter)
+        self.assertIn('# TYPE requests_total counter', text)
+        self.assertIn('requests_total{path="a\\"b"} 1', text)
+        self.assertIn('# TYPE latency_seconds histogram', text)
+        self.assertIn('latency_seconds_bucket{op="get",le="0.1"} 0', text)
+        self.assertIn('latency_seconds_bucket{op="get",le="1.0"} 1', text)
+        self.assertIn('latency_seconds_bucket{op="get",le="+Inf"} 1', text)
+        self.assertIn('latency_seconds_count{op="get"} 1', text)
+
+    def test_abstract_exporter(self):
+        exporter = metrics.Exporter()
+        with self.assertRaises(NotImplementedError):
+            exporter.inc('name', ())
+        with self.assertRaises(NotImplementedError):
+            exporter.observe('name', (), 1)
+
+
+class MetricsHooksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.exporter = metrics.InMemoryExporter()
+        metrics.set_exporter(self.exporter)
+
+    def tearDown(self):
+        metrics.set_exporter(None)
+
+    def test_disabled_is_noop(self):
+        metrics.set_exporter(None)
+        self.assertIsNone(metrics.get_exporter())
+        metrics.inc('requests_total')
+        with metrics.timer('latency_seconds'):
+            pass
+        self.assertIs(metrics.timer('latency_seconds'), metrics._NULL_TIMER)
+        self.assertEqual(self.exporter.counters, {})
+
+    def test_timer(self):
+        with metrics.timer('latency_seconds', op='get'):
+            pass
+        self.assertEqual(
+            self.exporter.histogram_count('latency_seconds', op='get'), 1)
+
+    def test_storage_and_codec(self):
+        storage = dictionary_storage.DictionaryStorage({}, 'creds')
+        storage.put(_generate_credentials())
+        storage.get()
+        storage.delete()
+        for operation in ('get', 'put', 'delete'):
+            self.assertEqual(self.exporter.histogram_count(
+                'googleoauth2django_storage_seconds',
+                backend='DictionaryStorage', operation=operation), 1)
+        for operation in ('encode', 'decode'):
+            self.assertEqual(self.exporter.histogram_count(
+                'googleoauth2django_codec_seconds',
+                codec='session', operation=operation), 1)
+
+    def test_orm_codec(self):
+        field = models.CredentialsField()
+        field.to_python(field.get_prep_value(_generate_credentials()))
+        for operation in ('encode', 'decode'):
+            self.assertEqual(self.exporter.histogram_count(
+                'googleoauth2django_codec_seconds',
+                codec='orm', operation=operation), 1)
+
+
+class MetricsConfigureTest(unittest.TestCase):
+
+    def tearDown(self):
+        metrics.set_exporter(None)
+
+    def test_disabled_by_default(self):
+        metrics.configure(object())
+        self.assertIsNone(metrics.get_exporter())
+
+    def test_in_memory(self):
+        settings = mock.Mock(GOOGLE_OAUTH2_METRICS_EXPORTER=True)
+        metrics.configure(settings)
+        self.assertIsInstance(metrics.get_exporter(),
+                              metrics.InMemoryExporter)
+
+    def test_dotted_path(self):
+        settings = mock.Mock(GOOGLE_OAUTH2_METRICS_EXPORTER=(
+            'googleoauth2django.metrics.InMemoryExporter'))
+        metrics.configure(settings)
+        self.assertIsInstance(metrics.get_exporter(),
+                              metrics.InMemoryExporter)
+
+
+class MetricsViewsTest(TestWithDjangoEnvironment):
+
+    def setUp(self):
+        super(MetricsViewsTest, self).setUp()
+        self.save_settings = copy.deepcopy(django.conf.settings)
+        reload_module(googleoauth2django)
+        self.exporter = metrics.InMemoryExporter()
+        metrics.set_exporter(self.exporter)
+
+    def tearDown(self):
+        metrics.set_exporter(None)
+        django.conf.settings = copy.deepcopy(self.save_settings)
+
+    def test_prometheus_view(self):
+        metrics.inc('requests_total')
+        response = metrics.prometheus_view(self.factory.get('/metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'requests_total 1', response.content)
+
+    def test_prometheus_view_disabled(self):
+        metrics.set_exporter(None)
+        with self.assertRaises(http.Http404):
+            metrics.prometheus_view(self.factory.get('/metrics'))
+
+    def test_callback_failure_counted(self):
+        request = self.factory.get('oauth2/oauth2callback', data={
+            'state': json.dumps({'csrf_token': 'token', 'return_url': '/'}),
+            'code': 123
+        })
+        self.session['google_oauth2_csrf_token'] = 'WRONG TOKEN'
+        request.session = self.session
+        views.oauth2_callback(request)
+        self.assertEqual(self.exporter.counter_value(
+            'googleoauth2django_callback_total', result='invalid_csrf'), 1)
+
+    def test_authorize_redirect_counted(self):
+        request = self.factory.get('oauth2/oauth2authorize')
+        request.session = self.session
+        views.oauth2_authorize(request)
+        self.assertEqual(self.exporter.counter_value(
+            'googleoauth2django_authorize_redirects_total',
+            target='google'), 1)
+
+    def test_has_credentials_counted(self):
+        request = self.factory.get('/test')
+        request.session = self.session
+        googleoauth2django.UserOAuth2(request).has_credentials()
+        self.assertEqual(self.exporter.counter_value(
+            'googleoauth2django_has_credentials_total', result='missing'), 1)
@@ -0,0 +1,154 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the oauth2_migrate_credentials management command."""
+
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth import models as django_models
+from django.core import management
+from django.db import models
+from django.db import transaction
+from google.oauth2.credentials import Credentials
+import mock
+
+from googleoauth2django import models as oauth2_models
+from googleoauth2django.management.commands import oauth2_migrate_credentials
+from tests import models as tests_models
+from tests import TestWithDjangoEnvironment
+
+
+class SplitRangeTest(TestWithDjangoEnvironment):
+
+    def test_split_range(self):
+        split_range = oauth2_migrate_credentials.split_range
+        self.assertEqual(split_range(1, 10, 3), [(1, 4), (5, 8), (9, 10)])
+        self.assertEqual(split_range(1, 2, 4), [(1, 1), (2, 2)])
+        self.assertEqual(split_range(5, 5, 1), [(5, 5)])
+
+
+class MigrateCredentialsTest(TestWithDjangoEnvironment):
+
+    def setUp(self):
+        super(MigrateCredentialsTest, self).setUp()
+        for number in range(5):
+            user = django_models.User.objects.create_user(
+                username='user{0}'.format(number))
+            tests_models.CredentialsModel.objects.create(
+                user_id=user, credentials=Credentials(
+                    'token{0}'.format(number), refresh_token='refresh'))
+        self.field = tests_models.CredentialsModel._meta.get_field(
+            'credentials')
+        patcher = mock.patch.object(self.field, 'codec',
+                                    oauth2_models.CODEC_JSON)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def _codecs(self):
+        rows = tests_models.CredentialsModel.objects.annotate(
+            raw=models.ExpressionWrapper(
+                models.F('credentials'), output_field=models.BinaryField()),
+        ).values_list('raw', flat=True)
+        return sorted(oauth2_models.stored_codec(raw) for raw in rows)
+
+    def _migrate(self, *args):
+        out = io.StringIO()
+        management.call_command(
+            'oauth2_migrate_credentials', '--model',
+            'tests.models.CredentialsModel', '--field', 'credentials',
+            '--chunk-size', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def test_migrate(self):
+        self.assertEqual(self._codecs(), ['jsonpickle'] * 5)
+        output = self._migrate()
+        self.assertIn('Rewrote 5 of 5 rows to json', output)
+        self.assertIn('rows/s', output)
+        self.assertEqual(self._codecs(), ['json'] * 5)
+        self.assertEqual(
+            sorted(entity.credentials.token for entity in
+                   tests_models.CredentialsModel.objects.all()),
+            ['token{0}'.format(number) for number in range(5)])
+
+        self.assertIn('Rewrote 0 of 5 rows', self._migrate())
+
+    def test_dry_run(self):
+        self.assertIn('Would rewrite 5 of 5 rows', self._migrate('--dry-run'))
+        self.assertEqual(self._codecs(), ['jsonpickle'] * 5)
+
+    def test_pk_range(self):
+        pks = list(tests_models.CredentialsModel.objects.order_by(
+            'pk').values_list('pk', flat=True))
+        self._migrate('--start-pk', str(pks[1]), '--end-pk', str(pks[2]))
+        self.assertEqual(self._codecs(), ['json'] * 2 + ['jsonpickle'] * 3)
+
+    def test_checkpoint_resumes(self):
+        pks = list(tests_models.CredentialsModel.objects.order_by(
+            'pk').values_list('pk', flat=True))
+        path = os.path.join(self.directory, 'checkpoint')
+        with open(path, 'w') as checkpoint_file:
+            json.dump({'{0}:{1}'.format(pks[0], pks[-1]): pks[2]},
+                      checkpoint_file)
+
+        self.assertIn('Rewrote 2 of 2 rows', self._migrate(
+            '--checkpoint', path))
+        self.assertEqual(self._codecs(), ['json'] * 2 + ['jsonpickle'] * 3)
+        with open(path) as checkpoint_file:
+            self.assertEqual(json.load(checkpoint_file),
+                             {'{0}:{1}'.format(pks[0], pks[-1]): pks[-1]})
+
+    def test_storage_database(self):
+        oauth2_settings = mock.Mock(
+            storage_model='tests.models.CredentialsModel',
+            storage_model_using='default')
+        # The routers would pick a database that does not exist.
+        with mock.patch('googleoauth2django.get_oauth2_settings',
+                        return_value=oauth2_settings), \
+                mock.patch.object(oauth2_migrate_credentials.router,
+                                  'db_for_write', return_value='missing'), \
+                mock.patch.object(oauth2_migrate_credentials.transaction,
+                                  'atomic',
+                                  wraps=transaction.atomic) as atomic:
+            self.assertIn('Rewrote 5 of 5 rows', self._migrate())
+        self.assertTrue(atomic.call_args_list)
+        for call in atomic.call_args_list:
+            self.assertEqual(call[1]['using'], 'default')
+
+    def test_database_option(self):
+        with mock.patch.object(oauth2_migrate_credentials.router,
+                               'db_for_write', return_value='missing'):
+            self.assertIn('Rewrote 5 of 5 rows',
+                          self._migrate('--database', 'default'))
+
+    def test_workers_on_sqlite(self):
+        with self.assertRaises(management.CommandError):
+            self._migrate('--workers', '2')
+
+    def test_not_a_credentials_field(self):
+        with self.assertRaises(management.CommandError):
+            self._migrate('--field', 'google_sub')
+
+    def test_non_integer_pk(self):
+        with self.assertRaisesRegex(management.CommandError,
+                                    'integer primary key'):
+            management.call_command(
+                'oauth2_migrate_credentials', '--model',
+                'tests.models.UUIDCredentialsModel', '--field',
+                'credentials', stdout=io.StringIO())
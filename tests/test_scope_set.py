@@ -0,0 +1,159 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the interned scope sets."""
+
+import threading
+import unittest
+
+import mock
+
+import googleoauth2django
+from googleoauth2django import decorators
+from googleoauth2django import scope_set
+from tests import TestWithDjangoEnvironment
+
+DRIVE = 'https://www.googleapis.com/auth/drive'
+
+
+class ScopeSetTest(unittest.TestCase):
+
+    def test_canonical(self):
+        self.assertEqual(scope_set.mask('email  ' + DRIVE),
+                         scope_set.mask([DRIVE, 'email']))
+        self.assertEqual(scope_set.mask(('email', 'email')),
+                         scope_set.mask('email'))
+        self.assertEqual(scope_set.mask(None), 0)
+        self.assertEqual(scope_set.mask([]), 0)
+
+    def test_mask_returned_as_is(self):
+        mask = scope_set.mask(['email'])
+        self.assertIs(scope_set.mask(mask), mask)
+
+    def test_names(self):
+        mask = scope_set.mask(['email', DRIVE])
+        self.assertEqual(scope_set.names(mask), frozenset(['email', DRIVE]))
+        self.assertEqual(scope_set.names(0), frozenset())
+        self.assertEqual(scope_set.to_string(mask), 'email ' + DRIVE)
+
+    def test_covers(self):
+        granted = scope_set.mask(['email', 'profile', DRIVE])
+        self.assertTrue(scope_set.covers(granted,
+                                         scope_set.mask(['email', DRIVE])))
+        self.assertTrue(scope_set.covers(granted, 0))
+        self.assertFalse(scope_set.covers(granted,
+                                          scope_set.mask(['email', 'other'])))
+
+    def test_lookup_does_not_intern(self):
+        known = scope_set.mask(['email', DRIVE])
+        self.assertEqual(scope_set.lookup(DRIVE + ' email'), known)
+        bits = len(scope_set._bits)
+        unknown = scope_set.lookup(['email', 'lookup-only'])
+        self.assertEqual(unknown, frozenset(['email', 'lookup-only']))
+        self.assertEqual(scope_set.lookup('email  lookup-only'), unknown)
+        self.assertEqual(len(scope_set._bits), bits)
+        self.assertIs(scope_set.lookup(unknown), unknown)
+        self.assertEqual(scope_set.lookup(None), 0)
+
+    def test_covers_unknown_scopes(self):
+        known = scope_set.mask(['email', DRIVE])
+        unknown = scope_set.lookup(['email', DRIVE, 'lookup-only'])
+        self.assertTrue(scope_set.covers(unknown, known))
+        self.assertFalse(scope_set.covers(known, unknown))
+        self.assertTrue(scope_set.covers(unknown, unknown))
+        self.assertFalse(scope_set.covers(
+            scope_set.lookup(['lookup-other']), unknown))
+
+    def test_union(self):
+        email = scope_set.mask(['email'])
+        drive = scope_set.mask([DRIVE])
+        self.assertEqual(scope_set.union(email, drive), email | drive)
+        self.assertEqual(
+            scope_set.union(email, scope_set.lookup(['lookup-only'])),
+            frozenset(['email', 'lookup-only']))
+        self.assertEqual(scope_set.to_string(scope_set.union(
+            scope_set.lookup(['lookup-only']), drive)),
+            DRIVE + ' lookup-only')
+
+    def test_memo_bounded(self):
+        with mock.patch('googleoauth2django.scope_set.MAX_MEMOIZED', 2):
+            masks = [scope_set.mask(['email', 'scope{0}'.format(i)])
+                     for i in range(5)]
+            self.assertLessEqual(len(scope_set._masks), 2)
+        self.assertEqual(len(set(masks)), 5)
+        self.assertEqual(masks[0],
+                         scope_set.mask(['email', 'scope0']))
+
+    def test_concurrent_interning(self):
+        scopes = ['concurrent{0}'.format(i) for i in range(50)]
+        masks = []
+
+        def intern():
+            masks.append([scope_set.mask([scope]) for scope in scopes])
+
+        threads = [threading.Thread(target=intern) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(map(tuple, masks))), 1)
+        self.assertEqual(len(set(masks[0])), 50)
+
+
+class UserOAuth2ScopesTest(TestWithDjangoEnvironment):
+
+    def setUp(self):
+        super(UserOAuth2ScopesTest, self).setUp()
+        self.request = self.factory.get('/')
+        self.request.session = self.session
+        patcher = mock.patch('googleoauth2django._credentials_from_request')
+        self.credentials = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.credentials.valid = True
+        self.credentials.scopes = list(
+            googleoauth2django.get_oauth2_settings().scopes) + ['email']
+
+    def test_has_credentials(self):
+        self.assertTrue(googleoauth2django.UserOAuth2(
+            self.request, scopes=['email']).has_credentials())
+        self.assertFalse(googleoauth2django.UserOAuth2(
+            self.request, scopes=['email', DRIVE]).has_credentials())
+
+    def test_scopes_include_granted(self):
+        user_oauth = googleoauth2django.UserOAuth2(self.request,
+                                                   scopes=[DRIVE])
+        self.assertEqual(user_oauth.scopes,
+                         set(self.credentials.scopes) | {DRIVE})
+
+    def test_request_scopes_not_interned(self):
+        bits = len(scope_set._bits)
+        user_oauth = googleoauth2django.UserOAuth2(
+            self.request, scopes=['email', 'from-request'])
+        self.assertIn('from-request', user_oauth.scopes)
+        self.assertFalse(user_oauth.has_credentials())
+        self.credentials.scopes.append('from-request')
+        self.assertTrue(user_oauth.has_credentials())
+        self.assertEqual(len(scope_set._bits), bits)
+
+    def test_decorator_interns_once(self):
+        with mock.patch('googleoauth2django.scope_set.mask',
+                        wraps=scope_set.mask) as mask:
+            @decorators.oauth_enabled(scopes=[DRIVE])
+            def test_view(request):
+                return request.oauth
+
+            mask.assert_called_once_with([DRIVE])
+            user_oauth = test_view(self.request)
+        self.assertEqual(user_oauth._scope_mask & scope_set.mask([DRIVE]),
+                         scope_set.mask([DRIVE]))
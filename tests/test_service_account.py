@@ -0,0 +1,107 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for self-signed service account tokens."""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from google.auth import jwt
+import mock
+
+from googleoauth2django import service_account
+from tests import read_data
+
+EMAIL = 'robot@project.iam.gserviceaccount.com'
+AUDIENCE = 'https://pubsub.googleapis.com/'
+
+
+class ServiceAccountTest(unittest.TestCase):
+
+    def setUp(self):
+        service_account.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.key_path = os.path.join(self.directory, 'key.json')
+        self._write_key('key-1')
+        self.certs = {'key-1': read_data('public_cert.pem')}
+
+    def _write_key(self, key_id):
+        with open(self.key_path, 'w') as key_file:
+            json.dump({'type': 'service_account', 'client_email': EMAIL,
+                       'private_key_id': key_id,
+                       'private_key': read_data('privatekey.pem')}, key_file)
+
+    def test_token_for_audience(self):
+        account = service_account.ServiceAccount.from_file(self.key_path)
+        token = account.token(audience=AUDIENCE)
+        self.assertEqual(jwt.decode_header(token)['kid'], 'key-1')
+        claims = jwt.decode(token, certs=self.certs, audience=AUDIENCE)
+        self.assertEqual(claims['iss'], EMAIL)
+        self.assertEqual(claims['sub'], EMAIL)
+        self.assertEqual(claims['exp'] - claims['iat'],
+                         service_account.TOKEN_LIFETIME)
+
+    def test_scoped_token(self):
+        account = service_account.ServiceAccount.from_file(self.key_path)
+        token = account.token(scopes=['b', 'a'], subject='user@example.com')
+        claims = jwt.decode(token, certs=self.certs, verify=False)
+        self.assertEqual(claims['scope'], 'a b')
+        self.assertEqual(claims['sub'], 'user@example.com')
+        self.assertNotIn('aud', claims)
+
+    def test_no_audience_or_scopes(self):
+        account = service_account.ServiceAccount.from_file(self.key_path)
+        with self.assertRaises(ValueError):
+            account.token()
+
+    def test_tokens_reused_until_near_expiry(self):
+        account = service_account.ServiceAccount.from_file(self.key_path)
+        with mock.patch.object(account, '_sign',
+                               wraps=account._sign) as sign:
+            token = account.token(audience=AUDIENCE)
+            self.assertEqual(account.token(audience=AUDIENCE), token)
+            account.token(scopes=['a'])
+            self.assertEqual(account.token(scopes=('a',)),
+                             account.token(scopes=['a']))
+            self.assertEqual(sign.call_count, 2)
+
+            later = (time.time() + service_account.TOKEN_LIFETIME -
+                     service_account.REFRESH_MARGIN)
+            with mock.patch('time.time', return_value=later):
+                account.token(audience=AUDIENCE)
+            self.assertEqual(sign.call_count, 3)
+
+    def test_key_file_cached_until_changed(self):
+        first = service_account.load_key_file(self.key_path)
+        self.assertIs(service_account.load_key_file(self.key_path), first)
+
+        self._write_key('key-2')
+        stat = os.stat(self.key_path)
+        os.utime(self.key_path, ns=(stat.st_atime_ns,
+                                    stat.st_mtime_ns + 10 ** 9))
+        info, signer = service_account.load_key_file(self.key_path)
+        self.assertEqual(signer.key_id, 'key-2')
+
+    def test_credentials(self):
+        account = service_account.ServiceAccount.from_file(self.key_path)
+        credentials = account.credentials(audience=AUDIENCE)
+        self.assertFalse(credentials.valid)
+        credentials.refresh(None)
+        self.assertTrue(credentials.valid)
+        self.assertEqual(credentials.token, account.token(audience=AUDIENCE))
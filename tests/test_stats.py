@@ -0,0 +1,95 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the per-request OAuth2 stats collector."""
+
+import copy
+import unittest
+
+from django import http
+import django.conf
+from six.moves import reload_module
+
+import googleoauth2django
+from googleoauth2django import decorators
+from googleoauth2django import metrics
+from googleoauth2django import stats
+from tests import TestWithDjangoEnvironment
+
+
+class RequestStatsTest(unittest.TestCase):
+
+    def test_record(self):
+        request_stats = stats.RequestStats()
+        request_stats.record('oauth-storage', 0.002)
+        request_stats.record('oauth-storage', 0.001)
+        request_stats.record('oauth-google', 0.1)
+        self.assertEqual(list(request_stats.phases), [
+            'oauth-storage', 'oauth-google'])
+        self.assertEqual(request_stats.as_dict()['oauth-storage']['calls'], 2)
+        self.assertEqual(
+            request_stats.server_timing(),
+            'oauth-storage;dur=3.000;desc="2 calls", '
+            'oauth-google;dur=100.000;desc="1 call"')
+
+    def test_phase_without_collector(self):
+        self.assertIsNone(stats.current())
+        self.assertIs(stats.phase(stats.PHASE_STORAGE), metrics._NULL_TIMER)
+
+
+class OAuth2StatsMiddlewareTest(TestWithDjangoEnvironment):
+
+    def setUp(self):
+        super(OAuth2StatsMiddlewareTest, self).setUp()
+        self.save_settings = copy.deepcopy(django.conf.settings)
+        reload_module(googleoauth2django)
+
+    def tearDown(self):
+        django.conf.settings = copy.deepcopy(self.save_settings)
+
+    def test_decorated_view(self):
+        @decorators.oauth_enabled
+        def test_view(request):
+            request.oauth.has_credentials()
+            self.assertIs(stats.current(), request.oauth_stats)
+            return http.HttpResponse('test')
+
+        request = self.factory.get('/test')
+        request.session = self.session
+        middleware = stats.OAuth2StatsMiddleware(test_view)
+        response = middleware(request)
+
+        self.assertIsNone(stats.current())
+        self.assertIn(stats.PHASE_SETTINGS, request.oauth_stats.phases)
+        self.assertIn(stats.PHASE_STORAGE, request.oauth_stats.phases)
+        self.assertIn('oauth-settings;dur=', response['Server-Timing'])
+
+    def test_appends_existing_header(self):
+        def test_view(request):
+            with stats.phase(stats.PHASE_GOOGLE):
+                pass
+            response = http.HttpResponse('test')
+            response['Server-Timing'] = 'db;dur=1'
+            return response
+
+        response = stats.OAuth2StatsMiddleware(test_view)(
+            self.factory.get('/test'))
+        self.assertTrue(
+            response['Server-Timing'].startswith('db;dur=1, oauth-google'))
+
+    def test_no_phases_no_header(self):
+        response = stats.OAuth2StatsMiddleware(
+            lambda request: http.HttpResponse('test'))(
+                self.factory.get('/test'))
+        self.assertFalse(response.has_header('Server-Timing'))
@@ -0,0 +1,267 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the OAuth clients of tenants."""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from django import http
+import mock
+
+import googleoauth2django
+from googleoauth2django import tenants
+from googleoauth2django import views
+from tests import models
+from tests import TestWithDjangoEnvironment
+
+CLIENT_SECRETS = os.path.join(os.path.dirname(__file__), 'helpers', 'data',
+                              'client_secrets.json')
+TENANTS = [
+    {'name': 'acme', 'hosts': ['acme.example.com', 'localhost'],
+     'client_id': 'acme-id', 'client_secret': 'acme-secret',
+     'scopes': ['email', 'profile']},
+    {'name': 'globex', 'hosts': ['Globex.example.com'],
+     'client_secrets_json': CLIENT_SECRETS, 'storage_key': 'g'},
+]
+
+
+def load_tenants():
+    return TENANTS
+
+
+class TenantRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.default = tenants.Tenant(None, 'default-id', 'default-secret',
+                                      ('email',))
+        self.registry = tenants.load(TENANTS, ('email',), self.default)
+
+    def test_tenants(self):
+        self.assertEqual(len(self.registry), 2)
+        acme = self.registry.get('acme')
+        self.assertEqual(acme.client_id, 'acme-id')
+        self.assertEqual(acme.scopes, ('email', 'profile'))
+        self.assertEqual(acme.client_config['web']['client_secret'],
+                         'acme-secret')
+        self.assertEqual(acme.client_config['web']['token_uri'],
+                         googleoauth2django.GOOGLE_TOKEN_URI)
+        globex = self.registry.get('globex')
+        self.assertEqual(globex.client_id, 'foo_client_id')
+        self.assertEqual(globex.scopes, ('email',))
+        self.assertEqual(globex.storage_key, 'g')
+        self.assertEqual(acme.storage_key, 'acme')
+
+    def test_for_host(self):
+        self.assertEqual(self.registry.for_host('acme.example.com').name,
+                         'acme')
+        self.assertEqual(self.registry.for_host('ACME.example.com:8000').name,
+                         'acme')
+        self.assertEqual(self.registry.for_host('globex.example.com').name,
+                         'globex')
+        self.assertIs(self.registry.for_host('other.example.com'),
+                      self.default)
+
+    def test_reload(self):
+        globex = self.registry.get('globex')
+        reloaded = self.registry.reload(globex)
+        self.assertIsNot(reloaded, globex)
+        self.assertEqual(reloaded.client_id, 'foo_client_id')
+        self.assertEqual(reloaded.storage_key, 'g')
+        self.assertEqual(reloaded.hosts, globex.hosts)
+        self.assertIs(self.registry.get('globex'), reloaded)
+        self.assertIs(self.registry.for_host('globex.example.com'), reloaded)
+
+    def test_unknown_host(self):
+        registry = tenants.load(TENANTS, ('email',))
+        with self.assertRaises(http.Http404):
+            registry.for_host('other.example.com')
+
+    def test_load_from_path(self):
+        self.assertEqual(len(tenants.load('tests.test_tenants.TENANTS', ())),
+                         2)
+        self.assertEqual(
+            len(tenants.load('tests.test_tenants.load_tenants', ())), 2)
+
+    def test_invalid(self):
+        for config in ([{'hosts': ['a']}],
+                       [{'name': 'acme'}],
+                       TENANTS + [TENANTS[0]],
+                       TENANTS + [{'name': 'other', 'hosts': ['localhost'],
+                                   'client_id': 'id',
+                                   'client_secret': 'secret'}]):
+            with self.assertRaises(ValueError):
+                tenants.load(config, ())
+
+
+class TenantSettingsTest(unittest.TestCase):
+
+    def test_tenants_without_default_client(self):
+        settings = mock.Mock(spec=['GOOGLE_OAUTH2_TENANTS'],
+                             GOOGLE_OAUTH2_TENANTS=TENANTS)
+        oauth2_settings = googleoauth2django.OAuth2Settings(settings)
+        self.assertIsNone(oauth2_settings.client_id)
+        self.assertIsNone(oauth2_settings.default_tenant)
+        self.assertEqual(len(oauth2_settings.tenants), 2)
+        self.assertEqual(oauth2_settings.bearer_audiences,
+                         ('acme-id', 'foo_client_id'))
+        # The files of the tenants are checked by get_tenant.
+        self.assertEqual(oauth2_settings.client_secrets_files, ())
+
+    def test_bearer_audiences_of_tenants_and_default_client(self):
+        settings = mock.Mock(
+            spec=['GOOGLE_OAUTH2_TENANTS', 'GOOGLE_OAUTH2_CLIENT_ID',
+                  'GOOGLE_OAUTH2_CLIENT_SECRET'],
+            GOOGLE_OAUTH2_TENANTS=TENANTS,
+            GOOGLE_OAUTH2_CLIENT_ID='acme-id',
+            GOOGLE_OAUTH2_CLIENT_SECRET='secret')
+        self.assertEqual(
+            googleoauth2django.OAuth2Settings(settings).bearer_audiences,
+            ('acme-id', 'foo_client_id'))
+
+
+class GetTenantTest(TestWithDjangoEnvironment):
+
+    def setUp(self):
+        super(GetTenantTest, self).setUp()
+        self.oauth2_settings = mock.Mock(
+            tenants=tenants.load(TENANTS, ('email',)), storage_model=None,
+            session_compress=False, shared_token_cache=None,
+            bearer_audiences=(), _audiences_of_clients=False)
+        patcher = mock.patch('googleoauth2django.get_oauth2_settings',
+                             return_value=self.oauth2_settings)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _request(self, host):
+        request = self.factory.get('/', HTTP_HOST=host)
+        request.session = self.session
+        return request
+
+    def test_get_tenant_once_per_request(self):
+        request = mock.Mock(spec=['get_host'])
+        request.get_host.return_value = 'globex.example.com'
+        self.assertEqual(googleoauth2django.get_tenant(request).name,
+                         'globex')
+        googleoauth2django.get_tenant(request)
+        request.get_host.assert_called_once_with()
+
+    def test_rotated_secrets_reload_the_tenant(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        filename = os.path.join(directory, 'client_secrets.json')
+
+        def write_secrets(client_id, client_secret):
+            with open(filename, 'w') as file_obj:
+                json.dump({'web': {
+                    'client_id': client_id, 'client_secret': client_secret,
+                    'redirect_uris': [], 'auth_uri': 'a', 'token_uri': 't'}},
+                    file_obj)
+
+        def get_tenant(host):
+            request = mock.Mock(spec=['get_host'])
+            request.get_host.return_value = host
+            return googleoauth2django.get_tenant(request)
+
+        write_secrets('initech-id', 'hunter2')
+        self.addCleanup(googleoauth2django._reset_oauth2_settings)
+        googleoauth2django._reset_oauth2_settings()
+        self.oauth2_settings.tenants = tenants.load(
+            TENANTS + [{'name': 'initech', 'hosts': ['initech.example.com'],
+                        'client_secrets_json': filename}], ('email',),
+            cache=googleoauth2django._get_secrets_cache())
+        self.oauth2_settings._audiences_of_clients = True
+        self.oauth2_settings.bearer_audiences = ('acme-id', 'initech-id')
+        acme = get_tenant('acme.example.com')
+        initech = get_tenant('initech.example.com')
+
+        with mock.patch('googleoauth2django.SECRETS_CHECK_INTERVAL', 0), \
+                mock.patch('googleoauth2django.helpers.clientsecrets.'
+                           'FileCache.changed',
+                           wraps=googleoauth2django._get_secrets_cache()
+                           .changed) as changed:
+            self.assertIs(get_tenant('initech.example.com'), initech)
+            write_secrets('rotated-id', 'rotated-secret')
+            rotated = get_tenant('initech.example.com')
+            self.assertIs(get_tenant('acme.example.com'), acme)
+        # Only the file of the tenant of each request is checked.
+        self.assertEqual(changed.call_args_list,
+                         [mock.call(filename), mock.call(filename)])
+        self.assertEqual(rotated.client_secret, 'rotated-secret')
+        self.assertIs(self.oauth2_settings.tenants.get('initech'), rotated)
+        self.assertEqual(self.oauth2_settings.bearer_audiences,
+                         ('acme-id', 'initech-id', 'rotated-id'))
+
+    def test_without_tenants(self):
+        self.oauth2_settings.tenants = None
+        self.assertIs(googleoauth2django.get_tenant(mock.Mock()),
+                      self.oauth2_settings.default_tenant)
+
+    def test_session_key_per_tenant(self):
+        django_storage = googleoauth2django.get_storage(
+            self._request('localhost'))
+        self.assertEqual(django_storage._key,
+                         'google_oauth2_credentials:acme')
+
+    def test_storage_model_per_tenant(self):
+        self.oauth2_settings.storage_model = 'tests.models.CredentialsModel'
+        self.oauth2_settings.storage_model_user_property = 'user_id'
+        self.oauth2_settings.storage_model_credentials_property = (
+            'credentials')
+        self.oauth2_settings.storage_model_tenant_property = 'tenant'
+        self.oauth2_settings.storage_model_read_your_writes = None
+        self.oauth2_settings.negative_cache = {'backend': 'session'}
+        self.oauth2_settings.broker = {'socket': '/tmp/broker.sock'}
+        self.oauth2_settings.shared_token_cache = {'path': '/tmp/tokens'}
+        request = self._request('localhost')
+        request.user = mock.Mock(pk=7)
+        with mock.patch('googleoauth2django.get_storage_model_class',
+                        return_value=models.CredentialsModel), \
+                mock.patch('googleoauth2django.token_cache.get_cache'):
+            shared = googleoauth2django.get_storage(request)
+
+        self.assertEqual(shared.client_id, 'acme-id')
+        self.assertTrue(shared.key.endswith(
+            'user_id=7:google_oauth2_credentials:acme'))
+        broker_storage = shared.backend
+        self.assertEqual(broker_storage.key, 'acme:7')
+        self.assertEqual(broker_storage.client_id, 'acme-id')
+        orm_storage = broker_storage.backend
+        self.assertEqual(orm_storage._query(),
+                         {'user_id': request.user, 'tenant': 'acme'})
+        self.assertTrue(
+            orm_storage.negative_cache.key.endswith(':tenant=acme'))
+
+    def test_broker_key(self):
+        self.assertEqual(googleoauth2django.broker_key(7, 'g'), 'g:7')
+        self.assertEqual(googleoauth2django.parse_broker_key('g:7'),
+                         ('7', 'g'))
+        self.assertEqual(googleoauth2django.parse_broker_key(
+            googleoauth2django.broker_key(7)), ('7', None))
+        self.oauth2_settings.tenants = None
+        self.assertEqual(googleoauth2django.broker_key(7), '7')
+        self.assertEqual(googleoauth2django.parse_broker_key('7'),
+                         ('7', None))
+
+    def test_user_oauth2_scopes(self):
+        user_oauth = googleoauth2django.UserOAuth2(
+            self._request('localhost'), scopes=['drive'])
+        self.assertEqual(user_oauth.scopes, {'email', 'profile', 'drive'})
+
+    def test_flow_uses_tenant_client(self):
+        flow = views._make_flow(self._request('localhost'), ['email'])
+        self.assertEqual(flow.client_config['client_id'], 'acme-id')
@@ -0,0 +1,248 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the access tokens shared by the processes of a host."""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import mock
+
+import googleoauth2django
+from googleoauth2django import token_cache
+from googleoauth2django.helpers.dictionary_storage import DictionaryStorage
+from tests import FakeCredentials
+from tests import MemoryStorage
+
+
+def _refresh_in_child(path, log_path, queue):
+    cache = token_cache.SharedTokenCache(path, 16)
+    backend = MemoryStorage()
+    backend.put(FakeCredentials('stale', -10, log_path=log_path))
+    storage = token_cache.SharedTokenStorage(backend, cache, 'user:1')
+    queue.put(storage.refresh(None, 'stale')[0])
+
+
+class SharedTokenCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'tokens')
+        self.cache = token_cache.SharedTokenCache(self.path, 16)
+        self.addCleanup(self.cache.close)
+
+    def test_put_get(self):
+        expiry = time.time() + 3600
+        self.assertTrue(self.cache.put('user:1', 'token', expiry,
+                                       ['email', 'profile']))
+        self.assertEqual(self.cache.get('user:1'),
+                         ('token', expiry, ['email', 'profile']))
+        self.assertIsNone(self.cache.get('user:2'))
+
+    def test_shared_through_file(self):
+        self.cache.put('user:1', 'token', time.time() + 3600)
+        other = token_cache.SharedTokenCache(self.path, 16)
+        self.addCleanup(other.close)
+        self.assertEqual(other.get('user:1')[0], 'token')
+
+    def test_expiring_token_not_returned(self):
+        self.cache.put('user:1', 'token',
+                       time.time() + token_cache.REFRESH_MARGIN - 1)
+        self.assertIsNone(self.cache.get('user:1'))
+
+    def test_token_not_returned_after_ttl(self):
+        self.cache.put('user:1', 'token', time.time() + 3600)
+        with mock.patch('googleoauth2django.token_cache.time.time',
+                        return_value=time.time() + token_cache.DEFAULT_TTL):
+            self.assertIsNone(self.cache.get('user:1'))
+
+    def test_delete(self):
+        self.cache.put('user:1', 'token', time.time() + 3600)
+        self.cache.delete('user:2')
+        self.assertIsNotNone(self.cache.get('user:1'))
+        self.cache.delete('user:1')
+        self.assertIsNone(self.cache.get('user:1'))
+
+    def test_token_too_long(self):
+        self.cache.put('user:1', 'token', time.time() + 3600)
+        self.assertFalse(self.cache.put(
+            'user:1', 'x' * token_cache.MAX_PAYLOAD, time.time() + 3600))
+        self.assertIsNone(self.cache.get('user:1'))
+
+    def test_slot_shared_by_keys(self):
+        cache = token_cache.SharedTokenCache(
+            os.path.join(self.directory, 'one'), 1)
+        self.addCleanup(cache.close)
+        cache.put('user:1', 'token1', time.time() + 3600)
+        cache.put('user:2', 'token2', time.time() + 3600)
+        self.assertIsNone(cache.get('user:1'))
+        self.assertEqual(cache.get('user:2')[0], 'token2')
+
+    def test_torn_read_is_a_miss(self):
+        self.cache.put('user:1', 'token', time.time() + 3600)
+        offset, _ = self.cache._slot('user:1')
+        token_cache._SEQUENCE.pack_into(self.cache._map, offset, 3)
+        self.assertIsNone(self.cache.get('user:1'))
+
+    def test_other_layout(self):
+        with self.assertRaises(ValueError):
+            token_cache.SharedTokenCache(self.path, 32)
+
+    def test_get_cache_shared(self):
+        self.addCleanup(token_cache.clear)
+        self.assertIs(token_cache.get_cache(self.path, 16),
+                      token_cache.get_cache(self.path, 16))
+
+
+class SharedTokenStorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'tokens')
+        self.cache = token_cache.SharedTokenCache(self.path, 16)
+        self.addCleanup(self.cache.close)
+        self.log_path = os.path.join(self.directory, 'refreshes')
+        self.backend = MemoryStorage()
+        self.storage = token_cache.SharedTokenStorage(
+            self.backend, self.cache, 'user:1', 'client-id')
+
+    def _refreshes(self):
+        if not os.path.exists(self.log_path):
+            return 0
+        with open(self.log_path) as log:
+            return len(log.readlines())
+
+    def test_get_reads_backend_once(self):
+        credentials = FakeCredentials('token', 3600)
+        self.backend.put(credentials)
+        self.assertIs(self.storage.get(), credentials)
+
+        with mock.patch.object(self.backend, 'locked_get') as backend_get:
+            cached = self.storage.get()
+        backend_get.assert_not_called()
+        self.assertIsInstance(cached, token_cache.SharedCredentials)
+        self.assertEqual(cached.token, 'token')
+        self.assertEqual(cached.scopes, ['email'])
+        self.assertEqual(cached._client_id, 'client-id')
+        self.assertTrue(cached.valid)
+
+    def test_id_token_loaded_from_backend(self):
+        self.backend.put(FakeCredentials('token', 3600, id_token='id'))
+        self.storage.get()
+        cached = self.storage.get()
+        self.assertIsInstance(cached, token_cache.SharedCredentials)
+        self.assertIsNone(cached.refresh_token)
+        with mock.patch.object(self.backend, 'locked_get',
+                               wraps=self.backend.locked_get) as backend_get:
+            self.assertEqual(cached.id_token, 'id')
+            self.assertEqual(cached.id_token, 'id')
+        backend_get.assert_called_once_with()
+
+    def test_deleted_elsewhere_read_again_after_ttl(self):
+        self.storage.put(FakeCredentials('token', 3600))
+        # Deleted from the backend, not through this storage.
+        self.backend.credentials = None
+        self.assertIsInstance(self.storage.get(),
+                              token_cache.SharedCredentials)
+        with mock.patch('googleoauth2django.token_cache.time.time',
+                        return_value=time.time() + token_cache.DEFAULT_TTL):
+            self.assertIsNone(self.storage.get())
+
+    def test_invalid_credentials_not_cached(self):
+        self.backend.put(FakeCredentials('token', -10))
+        self.storage.get()
+        self.assertIsNone(self.cache.get('user:1'))
+
+    def test_put_and_delete(self):
+        credentials = FakeCredentials('token', 3600)
+        self.storage.put(credentials)
+        self.assertIs(self.backend.get(), credentials)
+        self.assertEqual(self.cache.get('user:1')[0], 'token')
+
+        self.storage.delete()
+        self.assertIsNone(self.backend.get())
+        self.assertIsNone(self.cache.get('user:1'))
+
+    def test_cached_credentials_not_written_to_backend(self):
+        self.storage.put(FakeCredentials('token', 3600))
+        cached = self.storage.get()
+        with mock.patch.object(self.backend, 'locked_put') as backend_put:
+            self.storage.put(cached)
+        backend_put.assert_not_called()
+
+    def test_refresh(self):
+        self.backend.put(FakeCredentials('stale', -10,
+                                         log_path=self.log_path))
+        cached = token_cache.SharedCredentials(
+            self.storage, 'stale', time.time() - 10, ['email'])
+        cached.refresh(None)
+        self.assertEqual(cached.token, 'refreshed1')
+        self.assertTrue(cached.valid)
+        self.assertEqual(self.backend.get().token, cached.token)
+        self.assertEqual(self.cache.get('user:1')[0], cached.token)
+
+        # The token was refreshed since it was read.
+        self.assertEqual(self.storage.refresh(None, 'stale')[0],
+                         cached.token)
+        self.assertEqual(self._refreshes(), 1)
+
+    def test_one_refresh_per_host(self):
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+        processes = [context.Process(target=_refresh_in_child,
+                                     args=(self.path, self.log_path, queue))
+                     for _ in range(4)]
+        for process in processes:
+            process.start()
+        tokens = [queue.get(timeout=10) for _ in processes]
+        for process in processes:
+            process.join()
+        self.assertEqual(self._refreshes(), 1)
+        self.assertEqual(len(set(tokens)), 1)
+
+
+class MakeStorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.addCleanup(token_cache.clear)
+        oauth2_settings = mock.Mock(
+            storage_model=None, session_compress=False,
+            client_id='client-id', tenants=None, shared_token_cache={
+                'path': os.path.join(self.directory, 'tokens'),
+                'slots': 16})
+        patcher = mock.patch('googleoauth2django.get_oauth2_settings',
+                             return_value=oauth2_settings)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_session_storage_wrapped(self):
+        request = mock.Mock(session=mock.MagicMock(session_key='abc'))
+        django_storage = googleoauth2django._make_storage(request)
+        self.assertIsInstance(django_storage,
+                              token_cache.SharedTokenStorage)
+        self.assertEqual(django_storage.key, 'session:abc')
+        self.assertIsInstance(django_storage.backend, DictionaryStorage)
+
+    def test_new_session_not_wrapped(self):
+        request = mock.Mock(session=mock.MagicMock(session_key=None))
+        self.assertIsInstance(googleoauth2django._make_storage(request),
+                              DictionaryStorage)
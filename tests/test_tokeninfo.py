@@ -0,0 +1,89 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the cached tokeninfo lookups."""
+
+import unittest
+
+from django.core.cache import cache
+import mock
+
+import googleoauth2django
+from googleoauth2django import scope_set
+from googleoauth2django import tokeninfo
+
+TOKEN_INFO = {
+    'scope': 'https://www.googleapis.com/auth/userinfo.email openid '
+             'https://www.googleapis.com/auth/drive',
+    'expires_in': '3599',
+}
+
+
+class TokenInfoTest(unittest.TestCase):
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('googleoauth2django.transport.get_session')
+        self.session = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.session.get.return_value = mock.Mock(
+            status_code=200, json=mock.Mock(return_value=TOKEN_INFO))
+
+    def test_cached_per_token(self):
+        self.assertEqual(tokeninfo.get_token_info('token'), TOKEN_INFO)
+        self.assertEqual(tokeninfo.get_token_info('token'), TOKEN_INFO)
+        self.session.get.assert_called_once_with(
+            googleoauth2django.GOOGLE_TOKEN_INFO_URI,
+            params={'access_token': 'token'}, timeout=tokeninfo.TIMEOUT)
+
+        tokeninfo.get_token_info('other-token')
+        self.assertEqual(self.session.get.call_count, 2)
+
+    def test_expired_not_cached(self):
+        self.session.get.return_value.json.return_value = dict(
+            TOKEN_INFO, expires_in='0')
+        tokeninfo.get_token_info('token')
+        tokeninfo.get_token_info('token')
+        self.assertEqual(self.session.get.call_count, 2)
+
+    def test_invalid_token(self):
+        self.session.get.return_value = mock.Mock(status_code=400)
+        self.assertIsNone(tokeninfo.granted_scopes('token'))
+        self.assertFalse(tokeninfo.has_scopes('token', ['email']))
+        self.assertEqual(self.session.get.call_count, 1)
+
+    def test_has_scopes(self):
+        self.assertTrue(tokeninfo.has_scopes(
+            'token', ['email', 'https://www.googleapis.com/auth/drive']))
+        self.assertFalse(tokeninfo.has_scopes(
+            'token', ['email', 'https://www.googleapis.com/auth/calendar']))
+
+    @mock.patch('googleoauth2django.get_oauth2_settings')
+    @mock.patch('googleoauth2django._credentials_from_request')
+    def test_has_credentials_verifies_scopes(self, credentials_from_request,
+                                             get_oauth2_settings):
+        get_oauth2_settings.return_value = mock.Mock(
+            scopes=('openid',), scope_mask=scope_set.mask(['openid']),
+            verify_scopes=True, tenants=None)
+        credentials = credentials_from_request.return_value
+        credentials.token = 'token'
+        credentials.scopes = ['openid', 'email', 'profile']
+        credentials.valid = True
+        request = mock.Mock()
+
+        self.assertTrue(googleoauth2django.UserOAuth2(
+            request, scopes=['email']).has_credentials())
+        self.assertFalse(googleoauth2django.UserOAuth2(
+            request, scopes=['profile']).has_credentials())
+        self.assertEqual(self.session.get.call_count, 1)
@@ -157,12 +157,38 @@ class _Credentials(object):
     # https://code.djangoproject.com/ticket/25493
     def __init__(self):
         self.valid = True
-        self.scopes = set()
+        self.scopes = set(django.conf.settings.GOOGLE_OAUTH2_SCOPES)
 
     def has_scopes(self, _):
         return True
 
 
+class CallbackDatabasesTest(TestWithDjangoEnvironment):
+
+    @mock.patch('googleoauth2django.views.router.db_for_write',
+                return_value='users')
+    def test_callback_databases(self, db_for_write):
+        oauth2_settings = mock.Mock(storage_model=None, login=False)
+        self.assertEqual(views._callback_databases(oauth2_settings),
+                         ['users'])
+
+        oauth2_settings.storage_model = 'tests.models.CredentialsModel'
+        oauth2_settings.storage_model_using = 'credentials'
+        self.assertEqual(views._callback_databases(oauth2_settings),
+                         ['credentials'])
+        oauth2_settings.login = True
+        self.assertEqual(views._callback_databases(oauth2_settings),
+                         ['credentials', 'users'])
+
+        oauth2_settings.storage_model_using = None
+        db_for_write.return_value = 'default'
+        with mock.patch('googleoauth2django.get_storage_model_class',
+                        return_value=tests_models.CredentialsModel):
+            self.assertEqual(views._callback_databases(oauth2_settings),
+                             ['default'])
+        db_for_write.assert_called_with(django_models.User)
+
+
 class Oauth2CallbackTest(TestWithDjangoEnvironment):
 
     def setUp(self):
@@ -233,8 +259,50 @@ class Oauth2CallbackTest(TestWithDjangoEnvironment):
             response.status_code, django.http.HttpResponseRedirect.status_code)
         self.assertEqual(response['Location'], self.RETURN_URL)
 
-    @mock.patch('googleoauth2django.views.jsonpickle')
-    def test_callback_handles_bad_flow_exchange(self, jsonpickle_mock):
+    @mock.patch('googleoauth2django.views.get_storage')
+    @mock.patch('googleoauth2django.views.bearer.verify_id_token')
+    @mock.patch('googleoauth2django.views._get_flow_for_token')
+    def test_callback_stores_identity(self, flow_from_session_mock,
+                                      verify_id_token_mock,
+                                      get_storage_mock):
+        request = self.factory.get('oauth2/oauth2callback', data={
+            'state': json.dumps(self.fake_state),
+            'code': 123
+        })
+        self.session['google_oauth2_csrf_token'] = self.CSRF_TOKEN
+        self.session['google_oauth2_flow_{0}'.format(self.CSRF_TOKEN)] = (
+            object())
+        flow = flow_from_session_mock.return_value
+        flow.credentials = Credentials(
+            token='access_tokenz', id_token='header.payload.signature')
+        verify_id_token_mock.return_value = {
+            'sub': '1234', 'email': 'bill@example.com', 'aud': 'client_idz'}
+        django_storage = get_storage_mock.return_value
+        django_storage.extra_fields = {}
+
+        request.session = self.session
+        request.user = self.user
+        tenant = mock.Mock(client_id='client_idz')
+        with mock.patch('googleoauth2django.views.get_oauth2_settings') as (
+                get_oauth2_settings), \
+                mock.patch('googleoauth2django.get_tenant',
+                           return_value=tenant):
+            oauth2_settings = get_oauth2_settings.return_value
+            oauth2_settings.storage_model = None
+            oauth2_settings.login = False
+            oauth2_settings.storage_model_subject_property = 'google_sub'
+            response = views.oauth2_callback(request)
+
+        self.assertIsInstance(response, http.HttpResponseRedirect)
+        self.assertEqual(self.session['google_oauth2_claims'],
+                         {'sub': '1234', 'email': 'bill@example.com'})
+        self.assertEqual(django_storage.extra_fields, {'google_sub': '1234'})
+        verify_id_token_mock.assert_called_once_with(
+            'header.payload.signature', ('client_idz',))
+        django_storage.put.assert_called_once_with(flow.credentials)
+
+    @mock.patch('jsonpickle.decode')
+    def test_callback_handles_bad_flow_exchange(self, decode_mock):
         request = self.factory.get('oauth2/oauth2callback', data={
             "state": json.dumps(self.fake_state),
             "code": 123
@@ -266,12 +334,12 @@ class Oauth2CallbackTest(TestWithDjangoEnvironment):
             raise oauth_errors.OAuth2Error('test')  # pragma: NO COVER
 
         flow.fetch_token = local_throws
-        jsonpickle_mock.decode.return_value = flow_config
+        decode_mock.return_value = flow_config
 
         request.session = self.session
         response = views.oauth2_callback(request)
         self.assertIsInstance(response, http.HttpResponseBadRequest)
-        jsonpickle_mock.decode.assert_called_once_with(pickled_flow)
+        decode_mock.assert_called_once_with(pickled_flow)
 
     def test_error_returns_bad_request(self):
         request = self.factory.get('oauth2/oauth2callback', data={
@@ -0,0 +1,78 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the startup warm-up and the shared transport."""
+
+import sys
+import unittest
+
+import mock
+
+import googleoauth2django
+from googleoauth2django import transport
+from googleoauth2django import warmup
+
+
+class WarmupTest(unittest.TestCase):
+
+    def test_run_selected_steps(self):
+        report = warmup.run(['settings', 'imports', 'urls'])
+        self.assertEqual(list(report), ['settings', 'imports', 'urls'])
+        self.assertIn('google_auth_oauthlib.flow', sys.modules)
+        self.assertIsNotNone(googleoauth2django._oauth2_settings)
+
+    @mock.patch('googleoauth2django.transport.preconnect')
+    def test_connections(self, preconnect):
+        warmup.run(['connections'])
+        preconnect.assert_called_once_with(
+            googleoauth2django.GOOGLE_TOKEN_URI)
+
+    @mock.patch('googleoauth2django.transport.preconnect')
+    def test_failing_step_is_logged(self, preconnect):
+        preconnect.side_effect = IOError('unreachable')
+        with self.assertLogs('googleoauth2django.warmup', 'WARNING'):
+            report = warmup.run(['connections'])
+        self.assertIn('connections', report)
+
+    def test_configure_disabled(self):
+        self.assertIsNone(warmup.configure(object()))
+
+    @mock.patch('googleoauth2django.warmup.run')
+    def test_configure(self, run):
+        warmup.configure(mock.Mock(GOOGLE_OAUTH2_WARMUP=True))
+        run.assert_called_once_with(None)
+        warmup.configure(mock.Mock(GOOGLE_OAUTH2_WARMUP=('urls',)))
+        run.assert_called_with(('urls',))
+
+
+class TransportTest(unittest.TestCase):
+
+    def test_shared_pool(self):
+        session = transport.get_session()
+        other = transport.get_session()
+        self.assertIsNot(other, session)
+        self.assertIsNot(other.cookies, session.cookies)
+        self.assertIs(transport.get_adapter(), session.get_adapter('https://'))
+        self.assertIs(other.get_adapter('http://'), transport.get_adapter())
+
+    def test_pool_reset_after_fork(self):
+        adapter = transport.get_adapter()
+        transport._reset_after_fork()
+        self.assertIsNot(transport.get_adapter(), adapter)
+
+    @mock.patch('requests.Session.head')
+    def test_preconnect(self, head):
+        transport.preconnect('https://example.com/token')
+        head.assert_called_once_with('https://example.com/token', timeout=5,
+                                     allow_redirects=False)